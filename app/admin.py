@@ -1,10 +1,12 @@
 from django.contrib import admin
 from django import forms
+from django.utils import timezone
 from .models import (
     Category, GoldCategory, GoldSubCategory,
     SilverCategory, SilverSubCategory, ImitationCategory, ImitationSubCategory,
     GoldProduct, SilverProduct, ImitationProduct,
-    User, CountryMultiplier, Wishlist, Cart, Order, Payment, Review, CarouselSlider, EnhancedWishlist
+    User, CountryMultiplier, Wishlist, Cart, Order, Payment, Review, CarouselSlider, EnhancedWishlist,
+    OrderLine, StockReservation, OutboundEmail, Task,
 )
 
 class ColorWidget(forms.TextInput):
@@ -180,14 +182,41 @@ class CartAdmin(admin.ModelAdmin):
         return str(obj.product)
     get_product.short_description = 'Product'
 
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    extra = 0
+    fields = ('product_name', 'content_type', 'object_id', 'unit_price', 'quantity', 'line_total')
+    readonly_fields = fields
+    can_delete = False
+    def has_add_permission(self, request, obj=None):
+        return False
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('user', 'get_product', 'quantity', 'status', 'ordered_at')
+    list_display = ('id', 'user', 'get_product', 'item_count', 'total_amount', 'status', 'ordered_at')
     list_filter = ('status', 'ordered_at', 'content_type')
     search_fields = ('user__first_name', 'user__last_name')
+    readonly_fields = ('item_count', 'subtotal', 'discount_amount', 'total_amount')
+    inlines = [OrderLineInline]
+    def get_product(self, obj):
+        # Orders placed at checkout keep their products in OrderLine
+        return str(obj.product) if obj.product else f"{obj.item_count} item(s)"
+    get_product.short_description = 'Product'
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('user', 'get_product', 'quantity', 'created_at', 'expires_at')
+    list_filter = ('content_type',)
     def get_product(self, obj):
         return str(obj.product)
     get_product.short_description = 'Product'
+    # Holds are owned by app/inventory.py; adding or deleting rows here would skip the stock update
+    def has_add_permission(self, request):
+        return False
+    def has_change_permission(self, request, obj=None):
+        return False
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
@@ -245,3 +274,35 @@ class CarouselSliderAdmin(admin.ModelAdmin):
             'all': ('admin/css/color_picker.css',)
         }
         js = ('admin/js/color_picker.js',)
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'kind', 'subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status', 'kind', 'created_at')
+    search_fields = ('to_email', 'subject')
+    readonly_fields = ('kind', 'to_email', 'subject', 'body', 'attempts', 'last_error', 'created_at', 'sent_at')
+    actions = ['retry_now']
+    def has_add_permission(self, request):
+        return False
+    @admin.action(description='Retry selected emails now')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='Sent').update(status='Pending', attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f'{updated} email(s) queued for retry.')
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_at', 'worker', 'wait_ms', 'duration_ms', 'finished_at')
+    list_filter = ('status', 'name')
+    readonly_fields = (
+        'name', 'args', 'kwargs', 'unique_key', 'attempts', 'locked_until', 'worker', 'last_error',
+        'created_at', 'started_at', 'finished_at', 'wait_ms', 'duration_ms',
+    )
+    actions = ['run_now']
+    def has_add_permission(self, request):
+        return False
+    @admin.action(description='Run selected tasks now')
+    def run_now(self, request, queryset):
+        updated = queryset.filter(status__in=['Pending', 'Failed']).update(
+            status='Pending', attempts=0, run_at=timezone.now(),
+        )
+        self.message_user(request, f'{updated} task(s) queued to run now.')
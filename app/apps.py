@@ -8,3 +8,4 @@ class AppConfigCustom(AppConfig):
         admin.site.site_header = "JiyashCreation"
         admin.site.site_title = "Jiyash Admin"
         admin.site.index_title = "Admin Panel"
+        from . import signals  # noqa: F401  (registers cache invalidation receivers)
@@ -0,0 +1,543 @@
+"""
+Async versions of the cart, wishlist, profile and storefront state APIs.
+
+They use the async ORM and an async JWT lookup, so under an ASGI server a
+request waiting on the database doesn't hold a worker thread. urls.py routes
+the API paths here when settings.ASYNC_API_VIEWS is on (see
+jiyash/settings_asgi.py). Responses match the sync views in app/views.py.
+"""
+import asyncio
+import json
+import logging
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Sum
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from .cache import TAG_PRODUCTS
+from .cards import aload_cards
+from .events import get_broker, stock_key, user_key
+from .models import Cart, User, Wishlist
+from .renderers import api_response, money
+from .views import (
+    CART_ITEM_SCHEMA, PROFILE_SCHEMA, WISHLIST_ITEM_SCHEMA, CartBatchError, CartService, ProductService,
+    WishlistService, cart_batch_error, guest_add_to_cart, jwt_user_id, parse_cart_batch, user_conditional,
+)
+
+logger = logging.getLogger(__name__)
+
+EVENT_HEARTBEAT = 15
+# Streams end after this long; EventSource reconnects, re-checking the JWT
+EVENT_STREAM_MAX_AGE = 30 * 60
+EVENT_STREAM_MAX_PRODUCTS = 20
+
+_content_type_ids = None
+
+
+async def product_content_type_ids():
+    """{product_type: ContentType id}, looked up once per process"""
+    global _content_type_ids
+    if _content_type_ids is None:
+        _content_type_ids = await sync_to_async(lambda: {
+            product_type: ContentType.objects.get_for_model(model).id
+            for product_type, model in ProductService.PRODUCT_TYPE_MAP.items()
+        })()
+    return _content_type_ids
+
+
+async def _product_types_by_content_type():
+    return {ct_id: product_type for product_type, ct_id in (await product_content_type_ids()).items()}
+
+
+async def aget_jwt_user(request):
+    """Async version of views.get_jwt_user"""
+    user_id = jwt_user_id(request)
+    if user_id is None:
+        return None
+    return await User.objects.filter(pk=user_id).afirst()
+
+
+def ajwt_login_required(view_func):
+    @wraps(view_func)
+    async def _wrapped(request, *args, **kwargs):
+        user = await aget_jwt_user(request)
+        if not user:
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return JsonResponse({'success': False, 'message': 'Authentication required'}, status=401)
+            return redirect('app:login')
+        request.custom_user = user
+        return await view_func(request, *args, **kwargs)
+    return _wrapped
+
+
+async def _resolve_product(product_id, product_type=None):
+    """Return (product_type, product) like CartService.add_to_cart's lookup, or (None, None)"""
+    if product_type in ProductService.PRODUCT_TYPE_MAP:
+        candidates = [product_type]
+    else:
+        candidates = list(ProductService.PRODUCT_TYPE_MAP)
+    for candidate in candidates:
+        product = await ProductService.PRODUCT_TYPE_MAP[candidate].objects.filter(id=product_id).afirst()
+        if product:
+            return candidate, product
+    return None, None
+
+
+async def _cart_count(user_profile):
+    result = await Cart.objects.filter(user=user_profile).aaggregate(total=Sum('quantity'))
+    return result['total'] or 0
+
+
+async def _cart_total(user_profile):
+    types = await _product_types_by_content_type()
+    rows = [
+        (types.get(ct_id), object_id, quantity)
+        async for ct_id, object_id, quantity in
+        Cart.objects.filter(user=user_profile).values_list('content_type_id', 'object_id', 'quantity')
+    ]
+    cards = await aload_cards([(product_type, object_id) for product_type, object_id, _ in rows], include_inactive=True)
+    total = 0
+    for product_type, object_id, quantity in rows:
+        card = cards.get((product_type, object_id))
+        if card:
+            total += (card.selling_price or 0) * quantity
+    return total
+
+
+def _as_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _quantity(request):
+    if request.content_type == 'application/json':
+        return int(json.loads(request.body.decode('utf-8')).get('quantity', 1))
+    return int(request.POST.get('quantity', 1))
+
+
+async def _cart_summary(user_profile):
+    """Async version of CartService.get_cart_summary"""
+    types = await _product_types_by_content_type()
+    cart_items = [
+        row async for row in
+        Cart.objects.filter(user=user_profile).order_by('-added_at')
+        .values_list('id', 'content_type_id', 'object_id', 'quantity')
+    ]
+    cards = await aload_cards(
+        [(types.get(ct_id), object_id) for _, ct_id, object_id, _ in cart_items],
+        include_inactive=True,
+    )
+    items = []
+    total = 0
+    for item_id, ct_id, object_id, quantity in cart_items:
+        product = cards.get((types.get(ct_id), object_id))
+        if not product:
+            continue
+        subtotal = (product.selling_price or 0) * quantity
+        total += subtotal
+        items.append((item_id, product, quantity, subtotal))
+    return items, total, sum(quantity for _, _, _, quantity in cart_items)
+
+
+@ajwt_login_required
+@user_conditional('cart_version', tags=(TAG_PRODUCTS,))
+async def cart_api(request):
+    user_profile = request.custom_user
+    try:
+        items, total, cart_count = await _cart_summary(user_profile)
+    except Exception as e:
+        logger.error(f"cart_api error: {str(e)}")
+        items, total, cart_count = [], 0, await _cart_count(user_profile)
+    return api_response(request, {
+        'success': True,
+        'items': CART_ITEM_SCHEMA.many(items),
+        'total': money(total),
+        'count': cart_count,
+        'cart_count': cart_count
+    })
+
+
+@ajwt_login_required
+@require_POST
+@csrf_exempt
+async def cart_batch_api(request):
+    """Apply several cart operations in one transaction and return the resulting cart once"""
+    user_profile = request.custom_user
+    try:
+        results = await sync_to_async(CartService.apply_batch)(user_profile, parse_cart_batch(request))
+    except CartBatchError as e:
+        return cart_batch_error(e)
+    except Exception as e:
+        logger.error(f"Error applying cart batch: {str(e)}")
+        return JsonResponse({'success': False, 'message': 'Error updating cart'}, status=500)
+    items, total, cart_count = await _cart_summary(user_profile)
+    return api_response(request, {
+        'success': True,
+        'results': results,
+        'items': CART_ITEM_SCHEMA.many(items),
+        'total': money(total),
+        'count': cart_count,
+        'cart_count': cart_count,
+        'wishlist_count': await Wishlist.objects.filter(user=user_profile).acount(),
+    })
+
+
+@require_POST
+@csrf_exempt
+async def add_to_cart(request, product_id, product_type=None):
+    try:
+        user_profile = await aget_jwt_user(request)
+        try:
+            quantity = _quantity(request)
+        except (ValueError, TypeError):
+            quantity = 1
+        if quantity < 1:
+            return JsonResponse({'success': False, 'message': 'Invalid quantity'}, status=400)
+
+        product_type, product = await _resolve_product(product_id, product_type)
+        if not product:
+            raise Http404("Product not found")
+        if not user_profile:
+            return guest_add_to_cart(request, product_type, product, quantity)
+        ct_id = (await product_content_type_ids())[product_type]
+        cart_item, created = await sync_to_async(CartService.upsert_item)(user_profile, ct_id, product.id, quantity)
+
+        cart_count = await _cart_count(user_profile)
+        cart_total = await _cart_total(user_profile)
+        logger.info(f"Add to cart - User: {user_profile.id}, Product: {product_id}, Created: {created}, Cart Count: {cart_count}")
+
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({
+                'success': True,
+                'message': f'{product.name} {"added to" if created else "updated in"} cart!',
+                'cart_count': cart_count,
+                'cart_total': str(cart_total),
+                'item_id': cart_item.id
+            })
+        return redirect(request.META.get('HTTP_REFERER', 'app:cart'))
+    except Http404:
+        return JsonResponse({'success': False, 'message': 'Product not found'}, status=404)
+    except Exception as e:
+        logger.error(f"Error adding to cart: {str(e)}")
+        return JsonResponse({'success': False, 'message': 'Error adding to cart'}, status=500)
+
+
+@ajwt_login_required
+@require_POST
+@csrf_exempt
+async def update_cart(request, item_id):
+    try:
+        user_profile = request.custom_user
+        quantity = _quantity(request)
+
+        cart_item = await Cart.objects.filter(id=item_id, user=user_profile).afirst()
+        if cart_item is None:
+            raise Http404("Cart item not found")
+        if quantity <= 0:
+            await cart_item.adelete()
+            cart_item = None
+        else:
+            cart_item.quantity = quantity
+            await cart_item.asave()
+        cart_count = await _cart_count(user_profile)
+        cart_total = await _cart_total(user_profile)
+
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            if cart_item is None:
+                return JsonResponse({
+                    'success': True,
+                    'message': 'Item removed from cart',
+                    'cart_count': cart_count,
+                    'cart_total': str(cart_total),
+                    'removed': True
+                })
+            product_type = (await _product_types_by_content_type()).get(cart_item.content_type_id)
+            cards = await aload_cards([(product_type, cart_item.object_id)], include_inactive=True)
+            product = cards.get((product_type, cart_item.object_id))
+            subtotal = ((product.selling_price if product else 0) or 0) * cart_item.quantity
+            return JsonResponse({
+                'success': True,
+                'message': 'Cart updated successfully',
+                'cart_count': cart_count,
+                'cart_total': str(cart_total),
+                'item_subtotal': str(subtotal),
+                'quantity': cart_item.quantity
+            })
+        return redirect('app:cart')
+    except Http404:
+        return JsonResponse({'success': False, 'message': 'Cart item not found'}, status=404)
+    except Exception as e:
+        logger.error(f"Error updating cart: {str(e)}")
+        return JsonResponse({'success': False, 'message': 'Error updating cart'}, status=500)
+
+
+@ajwt_login_required
+@require_POST
+@csrf_exempt
+async def remove_from_cart(request, item_id):
+    try:
+        user_profile = request.custom_user
+        removed_count, _ = await Cart.objects.filter(id=item_id, user=user_profile).adelete()
+        removed = removed_count > 0
+        cart_count = await _cart_count(user_profile)
+        cart_total = await _cart_total(user_profile)
+
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({
+                'success': True,
+                'message': 'Item removed from cart' if removed else 'Item not found',
+                'cart_count': cart_count,
+                'cart_total': str(cart_total),
+                'removed': removed
+            })
+        return redirect('app:cart')
+    except Exception as e:
+        logger.error(f"Error removing from cart: {str(e)}")
+        return JsonResponse({'success': False, 'message': 'Error removing from cart'}, status=500)
+
+
+@ajwt_login_required
+@user_conditional('wishlist_version', tags=(TAG_PRODUCTS,))
+async def wishlist_api(request):
+    user_profile = request.custom_user
+    items = []
+    try:
+        types = await _product_types_by_content_type()
+        keys = [
+            (types.get(ct_id), object_id) async for ct_id, object_id in
+            Wishlist.objects.filter(user=user_profile).order_by('-added_at')
+            .values_list('content_type_id', 'object_id')[:100]
+        ]
+        cards = await aload_cards(keys, include_inactive=True)
+        items = [cards[key] for key in keys if key in cards]
+    except Exception as e:
+        logger.error(f"wishlist_api error: {str(e)}")
+    return api_response(request, {'success': True, 'items': WISHLIST_ITEM_SCHEMA.many(items)})
+
+
+async def _wishlist_product(product_type, pk):
+    """Return (content type id, product) for a wishlist add/remove, or raise Http404"""
+    model = ProductService.PRODUCT_TYPE_MAP.get(product_type.lower())
+    product = await model.objects.filter(pk=pk).afirst() if model else None
+    if not product:
+        logger.error(f"Product not found: product_type={product_type}, pk={pk}")
+        raise Http404("Product not found")
+    return (await product_content_type_ids())[product_type.lower()], product
+
+
+@ajwt_login_required
+@require_POST
+@csrf_exempt
+async def add_to_wishlist(request, product_type, pk):
+    try:
+        user_profile = request.custom_user
+        _, product = await _wishlist_product(product_type, pk)
+        # ON CONFLICT DO NOTHING: concurrent adds of the same product can't hit the unique index
+        created, _ = await sync_to_async(WishlistService.set_state)(
+            user_profile, product_type.lower(), product.id, True
+        )
+        logger.info(f"Wishlist operation: user={user_profile.id}, product={product_type}:{product.id}, created={created}")
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({
+                'success': True,
+                'in_wishlist': True,
+                'created': created,
+                'product_id': product.id,
+                'canonical_product_id': product.id,
+                'product_type': product_type,
+                'message': f'{product.name} {"added to" if created else "already in"} wishlist!',
+                'action': 'add'
+            })
+        return redirect(request.META.get('HTTP_REFERER', 'app:wishlist'))
+    except Http404:
+        return JsonResponse({'success': False, 'message': 'Product not found'}, status=404)
+    except Exception as e:
+        logger.error(f"Error adding to wishlist: {str(e)}")
+        return JsonResponse({'success': False, 'message': 'Error adding to wishlist'}, status=500)
+
+
+@ajwt_login_required
+@require_POST
+@csrf_exempt
+async def remove_from_wishlist(request, product_type, pk):
+    try:
+        user_profile = request.custom_user
+        ct_id, product = await _wishlist_product(product_type, pk)
+        removed_count, _ = await Wishlist.objects.filter(
+            user=user_profile, content_type_id=ct_id, object_id=product.id
+        ).adelete()
+        removed = removed_count > 0
+        logger.info(f"Wishlist removal: user={user_profile.id}, product={product_type}:{product.id}, removed={removed}")
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({
+                'success': True,
+                'in_wishlist': False,
+                'product_id': product.id,
+                'product_type': product_type,
+                'removed': removed,
+                'message': f'{product.name} {"removed from" if removed else "not in"} wishlist!',
+                'action': 'remove'
+            })
+        return redirect(request.META.get('HTTP_REFERER', 'app:wishlist'))
+    except Exception as e:
+        logger.error(f"Error removing from wishlist: {str(e)}")
+        return JsonResponse({'success': False, 'message': 'Error removing from wishlist'}, status=500)
+
+
+@ajwt_login_required
+@csrf_exempt
+async def set_wishlist_state(request, product_type, pk):
+    """Set a product's wishlist state: POST/PUT {"in_wishlist": true|false}. Safe to repeat."""
+    if request.method not in ('POST', 'PUT'):
+        return JsonResponse({'success': False, 'message': 'Method not allowed'}, status=405)
+    try:
+        in_wishlist = json.loads(request.body.decode('utf-8'))['in_wishlist']
+    except (ValueError, KeyError, TypeError):
+        in_wishlist = None
+    if not isinstance(in_wishlist, bool):
+        return JsonResponse({'success': False, 'message': 'in_wishlist must be true or false'}, status=400)
+    try:
+        changed, count = await sync_to_async(WishlistService.set_state)(request.custom_user, product_type, pk, in_wishlist)
+    except Http404:
+        return JsonResponse({'success': False, 'message': 'Product not found'}, status=404)
+    except Exception as e:
+        logger.error(f"Error setting wishlist state: {str(e)}")
+        return JsonResponse({'success': False, 'message': 'Error updating wishlist'}, status=500)
+    return JsonResponse({
+        'success': True,
+        'in_wishlist': in_wishlist,
+        'changed': changed,
+        'product_id': pk,
+        'product_type': product_type,
+        'wishlist_count': count,
+    })
+
+
+@csrf_exempt
+async def wishlist_status_api(request):
+    """API endpoint to check wishlist status for multiple products"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Method not allowed'}, status=405)
+
+    try:
+        product_ids = json.loads(request.body.decode('utf-8')).get('product_ids', [])
+    except Exception:
+        return api_response(request, {'success': True, 'wishlist_status': {}})
+
+    user_profile = await aget_jwt_user(request)
+    if not user_profile:
+        return api_response(request, {'success': True, 'wishlist_status': {str(pid): False for pid in product_ids}})
+
+    try:
+        if not product_ids:
+            return api_response(request, {'success': True, 'wishlist_status': {}})
+        content_type_ids = await product_content_type_ids()
+        wishlist_keys = {
+            key async for key in
+            Wishlist.objects.filter(user=user_profile).values_list('content_type_id', 'object_id')
+        }
+        # An id resolves to the first product type that has it, as _resolve_product_by_id does
+        remaining = {_as_id(pid) for pid in product_ids} - {None}
+        resolved = {}
+        for product_type, model in ProductService.PRODUCT_TYPE_MAP.items():
+            if not remaining:
+                break
+            found = {pk async for pk in model.objects.filter(id__in=remaining).values_list('id', flat=True)}
+            for pk in found:
+                resolved[pk] = (content_type_ids[product_type], pk)
+            remaining -= found
+
+        wishlist_status = {
+            str(product_id): resolved.get(_as_id(product_id)) in wishlist_keys for product_id in product_ids
+        }
+        logger.info(f"Wishlist status check for user {user_profile.id}: {len(product_ids)} products")
+        return api_response(request, {'success': True, 'wishlist_status': wishlist_status})
+    except Exception as e:
+        logger.error(f"wishlist_status_api error: {str(e)}")
+        return JsonResponse({'success': False, 'message': 'Error checking wishlist status'}, status=500)
+
+
+@ajwt_login_required
+@user_conditional('profile_version', 'wishlist_version')
+async def profile_api(request):
+    user_profile = request.custom_user
+    user_profile.wishlist_count = await Wishlist.objects.filter(user=user_profile).acount()
+    return api_response(request, {'success': True, 'user': PROFILE_SCHEMA.one(user_profile)})
+
+
+@ajwt_login_required
+@user_conditional('cart_version', 'wishlist_version')
+async def storefront_state_api(request):
+    """Personalized bits punched into cached storefront pages (cart badge, wishlist count)"""
+    user_profile = request.custom_user
+    return api_response(request, {
+        'success': True,
+        'cart_count': await _cart_count(user_profile),
+        'wishlist_count': await Wishlist.objects.filter(user=user_profile).acount(),
+    })
+
+
+def _sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def _stream_products(value):
+    """Parse ?products=gold:49,silver:3 into [(product_type, id), ...]"""
+    products = []
+    for item in value.split(',')[:EVENT_STREAM_MAX_PRODUCTS]:
+        product_type, _, pk = item.partition(':')
+        if product_type in ProductService.PRODUCT_TYPE_MAP and pk.isdigit():
+            products.append((product_type, int(pk)))
+    return products
+
+
+async def events_stream(request):
+    """Server-Sent Events: the user's cart/wishlist counts and stock changes of the products they have open.
+    The first event carries the current counts, so the page doesn't need to fetch them separately.
+    """
+    user_profile = await aget_jwt_user(request)
+    if not user_profile:
+        return JsonResponse({'success': False, 'message': 'Authentication required'}, status=401)
+    products = _stream_products(request.GET.get('products', ''))
+    broker = await sync_to_async(get_broker)()
+    keys = [user_key(user_profile.id)] + [stock_key(product_type, pk) for product_type, pk in products]
+
+    async def stream():
+        queue = broker.subscribe(keys)
+        try:
+            yield 'retry: 5000\n\n'
+            last = {}
+            counts = {
+                'type': 'counts', 'key': keys[0],
+                'cart_count': await _cart_count(user_profile),
+                'wishlist_count': await Wishlist.objects.filter(user=user_profile).acount(),
+            }
+            last[counts['key']] = counts
+            yield _sse(counts)
+            deadline = time.monotonic() + EVENT_STREAM_MAX_AGE
+            while time.monotonic() < deadline:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENT_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                # Several writes in one request publish the same counts; send them once
+                if last.get(event['key']) == event:
+                    continue
+                last[event['key']] = event
+                yield _sse(event)
+        finally:
+            broker.unsubscribe(queue)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
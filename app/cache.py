@@ -0,0 +1,333 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 300)
+CARD_CACHE_TIMEOUT = getattr(settings, 'CARD_CACHE_TIMEOUT', 60 * 60)
+# How long a stale-while-revalidate value may be served after it goes stale
+SWR_STALE_TIMEOUT = getattr(settings, 'SWR_STALE_TIMEOUT', 60 * 60)
+SWR_LOCK_TIMEOUT = 30
+
+# Invalidation tags. Every cached artefact records the tags it was built from;
+# bumping a tag's version orphans all entries built against the old version.
+TAG_PRODUCTS = 'products'
+TAG_CATEGORIES = 'categories'
+TAG_CAROUSEL = 'carousel'
+TAG_PRICING = 'pricing'
+# Stock levels moved by reservations (app/inventory.py), which bypass model saves
+TAG_STOCK = 'stock'
+
+# Query parameters that never change page output (analytics / ad click ids).
+IGNORED_QUERY_PARAMS = {'fbclid', 'gclid', 'msclkid', '_'}
+
+
+def _tag_key(tag):
+    return f'tagver:{tag}'
+
+
+def get_tag_versions(tags):
+    """Return {tag: version} for the given tags, seeding missing versions"""
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = cache.get_many(list(keys))
+    versions = {}
+    missing = {}
+    for key, tag in keys.items():
+        if key in found:
+            versions[tag] = found[key]
+        else:
+            # Seed with a timestamp so an evicted tag never reuses an old version
+            missing[key] = versions[tag] = int(time.time() * 1000)
+    if missing:
+        cache.set_many(missing, None)
+    return versions
+
+
+def invalidate_tags(*tags, publish=True):
+    """Bump the version of each tag so dependent cache entries are skipped.
+
+    Versions are millisecond timestamps, so they also say when the tagged
+    data last changed (used for Last-Modified headers). The bump runs once
+    the current transaction commits and, unless publish is False, is sent
+    over the invalidation bus so other workers drop their copies too.
+    """
+    transaction.on_commit(lambda: _apply_invalidation(tags, publish))
+
+
+def _apply_invalidation(tags, publish):
+    now = int(time.time() * 1000)
+    current = cache.get_many([_tag_key(tag) for tag in tags])
+    cache.set_many({
+        _tag_key(tag): max(now, current.get(_tag_key(tag), 0) + 1) for tag in tags
+    }, None)
+    clear_local_memos(tags)
+    logger.info(f"Cache tags invalidated: {', '.join(tags)}")
+    if publish:
+        from .invalidation import publish_tags
+        publish_tags(tags)
+
+
+def apply_remote_invalidation(tags):
+    """Catch up with tags another worker invalidated (app/invalidation.py).
+
+    On a shared cache that worker already bumped the versions everyone
+    reads, so bumping them again would orphan entries other workers have
+    just rebuilt: only this process's L1 copies of the versions and its
+    memos are dropped. A per-process cache has its own versions to bump.
+    """
+    if getattr(cache, 'shared', False):
+        cache.delete_local([_tag_key(tag) for tag in tags])
+        clear_local_memos(tags)
+        logger.info(f"Cache tags invalidated by another worker: {', '.join(tags)}")
+    else:
+        invalidate_tags(*tags, publish=False)
+
+
+def tag_versions_modified_at(versions):
+    """Return the most recent tag bump as an aware datetime"""
+    if not versions:
+        return None
+    return datetime.fromtimestamp(max(versions.values()) / 1000, tz=dt_timezone.utc)
+
+
+def tagged_key(prefix, tags, *parts):
+    """Build a cache key that embeds the current versions of the given tags"""
+    versions = get_tag_versions(tags)
+    version_part = '.'.join(str(versions[tag]) for tag in sorted(tags))
+    raw = ':'.join(str(p) for p in parts)
+    digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    return f'{prefix}:{version_part}:{digest}'
+
+
+def get_price_tier(user):
+    """Return the pricing tier ('india' or 'others') used for a user.
+
+    Mirrors the lookup in views.get_country_multiplier: users without a
+    country fall back to the India multiplier.
+    """
+    country = (getattr(user, 'country', None) or '').lower().strip() if user else ''
+    if country and 'india' not in country:
+        return 'others'
+    return 'india'
+
+
+def normalize_query(query_dict):
+    """Return a canonical query string: sorted, empty values and tracking params dropped"""
+    items = []
+    for key in sorted(query_dict.keys()):
+        if key in IGNORED_QUERY_PARAMS or key.startswith('utm_'):
+            continue
+        for value in sorted(query_dict.getlist(key)):
+            if value != '':
+                items.append((key, value))
+    return urlencode(items)
+
+
+def request_has_credentials(request):
+    """True when the request carries a JWT (header or cookie) and may be personalized"""
+    auth = request.headers.get('Authorization', '')
+    return auth.startswith('Bearer ') or bool(request.COOKIES.get('jwt_token'))
+
+
+# Bumped when the layout of cached pages changes, so old entries are never read back
+PAGE_CACHE_FORMAT = 2
+
+
+def page_cache_key(request, tags, tier):
+    return tagged_key('page', tags, PAGE_CACHE_FORMAT, tier, request.path, normalize_query(request.GET))
+
+
+def card_cache_key(variant, product, price_tier, pricing_version, *extra):
+    """Key for one rendered product card.
+
+    Cards are keyed by (variant, type, id, updated_at, price tier), so saving a
+    product naturally retires its old fragments; the pricing tag version
+    covers multiplier edits, which change every tier's prices.
+    """
+    updated_at = getattr(product, 'updated_at', None)
+    parts = [
+        variant, getattr(product, 'product_type', ''), product.id,
+        updated_at.timestamp() if updated_at else '', price_tier, pricing_version,
+    ] + list(extra)
+    return 'card:' + ':'.join(str(p) for p in parts)
+
+
+# ---------------------------------------------------------------------------
+# In-process memos
+# ---------------------------------------------------------------------------
+
+# Process-local memo for small, hot lookups; cleared whenever a tag is
+# invalidated here or by another worker via the invalidation bus.
+PROCESS_MEMO_MAX_AGE = getattr(settings, 'PROCESS_MEMO_MAX_AGE', 5 * 60)
+
+_memos_by_tag = defaultdict(list)
+
+
+def process_memo(*tags):
+    """Memoize a function per process until one of the tags is invalidated.
+
+    Arguments must be hashable. Entries also expire after
+    PROCESS_MEMO_MAX_AGE seconds in case an invalidation is missed.
+    """
+    def decorator(func):
+        entries = {}
+        lock = threading.Lock()
+        generation = [0]
+
+        @wraps(func)
+        def wrapper(*args):
+            entry = entries.get(args)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+            with lock:
+                started_at = generation[0]
+            value = func(*args)
+            with lock:
+                # Don't keep a value computed across an invalidation
+                if generation[0] == started_at:
+                    entries[args] = (value, time.monotonic() + PROCESS_MEMO_MAX_AGE)
+            return value
+
+        def cache_clear():
+            with lock:
+                generation[0] += 1
+                entries.clear()
+
+        def prime(value, *args):
+            with lock:
+                entries[args] = (value, time.monotonic() + PROCESS_MEMO_MAX_AGE)
+
+        wrapper.cache_clear = cache_clear
+        wrapper.prime = prime
+        for tag in tags:
+            _memos_by_tag[tag].append(wrapper)
+        return wrapper
+    return decorator
+
+
+def clear_local_memos(tags):
+    for tag in tags:
+        for memo in _memos_by_tag.get(tag, ()):
+            memo.cache_clear()
+
+
+# ---------------------------------------------------------------------------
+# Stale-while-revalidate
+# ---------------------------------------------------------------------------
+
+_swr_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='swr')
+_swr_inflight = {}
+_swr_inflight_lock = threading.Lock()
+_swr_stats = defaultdict(lambda: {'hit': 0, 'stale': 0, 'miss': 0, 'recompute': 0, 'error': 0})
+_swr_stats_lock = threading.Lock()
+
+
+def _record(name, outcome):
+    with _swr_stats_lock:
+        _swr_stats[name][outcome] += 1
+
+
+def get_swr_stats():
+    """Return a copy of the per-key hit/stale/miss/recompute/error counters"""
+    with _swr_stats_lock:
+        return {name: dict(counts) for name, counts in _swr_stats.items()}
+
+
+def _single_flight(key, compute):
+    """Run compute() once per process per key; concurrent callers share the result"""
+    with _swr_inflight_lock:
+        future = _swr_inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _swr_inflight[key] = Future()
+    if not owner:
+        return future.result()
+    try:
+        value = compute()
+        future.set_result(value)
+        return value
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _swr_inflight_lock:
+            _swr_inflight.pop(key, None)
+
+
+def _store(key, name, compute, ttl, tags):
+    def build():
+        # Read tag versions first so an edit during the compute leaves the result stale
+        versions = get_tag_versions(tags) if tags else {}
+        value = compute()
+        cache.set(key, {'value': value, 'fresh_until': time.time() + ttl, 'versions': versions},
+                  ttl + SWR_STALE_TIMEOUT)
+        _record(name, 'recompute')
+        return value
+    return _single_flight(key, build)
+
+
+def _refresh_in_background(key, name, compute, ttl, tags):
+    lock_key = f'{key}:lock'
+    # cache.add is atomic on shared backends, so only one worker refreshes a key
+    if not cache.add(lock_key, 1, SWR_LOCK_TIMEOUT):
+        return
+
+    def task():
+        try:
+            _store(key, name, compute, ttl, tags)
+        except Exception as e:
+            _record(name, 'error')
+            logger.error(f"Background refresh of {name} failed: {e}")
+        finally:
+            cache.delete(lock_key)
+            close_old_connections()
+
+    _swr_executor.submit(task)
+
+
+def _swr_key(name, key_parts):
+    return 'swr:' + ':'.join([name] + [str(p) for p in key_parts])
+
+
+def swr_prime(name, value, ttl, tags=(), key_parts=()):
+    """Store a precomputed value for swr_get unless an entry already exists"""
+    versions = get_tag_versions(tags) if tags else {}
+    entry = {'value': value, 'fresh_until': time.time() + ttl, 'versions': versions}
+    return cache.add(_swr_key(name, key_parts), entry, ttl + SWR_STALE_TIMEOUT)
+
+
+def swr_get(name, compute, ttl, tags=(), key_parts=()):
+    """Return a cached value, serving stale data while one caller recomputes.
+
+    Fresh entries are returned as-is. Entries past their TTL, or built
+    against older versions of the given invalidation tags, are returned
+    immediately while a single background refresh runs (guarded by a lock
+    key across workers). On a miss the value is computed inline, with
+    concurrent callers in the same process waiting on one computation.
+    """
+    key = _swr_key(name, key_parts)
+    entry = cache.get(key)
+    if entry is None:
+        _record(name, 'miss')
+        return _store(key, name, compute, ttl, tags)
+
+    is_stale = time.time() > entry['fresh_until']
+    if tags and not is_stale:
+        is_stale = get_tag_versions(tags) != entry['versions']
+    if is_stale:
+        _record(name, 'stale')
+        _refresh_in_background(key, name, compute, ttl, tags)
+    else:
+        _record(name, 'hit')
+    return entry['value']
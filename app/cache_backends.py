@@ -0,0 +1,330 @@
+"""
+Two-tier Django cache backend.
+
+L1 is a bounded in-process LRU with a short TTL; L2 is a shared
+Redis-protocol tier spread over one or more nodes with consistent hashing.
+Reads try L1, then L2 (one pipelined MGET per node for get_many) and fill
+L1 on the way back. Writes go to both tiers. Misses are remembered in L1
+for NEGATIVE_TIMEOUT seconds so hot missing keys don't hit L2 every time.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'app.cache_backends.TwoTierCache',
+            'LOCATION': ['redis://10.0.0.1:6379', 'redis://10.0.0.2:6379'],
+            'OPTIONS': {'L1_MAX_ENTRIES': 5000, 'L1_TIMEOUT': 5, 'NEGATIVE_TIMEOUT': 2},
+        },
+    }
+
+If an L2 node is unreachable it is skipped for RETRY_INTERVAL seconds and
+writes for its keys live in L1 only, still capped at L1_TIMEOUT so they can't
+drift far from L2 and other workers once the node is back. The site degrades
+to per-process caching instead of failing.
+"""
+import bisect
+import hashlib
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .resp import RespClient, RespError
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class _NegativeEntry:
+    """Marker stored in L1 for keys known to be missing from L2"""
+    __slots__ = ()
+
+
+NEGATIVE = _NegativeEntry()
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, nodes, replicas=160):
+        points = sorted(
+            (_hash(f'{node}#{i}'), node) for node in nodes for i in range(replicas)
+        )
+        self._hashes = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def get_node(self, key):
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+class LRUStore:
+    """Thread-safe bounded LRU with per-entry expiry"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=_MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, ttl):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] is not NEGATIVE and (
+                entry[1] is None or entry[1] > time.monotonic()
+            ):
+                return False
+        self.set(key, value, ttl)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Django builds one backend instance per thread; like LocMemCache, all
+# instances for the same configuration share one process-wide L1 and
+# node/metrics state. Connections stay per instance (per thread).
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+class _SharedState:
+
+    def __init__(self, max_entries):
+        self.l1 = LRUStore(max_entries)
+        self.down_until = {}
+        self.stats = defaultdict(int)
+        self.stats_lock = threading.Lock()
+
+
+class TwoTierCache(BaseCache):
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        if isinstance(server, str):
+            server = [s.strip() for s in server.split(',') if s.strip()]
+        options = params.get('OPTIONS', {})
+        shared_key = (tuple(server), self.key_prefix, self.version)
+        with _shared_lock:
+            state = _shared.get(shared_key)
+            if state is None:
+                state = _shared[shared_key] = _SharedState(int(options.get('L1_MAX_ENTRIES', 5000)))
+        self._l1 = state.l1
+        self._down_until = state.down_until
+        self._stats = state.stats
+        self._stats_lock = state.stats_lock
+        self._l1_timeout = float(options.get('L1_TIMEOUT', 5))
+        self._negative_timeout = float(options.get('NEGATIVE_TIMEOUT', 2))
+        self._retry_interval = float(options.get('RETRY_INTERVAL', 5))
+        socket_timeout = float(options.get('SOCKET_TIMEOUT', 0.5))
+        self._clients = {url: RespClient.from_url(url, socket_timeout) for url in server}
+        self._ring = HashRing(list(self._clients)) if self._clients else None
+
+    # -- metrics -----------------------------------------------------------
+
+    def _count(self, name, amount=1):
+        if amount:
+            with self._stats_lock:
+                self._stats[name] += amount
+
+    def get_stats(self):
+        """Return counters per tier: l1_hit/l1_miss/negative_hit, l2_hit/l2_miss/l2_error"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['l2_nodes_down'] = sorted(
+            url for url, until in self._down_until.items() if until > time.monotonic()
+        )
+        return stats
+
+    @property
+    def shared(self):
+        """Whether values live in L2, where every worker sees the same ones"""
+        return self._ring is not None
+
+    def delete_local(self, keys, version=None):
+        """Drop keys from this process's L1 only, so the next read goes to L2"""
+        for key in keys:
+            self._l1.delete(self.make_and_validate_key(key, version=version))
+
+    # -- helpers -----------------------------------------------------------
+
+    def _ttl(self, timeout):
+        timeout = self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+        return None if timeout is None else max(float(timeout), 0)
+
+    def _l1_ttl(self, ttl):
+        return self._l1_timeout if ttl is None else min(ttl, self._l1_timeout)
+
+    def _node_for(self, key):
+        """Return the L2 node for a key, or None when there is no usable node"""
+        if self._ring is None:
+            return None
+        url = self._ring.get_node(key)
+        if self._down_until.get(url, 0) > time.monotonic():
+            return None
+        return url
+
+    def _run(self, url, commands):
+        try:
+            replies = self._clients[url].pipeline(commands)
+        except (OSError, ConnectionError, RespError) as e:
+            self._count('l2_error')
+            self._down_until[url] = time.monotonic() + self._retry_interval
+            logger.warning(f"Cache node {url} unavailable: {e}")
+            return None
+        self._down_until.pop(url, None)
+        return replies
+
+    def _set_commands(self, key, value, ttl, nx=False):
+        command = ['SET', key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)]
+        if ttl is not None:
+            command += ['PX', max(int(ttl * 1000), 1)]
+        if nx:
+            command.append('NX')
+        return command
+
+    def _write(self, entries, ttl):
+        """Write {key: value} to L2 and L1; keys without a live node stay in L1 only, for at most L1_TIMEOUT"""
+        by_node = defaultdict(list)
+        for key, value in entries.items():
+            by_node[self._node_for(key)].append(key)
+        failed = []
+        for url, keys in by_node.items():
+            if url is None or self._run(url, [self._set_commands(k, entries[k], ttl) for k in keys]) is None:
+                failed.extend(keys)
+        l1_ttl = self._l1_ttl(ttl)
+        for key, value in entries.items():
+            self._l1.set(key, value, l1_ttl)
+        return sorted(failed)
+
+    # -- BaseCache API -----------------------------------------------------
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._get_many([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        found = self._get_many(list(key_map))
+        return {key_map[k]: v for k, v in found.items()}
+
+    def _get_many(self, keys):
+        found = {}
+        pending = []
+        for key in keys:
+            value = self._l1.get(key)
+            if value is _MISSING:
+                self._count('l1_miss')
+                pending.append(key)
+            else:
+                self._count('l1_hit')
+                if isinstance(value, _NegativeEntry):
+                    self._count('negative_hit')
+                else:
+                    found[key] = value
+
+        by_node = defaultdict(list)
+        for key in pending:
+            by_node[self._node_for(key)].append(key)
+        for url, node_keys in by_node.items():
+            if url is None:
+                continue
+            replies = self._run(url, [['MGET'] + node_keys])
+            if replies is None or isinstance(replies[0], RespError):
+                continue
+            for key, raw in zip(node_keys, replies[0]):
+                if raw is None:
+                    self._count('l2_miss')
+                    if self._negative_timeout:
+                        self._l1.set(key, NEGATIVE, self._negative_timeout)
+                    continue
+                self._count('l2_hit')
+                value = pickle.loads(raw)
+                found[key] = value
+                self._l1.set(key, value, self._l1_timeout)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._write({key: value}, self._ttl(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        entries = {self.make_and_validate_key(k, version=version): v for k, v in data.items()}
+        self._write(entries, self._ttl(timeout))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Atomic on L2 (SET NX), so it can serve as a cross-worker lock"""
+        key = self.make_and_validate_key(key, version=version)
+        ttl = self._ttl(timeout)
+        url = self._node_for(key)
+        replies = self._run(url, [self._set_commands(key, value, ttl, nx=True)]) if url else None
+        if replies is None:
+            return self._l1.add(key, value, ttl)
+        added = replies[0] == 'OK'
+        if added:
+            self._l1.set(key, value, self._l1_ttl(ttl))
+        else:
+            self._l1.delete(key)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        ttl = self._ttl(timeout)
+        url = self._node_for(key)
+        self._l1.delete(key)
+        if url is None:
+            return False
+        command = ['PEXPIRE', key, max(int(ttl * 1000), 1)] if ttl is not None else ['PERSIST', key]
+        replies = self._run(url, [command])
+        return bool(replies and replies[0] == 1)
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._l1.delete(key)
+        url = self._node_for(key)
+        replies = self._run(url, [['DEL', key]]) if url else None
+        return bool(replies and replies[0])
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def clear(self):
+        self._l1.clear()
+        for url in self._clients:
+            self._run(url, [['FLUSHALL']])
+
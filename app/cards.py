@@ -0,0 +1,114 @@
+"""
+Compact product records for listings and JSON APIs.
+
+Listing pages only need a handful of columns per product. ProductCard is a
+__slots__ record filled from a values_list() projection, with the image URL
+resolved once, instead of a full model instance (description, three images,
+video, weight, ...) with display attributes bolted on afterwards.
+"""
+from .models import GoldProduct, SilverProduct, ImitationProduct
+
+PRODUCT_MODELS = {
+    'gold': GoldProduct,
+    'silver': SilverProduct,
+    'imitation': ImitationProduct,
+}
+
+CARD_COLUMNS = (
+    'id', 'name', 'description', 'original_price', 'selling_price', 'image1',
+    'created_at', 'updated_at', 'category_id', 'subcategory_id',
+)
+
+
+class ProductCard:
+    __slots__ = (
+        'product_type', 'id', 'name', 'description', 'original_price', 'selling_price',
+        'image1_url', 'created_at', 'updated_at', 'category_id', 'subcategory_id',
+        # Set by views: pricing, wishlist lookups and homepage rails
+        'display_original_price', 'display_selling_price', 'display_discount_percentage',
+        'discount_percent', 'wishlist_key', 'wishlist_count',
+    )
+
+    def __init__(self, product_type, id, name, description, original_price, selling_price,
+                 image1_url, created_at, updated_at, category_id, subcategory_id):
+        self.product_type = product_type
+        self.id = id
+        self.name = name
+        self.description = description
+        self.original_price = original_price
+        self.selling_price = selling_price
+        self.image1_url = image1_url
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.category_id = category_id
+        self.subcategory_id = subcategory_id
+        self.display_original_price = None
+        self.display_selling_price = None
+        self.display_discount_percentage = None
+        self.discount_percent = None
+        self.wishlist_key = None
+        self.wishlist_count = None
+
+    def __repr__(self):
+        return f'<ProductCard {self.product_type}:{self.id}>'
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+def _card(product_type, storage, row):
+    (pk, name, description, original_price, selling_price, image1,
+     created_at, updated_at, category_id, subcategory_id) = row
+    return ProductCard(
+        product_type, pk, name, description, original_price, selling_price,
+        storage.url(image1) if image1 else '', created_at, updated_at, category_id, subcategory_id,
+    )
+
+
+def cards_from_queryset(queryset, product_type):
+    """Evaluate a product queryset as ProductCards, fetching only CARD_COLUMNS"""
+    storage = queryset.model._meta.get_field('image1').storage
+    return [_card(product_type, storage, row) for row in queryset.values_list(*CARD_COLUMNS)]
+
+
+async def acards_from_queryset(queryset, product_type):
+    """Async version of cards_from_queryset"""
+    storage = queryset.model._meta.get_field('image1').storage
+    return [_card(product_type, storage, row) async for row in queryset.values_list(*CARD_COLUMNS)]
+
+
+def _querysets_by_type(keys, include_inactive):
+    ids_by_type = {}
+    for product_type, pk in keys:
+        if product_type in PRODUCT_MODELS:
+            ids_by_type.setdefault(product_type, []).append(pk)
+    for product_type, ids in ids_by_type.items():
+        model = PRODUCT_MODELS[product_type]
+        manager = model.all_objects if include_inactive else model.objects
+        yield product_type, manager.filter(pk__in=ids)
+
+
+def load_cards(keys, include_inactive=False):
+    """Return {(product_type, id): ProductCard} for [(product_type, id), ...], one query per type.
+
+    include_inactive matches generic relations (cart/wishlist rows), which
+    resolve products without the active-category filter.
+    """
+    cards = {}
+    for product_type, queryset in _querysets_by_type(keys, include_inactive):
+        for card in cards_from_queryset(queryset, product_type):
+            cards[(product_type, card.id)] = card
+    return cards
+
+
+async def aload_cards(keys, include_inactive=False):
+    """Async version of load_cards"""
+    cards = {}
+    for product_type, queryset in _querysets_by_type(keys, include_inactive):
+        for card in await acards_from_queryset(queryset, product_type):
+            cards[(product_type, card.id)] = card
+    return cards
@@ -0,0 +1,232 @@
+"""
+Columnar catalog snapshot for shop listing queries.
+
+Every active product is one row of a NumPy structured array (type code, id,
+price in paise, created_at in microseconds, subcategory id, name rank).
+The array lives in a .npy file that workers open with mmap_mode='r', so
+the pages are shared through the OS page cache. Filtering, sorting and
+paging then run as vectorized operations and return (type, id) pairs. The
+caller only hydrates the rows it is about to show.
+
+A JSON sidecar records, per product type, a stamp of what the rows were
+built from (count, max(updated_at), active category and subcategory ids)
+and the interned, sorted name table. When products change, only the types
+whose stamp moved are re-queried. Rows of the other types are copied
+from the previous file.
+
+NumPy is optional: without it `get_catalog_columns()` returns None and
+callers use the ORM path.
+"""
+import fcntl
+import json
+import logging
+import os
+import uuid
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .cache import TAG_CATEGORIES, TAG_PRODUCTS, process_memo
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is an optional speed-up
+    np = None
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+PRODUCT_TYPES = ('gold', 'silver', 'imitation')
+
+ROW_DTYPE = [
+    ('type', 'i1'),
+    ('id', 'i8'),
+    ('price', 'i8'),
+    ('created', 'i8'),
+    ('subcategory', 'i8'),
+    ('name_rank', 'i4'),
+]
+
+# sort_by -> (column, descending); mirrors ProductService.get_sort_params
+SORTS = {
+    'newest': ('created', True),
+    'oldest': ('created', False),
+    'price_low': ('price', False),
+    'price_high': ('price', True),
+    'popular': ('created', True),
+    'name': ('name_rank', False),
+}
+
+
+def _paths():
+    base = str(getattr(settings, 'CATALOG_COLUMNS_PATH', settings.BASE_DIR / 'catalog_columns'))
+    return base, f'{base}.json'
+
+
+def _to_paise(value):
+    return int((Decimal(value) * 100).to_integral_value())
+
+
+def _type_stamp(model):
+    """What one product type's rows are derived from"""
+    stats = model.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    category_field = model._meta.get_field('category').related_model
+    subcategory_field = model._meta.get_field('subcategory').related_model
+    return [
+        stats['count'],
+        stats['updated'].isoformat() if stats['updated'] else None,
+        list(category_field.objects.filter(is_active=True).order_by('id').values_list('id', flat=True)),
+        list(subcategory_field.objects.filter(is_active=True).order_by('id').values_list('id', flat=True)),
+    ]
+
+
+def _query_type(type_code, model):
+    """Return (rows without name ranks, lowered names) for one product type"""
+    records = list(
+        model.objects.order_by('id').values_list('id', 'selling_price', 'created_at', 'subcategory_id', 'name')
+    )
+    rows = np.zeros(len(records), dtype=ROW_DTYPE)
+    if records:
+        ids, prices, created, subcategories, names = zip(*records)
+        rows['type'] = type_code
+        rows['id'] = ids
+        rows['price'] = [_to_paise(p or 0) for p in prices]
+        rows['created'] = [int(c.timestamp() * 1_000_000) for c in created]
+        rows['subcategory'] = subcategories
+        return rows, [(n or '').lower() for n in names]
+    return rows, []
+
+
+class CatalogColumns:
+
+    def __init__(self, rows, meta):
+        self.rows = rows
+        self.meta = meta
+
+    def query(self, types=None, min_price=None, max_price=None, subcategory=None,
+              sort_by='newest', offset=0, limit=None):
+        """Filter, sort and page the catalog.
+
+        Prices are Decimals compared against selling_price, like the ORM
+        filters. Returns (total matches, [(product_type, id), ...]).
+        """
+        rows = self.rows
+        mask = np.ones(len(rows), dtype=bool)
+        if types is not None:
+            codes = [PRODUCT_TYPES.index(t) for t in types if t in PRODUCT_TYPES]
+            mask &= np.isin(rows['type'], codes)
+        if min_price is not None:
+            mask &= rows['price'] >= int((min_price * 100).to_integral_value(ROUND_CEILING))
+        if max_price is not None:
+            mask &= rows['price'] <= int((max_price * 100).to_integral_value(ROUND_FLOOR))
+        if subcategory is not None:
+            mask &= rows['subcategory'] == subcategory
+
+        selected = np.flatnonzero(mask)
+        column, descending = SORTS.get(sort_by, SORTS['newest'])
+        keys = rows[column][selected]
+        # Stable sorts keep the catalog order for ties, as list.sort() does
+        order = np.argsort(-keys if descending else keys, kind='stable')
+        page = selected[order][offset:None if limit is None else offset + limit]
+        return len(selected), [
+            (PRODUCT_TYPES[t], int(i)) for t, i in zip(rows['type'][page], rows['id'][page])
+        ]
+
+
+def _load(base, meta_path):
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('format') != FORMAT_VERSION:
+        return None
+    rows = np.load(f"{base}.{meta['generation']}.npy", mmap_mode='r')
+    return CatalogColumns(rows, meta)
+
+
+def _build(base, meta_path, stamps, previous):
+    """Write a new generation, reusing rows of types whose stamp is unchanged"""
+    from .views import ProductService
+
+    parts, names = [], []
+    for code, product_type in enumerate(PRODUCT_TYPES):
+        old_stamp = previous.meta['stamps'].get(product_type) if previous else None
+        if previous is not None and old_stamp == stamps[product_type]:
+            rows = np.array(previous.rows[previous.rows['type'] == code])
+            type_names = [previous.meta['names'][r] for r in rows['name_rank']]
+        else:
+            rows, type_names = _query_type(code, ProductService.PRODUCT_TYPE_MAP[product_type])
+        parts.append(rows)
+        names.extend(type_names)
+
+    rows = np.concatenate(parts) if parts else np.zeros(0, dtype=ROW_DTYPE)
+    table = sorted(set(names))
+    rank = {name: i for i, name in enumerate(table)}
+    rows['name_rank'] = [rank[name] for name in names]
+
+    generation = uuid.uuid4().hex
+    np.save(f'{base}.{generation}.npy', rows)
+    meta = {'format': FORMAT_VERSION, 'generation': generation, 'stamps': stamps, 'names': table}
+    tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+    if previous is not None:
+        # Workers still holding the old mapping keep it until they reload
+        try:
+            os.unlink(f"{base}.{previous.meta['generation']}.npy")
+        except FileNotFoundError:
+            pass
+    logger.info(f"Catalog columns rebuilt: {len(rows)} rows, generation {generation}")
+    return CatalogColumns(np.load(f'{base}.{generation}.npy', mmap_mode='r'), meta)
+
+
+@process_memo(TAG_PRODUCTS, TAG_CATEGORIES)
+def _catalog_columns():
+    from .views import ProductService
+
+    base, meta_path = _paths()
+    stamps = json.loads(json.dumps({
+        t: _type_stamp(ProductService.PRODUCT_TYPE_MAP[t]) for t in PRODUCT_TYPES
+    }))
+    try:
+        current = _load(base, meta_path)
+    except (OSError, ValueError, KeyError):
+        current = None
+    if current is not None and current.meta['stamps'] == stamps:
+        return current
+
+    with open(f'{base}.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # Another worker may have rebuilt while we waited for the lock
+            try:
+                current = _load(base, meta_path)
+            except (OSError, ValueError, KeyError):
+                current = None
+            if current is not None and current.meta['stamps'] == stamps:
+                return current
+            return _build(base, meta_path, stamps, current)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_catalog_columns():
+    """Return the current CatalogColumns, or None if NumPy is unavailable or the build fails"""
+    if np is None:
+        return None
+    try:
+        return _catalog_columns()
+    except Exception as e:
+        logger.error(f"Catalog columns unavailable: {e}")
+        return None
+
+
+def parse_price(value):
+    """Parse a price filter like the ORM path does: invalid values mean no filter"""
+    if not value:
+        return None
+    try:
+        price = Decimal(str(value))
+    except InvalidOperation:
+        return None
+    return price if price.is_finite() else None
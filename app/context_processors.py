@@ -1,4 +1,38 @@
-from .models import Category, GoldCategory, SilverCategory, ImitationCategory
+from .cache import swr_get, TAG_CATEGORIES
+from .models import (
+    Category, GoldCategory, SilverCategory, ImitationCategory,
+    GoldSubCategory, SilverSubCategory, ImitationSubCategory,
+)
+
+NAV_TREE_TTL = 10 * 60
+
+
+def _compute_header_categories():
+    qs = Category.objects.filter(is_active=True).order_by('name')[:3]
+    return [
+        {
+            'type': (c.name or '').lower(),
+            'name': c.name,
+        }
+        for c in qs
+    ]
+
+
+def _compute_nav_tree():
+    """Materialize active categories and their active subcategories (6 queries total)"""
+    tree = {}
+    for prefix, category_model, subcategory_model, parent_field in (
+        ('gold', GoldCategory, GoldSubCategory, 'gold_category_id'),
+        ('silver', SilverCategory, SilverSubCategory, 'silver_category_id'),
+        ('imitation', ImitationCategory, ImitationSubCategory, 'imitation_category_id'),
+    ):
+        categories = list(category_model.objects.filter(is_active=True).order_by('name'))
+        subcategories = {c.id: [] for c in categories}
+        for sub in subcategory_model.objects.filter(is_active=True, **{f'{parent_field}__in': list(subcategories)}):
+            subcategories[getattr(sub, parent_field)].append(sub)
+        tree[f'{prefix}_categories'] = categories
+        tree[f'{prefix}_subcategories'] = subcategories
+    return tree
 
 
 def header_categories(request):
@@ -7,14 +41,7 @@ def header_categories(request):
     Returns a list of dicts: {type (lowercased name for URL), name}
     """
     try:
-        qs = Category.objects.filter(is_active=True).order_by('name')[:3]
-        items = [
-            {
-                'type': (c.name or '').lower(),
-                'name': c.name,
-            }
-            for c in qs
-        ]
+        items = swr_get('header_categories', _compute_header_categories, NAV_TREE_TTL, tags=(TAG_CATEGORIES,))
     except Exception:
         items = []
     return {'header_categories': items}
@@ -24,26 +51,7 @@ def active_categories(request):
     Provide all active categories and subcategories for navigation menus
     """
     try:
-        categories = {
-            'gold_categories': GoldCategory.objects.filter(is_active=True).order_by('name'),
-            'silver_categories': SilverCategory.objects.filter(is_active=True).order_by('name'),
-            'imitation_categories': ImitationCategory.objects.filter(is_active=True).order_by('name'),
-        }
-        
-        # Get active subcategories for each category type
-        categories['gold_subcategories'] = {}
-        categories['silver_subcategories'] = {}
-        categories['imitation_subcategories'] = {}
-        
-        for gold_cat in categories['gold_categories']:
-            categories['gold_subcategories'][gold_cat.id] = gold_cat.subcategory.filter(is_active=True)
-            
-        for silver_cat in categories['silver_categories']:
-            categories['silver_subcategories'][silver_cat.id] = silver_cat.subcategory.filter(is_active=True)
-            
-        for imitation_cat in categories['imitation_categories']:
-            categories['imitation_subcategories'][imitation_cat.id] = imitation_cat.subcategory.filter(is_active=True)
-            
+        categories = swr_get('nav_tree', _compute_nav_tree, NAV_TREE_TTL, tags=(TAG_CATEGORIES,))
     except Exception:
         categories = {
             'gold_categories': [],
@@ -53,5 +61,5 @@ def active_categories(request):
             'silver_subcategories': {},
             'imitation_subcategories': {},
         }
-    
+
     return categories
@@ -1,6 +1,8 @@
 from functools import wraps
 from django.shortcuts import redirect
-from django.http import Http404
+from django.http import Http404, HttpResponse
+from django.core.cache import cache
+from .cache import PAGE_CACHE_TIMEOUT, get_price_tier, page_cache_key, request_has_credentials
 from .models import GoldProduct, SilverProduct, ImitationProduct
 
 def check_category_active(view_func):
@@ -55,3 +57,41 @@ def require_active_categories(view_func):
         return view_func(request, *args, **kwargs)
     
     return wrapper
+
+# Headers a view may set that a cached copy of its page must carry too
+PAGE_CACHE_HEADERS = ('Content-Type', 'Content-Language', 'Vary', 'Cache-Control', 'Expires')
+
+def cache_storefront_page(*tags):
+    """
+    Full-page cache for anonymous storefront views.
+    Entries are keyed by path, normalized query and price tier, and are
+    orphaned whenever one of the given invalidation tags is bumped.
+    Personalized bits (wishlist hearts, cart count) are filled client-side.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request_has_credentials(request):
+                return view_func(request, *args, **kwargs)
+
+            key = page_cache_key(request, tags, get_price_tier(None))
+            cached = cache.get(key)
+            if cached is not None:
+                status, headers, content = cached
+                response = HttpResponse(content, status=status)
+                for name, value in headers:
+                    response[name] = value
+                response['X-Page-Cache'] = 'HIT'
+                return response
+
+            response = view_func(request, *args, **kwargs)
+            if (response.status_code == 200 and not response.streaming
+                    and not response.cookies):
+                if hasattr(response, 'render') and callable(response.render):
+                    response = response.render()
+                headers = tuple((name, response[name]) for name in PAGE_CACHE_HEADERS if response.has_header(name))
+                cache.set(key, (response.status_code, headers, response.content), PAGE_CACHE_TIMEOUT)
+                response['X-Page-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
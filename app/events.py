@@ -0,0 +1,196 @@
+"""
+Live storefront events for the Server-Sent Events endpoint.
+
+Writers publish small JSON events once their transaction commits:
+
+    {'type': 'counts', 'key': 'user:7', 'cart_count': 3, 'wishlist_count': 5}
+    {'type': 'stock', 'key': 'stock:gold:49', 'product': 'gold:49', 'stock_quantity': 0}
+
+Each ASGI process runs one EventBroker. It receives every event, from its
+own process or over the pub/sub transport, and hands it to the open streams
+subscribed to the event's key. Configured through settings.EVENT_STREAM:
+
+    {'TRANSPORT': 'resp', 'URL': 'redis://127.0.0.1:6379', 'CHANNEL': 'storefront:events'}
+    {'TRANSPORT': 'local'}
+
+'resp' fans out across processes through one Redis-protocol channel, either
+Redis or `manage.py run_resp_standin`. 'local' only reaches streams served by
+the publishing process. A missing setting or TRANSPORT None disables events.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+
+from .resp import RespClient
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNEL = 'storefront:events'
+RETRY_INTERVAL = 5.0
+QUEUE_SIZE = 100
+
+
+def _config():
+    return getattr(settings, 'EVENT_STREAM', None) or {}
+
+
+def events_enabled():
+    return bool(_config().get('TRANSPORT'))
+
+
+def user_key(user_id):
+    return f'user:{user_id}'
+
+
+def stock_key(product_type, product_id):
+    return f'stock:{product_type}:{product_id}'
+
+
+class EventBroker:
+    """Routes events to the asyncio queues of open streams, from any thread"""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, keys):
+        """Return a queue receiving events for `keys`; call from the stream's event loop"""
+        queue = asyncio.Queue(QUEUE_SIZE)
+        entry = (queue, asyncio.get_running_loop())
+        with self._lock:
+            self._keys[queue] = tuple(keys)
+            for key in keys:
+                self._subscribers.setdefault(key, []).append(entry)
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            for key in self._keys.pop(queue, ()):
+                entries = [e for e in self._subscribers.get(key, []) if e[0] is not queue]
+                if entries:
+                    self._subscribers[key] = entries
+                else:
+                    self._subscribers.pop(key, None)
+
+    def dispatch(self, event):
+        with self._lock:
+            entries = list(self._subscribers.get(event.get('key'), ()))
+        for queue, loop in entries:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                pass  # The stream's loop has closed; unsubscribe will follow
+
+    def listen(self, url, channel):
+        """Dispatch events published on `channel` from a daemon thread, reconnecting as needed"""
+        thread = threading.Thread(target=self._listen, args=(url, channel), name='event-listener', daemon=True)
+        thread.start()
+
+    def _listen(self, url, channel):
+        client = RespClient.from_url(url, timeout=None)
+        while True:
+            try:
+                for _, payload in client.subscribe(channel):
+                    self.dispatch(json.loads(payload))
+            except Exception as e:
+                logger.warning(f"Storefront event listener disconnected from {url}: {e}")
+            finally:
+                client.close()
+            time.sleep(RETRY_INTERVAL)
+
+
+def _offer(queue, event):
+    # A stream that stopped reading shouldn't grow without bound; it resyncs on reconnect
+    if not queue.full():
+        queue.put_nowait(event)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """This process's broker, starting the transport listener on first use"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker = EventBroker()
+                config = _config()
+                if config.get('TRANSPORT') == 'resp':
+                    broker.listen(config['URL'], config.get('CHANNEL', DEFAULT_CHANNEL))
+                _broker = broker
+    return _broker
+
+
+class _Publisher:
+
+    def __init__(self, config):
+        self.local = config.get('TRANSPORT') == 'local'
+        self.channel = config.get('CHANNEL', DEFAULT_CHANNEL)
+        self.client = None if self.local else RespClient.from_url(config['URL'])
+        self._down_until = 0.0
+
+    def publish(self, event):
+        if self.local:
+            get_broker().dispatch(event)
+            return
+        if time.monotonic() < self._down_until:
+            return
+        try:
+            self.client.execute('PUBLISH', self.channel, json.dumps(event, default=str))
+        except (OSError, ConnectionError) as e:
+            self._down_until = time.monotonic() + RETRY_INTERVAL
+            logger.warning(f"Storefront events unavailable: {e}")
+
+
+_publisher = None
+
+
+def publish_event(event):
+    global _publisher
+    if not events_enabled():
+        return
+    if _publisher is None:
+        _publisher = _Publisher(_config())
+    _publisher.publish(event)
+
+
+def user_counts(user_id):
+    from .models import Cart, Wishlist
+
+    return {
+        'cart_count': Cart.objects.filter(user_id=user_id).aggregate(total=Sum('quantity'))['total'] or 0,
+        'wishlist_count': Wishlist.objects.filter(user_id=user_id).count(),
+    }
+
+
+def publish_user_counts(user_id):
+    """After commit, push the user's current cart and wishlist counts to their open tabs"""
+    if not user_id or not events_enabled():
+        return
+
+    def send():
+        try:
+            publish_event({'type': 'counts', 'key': user_key(user_id), **user_counts(user_id)})
+        except Exception as e:
+            logger.error(f"Error publishing counts for user {user_id}: {e}")
+    transaction.on_commit(send)
+
+
+def publish_stock(product_type, product_id, stock_quantity):
+    """After commit, push a product's new stock level to tabs that have it open"""
+    if not events_enabled():
+        return
+    product = f'{product_type}:{product_id}'
+    transaction.on_commit(lambda: publish_event({
+        'type': 'stock', 'key': stock_key(product_type, product_id),
+        'product': product, 'stock_quantity': stock_quantity,
+    }))
@@ -0,0 +1,77 @@
+"""
+Guest carts kept in a signed cookie.
+
+Anonymous shoppers can fill a cart without any database writes. The cart
+lives in the `guest_cart` cookie as packed product keys and quantities:
+
+    g49x2.s12x1.i7x3
+
+Each entry is the type prefix used by the cart/add/<prefix><id>/ URLs, then
+the product id, 'x' and the quantity. The cookie is signed, so only carts
+this server wrote are read back. It is not HttpOnly, because base.html
+reads the item count for the header badge. At login or signup the cart is
+merged into Cart with one bulk upsert (views.merge_guest_cart) and the
+cookie is deleted.
+"""
+from django.conf import settings
+from django.core import signing
+
+COOKIE_NAME = 'guest_cart'
+SALT = 'app.guest_cart'
+MAX_AGE = 30 * 24 * 60 * 60
+# Keeps the cookie well under the 4KB browser limit
+MAX_ITEMS = 50
+MAX_QUANTITY = 99
+
+TYPE_PREFIXES = {'gold': 'g', 'silver': 's', 'imitation': 'i'}
+PREFIX_TYPES = {prefix: product_type for product_type, prefix in TYPE_PREFIXES.items()}
+
+
+def pack(items):
+    return '.'.join(
+        f'{TYPE_PREFIXES[product_type]}{product_id}x{quantity}'
+        for (product_type, product_id), quantity in items.items()
+    )
+
+
+def unpack(value):
+    """{(product_type, product_id): quantity}, in the order items were added; bad entries are dropped"""
+    items = {}
+    for entry in (value or '').split('.')[:MAX_ITEMS]:
+        product_id, _, quantity = entry[1:].partition('x')
+        product_type = PREFIX_TYPES.get(entry[:1])
+        if product_type and product_id.isdigit() and quantity.isdigit() and int(quantity) > 0:
+            items[(product_type, int(product_id))] = min(int(quantity), MAX_QUANTITY)
+    return items
+
+
+def read(request):
+    try:
+        value = request.get_signed_cookie(COOKIE_NAME, default=None, salt=SALT, max_age=MAX_AGE)
+    except signing.BadSignature:
+        value = None
+    return unpack(value)
+
+
+def add(items, product_type, product_id, quantity):
+    """Add `quantity` of a product to `items` in place. Returns False if the cart is full."""
+    key = (product_type, product_id)
+    if key not in items and len(items) >= MAX_ITEMS:
+        return False
+    items[key] = max(1, min(items.get(key, 0) + quantity, MAX_QUANTITY))
+    return True
+
+
+def count(items):
+    return sum(items.values())
+
+
+def save(response, items):
+    response.set_signed_cookie(
+        COOKIE_NAME, pack(items), salt=SALT, max_age=MAX_AGE,
+        secure=settings.SESSION_COOKIE_SECURE, samesite='Lax',
+    )
+
+
+def clear(response):
+    response.delete_cookie(COOKIE_NAME, samesite='Lax')
@@ -0,0 +1,144 @@
+"""
+Replay of retried POSTs that carry an Idempotency-Key header.
+
+Clients retrying a write (a mobile app on a flaky connection, a double
+submitted form) send the same `Idempotency-Key` with each attempt. The first
+attempt claims the key with cache.add (SET NX on L2, so only one worker wins)
+and runs the view; its response is then stored as a compact tuple
+
+    (fingerprint, status, content_type, body, cookies, location)
+
+for settings.IDEMPOTENCY['TTL'] seconds. Later attempts are answered from
+that tuple with a single cache read, without touching the database or
+re-hashing passwords. Keys are scoped to the caller: the user of a valid JWT
+(Authorization header or jwt_token cookie), else the session cookie, else the
+client address and user agent. Anonymous responses that set cookies are never
+stored, so a colliding key can't hand one visitor another's cookies. The
+fingerprint of method, path and body must match as well, so a key reused for
+a different request gets 422 instead of someone else's response. Bodies over
+COMPRESS_OVER bytes are zlib-compressed.
+
+Only the views named in settings.IDEMPOTENCY['VIEWS'] take part. 5xx and
+streaming responses are not stored, so those attempts can be retried.
+"""
+import hashlib
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+COMPRESS_OVER = 1024
+
+DEFAULTS = {
+    'TTL': 24 * 60 * 60,
+    # How long a claimed key blocks retries if the worker dies mid-request
+    'LOCK_TIMEOUT': 60,
+    'MAX_BODY_BYTES': 64 * 1024,
+    'VIEWS': (),
+}
+
+IN_FLIGHT = 'in-flight'
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'IDEMPOTENCY', {})}
+
+
+def caller(request):
+    """Who sent the request, or None for an anonymous visitor"""
+    from .views import jwt_user_id
+
+    user_id = jwt_user_id(request)
+    if user_id is not None:
+        return f'user:{user_id}'
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session_key:
+        return f'session:{session_key}'
+    return None
+
+
+def cache_key(request, key, sender=None):
+    """Cache key for an Idempotency-Key, scoped to whoever sent it"""
+    sender = sender or caller(request) or (
+        f"anon:{request.META.get('REMOTE_ADDR', '')}\0{request.headers.get('User-Agent', '')}"
+    )
+    return 'idem:' + hashlib.sha256(f'{sender}\0{key}'.encode('utf-8')).hexdigest()
+
+
+def fingerprint(request):
+    digest = hashlib.sha256(f'{request.method} {request.get_full_path()}\0'.encode('utf-8'))
+    digest.update(request.body)
+    return digest.digest()[:16]
+
+
+def pack(request_fingerprint, response, anonymous=False):
+    """The stored form of `response`, or None if it shouldn't be replayed"""
+    if response.streaming or response.status_code >= 500:
+        return None
+    if anonymous and response.cookies:
+        return None
+    body = response.content
+    if len(body) > config()['MAX_BODY_BYTES']:
+        return None
+    compressed = len(body) > COMPRESS_OVER
+    cookies = tuple(morsel.OutputString() for morsel in response.cookies.values())
+    return (
+        request_fingerprint, response.status_code, response.get('Content-Type', ''),
+        zlib.compress(body) if compressed else body, compressed, cookies, response.get('Location'),
+    )
+
+
+def unpack(entry):
+    _, status, content_type, body, compressed, cookies, location = entry
+    response = HttpResponse(zlib.decompress(body) if compressed else body, status=status, content_type=content_type)
+    for cookie in cookies:
+        response.cookies.load(cookie)
+    if location:
+        response['Location'] = location
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def begin(request):
+    """Claim the request's key or answer it.
+
+    Returns ((cache_key, fingerprint, anonymous), None) for finish(), or (None, response).
+    """
+    key = request.headers[HEADER]
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return None, JsonResponse(
+            {'success': False, 'message': f'{HEADER} must be 1-{MAX_KEY_LENGTH} characters'}, status=400
+        )
+    sender = caller(request)
+    stored_key = cache_key(request, key, sender)
+    request_fingerprint = fingerprint(request)
+    entry = cache.get(stored_key)
+    if entry is None:
+        if cache.add(stored_key, IN_FLIGHT, config()['LOCK_TIMEOUT']):
+            return (stored_key, request_fingerprint, sender is None), None
+        # Lost the race to another attempt: it is either running or just finished
+        entry = cache.get(stored_key)
+    if entry is None or entry == IN_FLIGHT:
+        response = JsonResponse(
+            {'success': False, 'message': 'A request with this Idempotency-Key is still being processed'}, status=409
+        )
+        response['Retry-After'] = '1'
+        return None, response
+    if entry[0] != request_fingerprint:
+        return None, JsonResponse(
+            {'success': False, 'message': f'This {HEADER} was already used for a different request'}, status=422
+        )
+    return None, unpack(entry)
+
+
+def finish(stored_key, request_fingerprint, anonymous, response):
+    """Store the response for replay, or free the key so the request can be retried"""
+    entry = pack(request_fingerprint, response, anonymous)
+    if entry is None:
+        cache.delete(stored_key)
+    else:
+        cache.set(stored_key, entry, config()['TTL'])
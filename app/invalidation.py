@@ -0,0 +1,182 @@
+"""
+Cross-process cache invalidation bus.
+
+Each worker keeps per-process state (LocMem cache entries, L1 copies of
+shared entries, process memos) that an admin edit in another worker would
+otherwise leave stale. Invalidated tags are published as per-tag counters on
+a shared transport; every worker polls the counters at most once per
+POLL_INTERVAL (from InvalidationBusMiddleware) and catches up with any tag
+whose counter moved (cache.apply_remote_invalidation).
+
+Configured through settings.INVALIDATION_BUS:
+
+    {'TRANSPORT': 'sqlite', 'PATH': BASE_DIR / 'cache_bus.sqlite3', 'POLL_INTERVAL': 1.0}
+    {'TRANSPORT': 'redis', 'URL': 'redis://127.0.0.1:6379', 'POLL_INTERVAL': 1.0}
+
+A missing setting or TRANSPORT None disables the bus.
+"""
+import logging
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+from .resp import RespClient, RespError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 1.0
+
+
+class SQLiteTransport:
+    """Tag counters in a SQLite file shared by all workers on one host"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS tag_versions (tag TEXT PRIMARY KEY, version INTEGER NOT NULL)'
+            )
+            self._local.conn = conn
+        return conn
+
+    def publish(self, tags):
+        conn = self._connection()
+        with conn:
+            return dict(
+                conn.execute(
+                    'INSERT INTO tag_versions (tag, version) VALUES (?, 1) '
+                    'ON CONFLICT(tag) DO UPDATE SET version = version + 1 '
+                    'RETURNING tag, version',
+                    (tag,),
+                ).fetchone()
+                for tag in tags
+            )
+
+    def fetch(self):
+        return dict(self._connection().execute('SELECT tag, version FROM tag_versions'))
+
+
+class RedisTransport:
+    """Tag counters in a hash on a Redis-protocol server (works across hosts)"""
+
+    def __init__(self, url, key='cache:tag_versions'):
+        self.client = RespClient.from_url(url)
+        self.key = key
+
+    def publish(self, tags):
+        replies = self.client.pipeline([('HINCRBY', self.key, tag, 1) for tag in tags])
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return dict(zip(tags, replies))
+
+    def fetch(self):
+        flat = self.client.execute('HGETALL', self.key) or []
+        return {
+            flat[i].decode(): int(flat[i + 1])
+            for i in range(0, len(flat), 2)
+        }
+
+
+class InvalidationBus:
+
+    def __init__(self, transport, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.transport = transport
+        self.poll_interval = poll_interval
+        self._seen = None
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+
+    def publish(self, tags):
+        try:
+            versions = self.transport.publish(tags)
+        except Exception as e:
+            logger.error(f"Invalidation bus publish failed for {', '.join(tags)}: {e}")
+            return
+        with self._lock:
+            # Our own bump is already applied locally; don't replay it on the next poll
+            if self._seen is not None:
+                self._seen.update(versions)
+
+    def poll_due(self):
+        return time.monotonic() >= self._next_poll
+
+    def poll(self, force=False):
+        """Apply tags changed by other workers since the last poll"""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now < self._next_poll:
+                return []
+            self._next_poll = now + self.poll_interval
+        try:
+            versions = self.transport.fetch()
+        except Exception as e:
+            logger.warning(f"Invalidation bus poll failed: {e}")
+            return []
+        with self._lock:
+            if self._seen is None:
+                # First poll only records where the counters stand
+                self._seen = versions
+                return []
+            changed = [tag for tag, version in versions.items() if self._seen.get(tag) != version]
+            self._seen.update(versions)
+        if changed:
+            from .cache import apply_remote_invalidation
+            apply_remote_invalidation(changed)
+        return changed
+
+
+def _build_bus():
+    config = getattr(settings, 'INVALIDATION_BUS', None) or {}
+    kind = config.get('TRANSPORT')
+    if not kind:
+        return None
+    if kind == 'sqlite':
+        transport = SQLiteTransport(config['PATH'])
+    elif kind == 'redis':
+        transport = RedisTransport(config['URL'], config.get('KEY', 'cache:tag_versions'))
+    else:
+        raise ValueError(f"Unknown INVALIDATION_BUS transport: {kind}")
+    bus = InvalidationBus(transport, config.get('POLL_INTERVAL', DEFAULT_POLL_INTERVAL))
+    bus.poll(force=True)
+    return bus
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_bus():
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                _bus = _build_bus() or False
+    return _bus or None
+
+
+def publish_tags(tags):
+    bus = get_bus()
+    if bus is not None:
+        bus.publish(tags)
+
+
+def poll_bus():
+    bus = get_bus()
+    if bus is not None:
+        bus.poll()
+
+
+def poll_bus_due():
+    """Whether poll_bus() may do any I/O; lets async callers skip a thread hop between polls"""
+    if _bus is None:
+        return True
+    return bool(_bus) and _bus.poll_due()
@@ -0,0 +1,273 @@
+"""
+Stock reservations: short holds on inventory while a customer checks out.
+
+A product's stock_quantity is the stock still available to sell. A hold
+takes its quantity off with a conditional
+
+    UPDATE ... SET stock_quantity = stock_quantity - n WHERE id = ... AND stock_quantity >= n
+
+so two checkouts can never both take the last unit. It then records a
+StockReservation that expires after settings.STOCK_HOLD_SECONDS.
+
+Holds are given back (the customer leaves checkout, or release_expired finds
+them past their expiry) or consumed (sell() places the order and the stock
+stays taken). Both start with DELETE ... RETURNING, so whichever deletes a hold's
+row owns it and a hold can't be both released and consumed.
+
+Product pages read availability from stock_levels(), a per-process map of
+every product's stock, instead of querying. The map is rebuilt after
+TAG_STOCK or TAG_PRODUCTS is bumped.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import TAG_PRODUCTS, TAG_STOCK, invalidate_tags, process_memo
+from .cards import PRODUCT_MODELS
+from .events import publish_stock
+from .models import Cart, StockReservation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOLD_SECONDS = 10 * 60
+SWEEP_BATCH_SIZE = 500
+
+
+class InsufficientStock(Exception):
+    """Some cart lines can't be held; `shortages` is [(product_type, id, requested, available), ...]"""
+
+    def __init__(self, shortages):
+        super().__init__(f'{len(shortages)} item(s) out of stock')
+        self.shortages = shortages
+
+
+def hold_seconds():
+    return getattr(settings, 'STOCK_HOLD_SECONDS', DEFAULT_HOLD_SECONDS)
+
+
+def _product_types_by_content_type():
+    return {
+        ContentType.objects.get_for_model(model).id: product_type
+        for product_type, model in PRODUCT_MODELS.items()
+    }
+
+
+def _table(product_type):
+    return connection.ops.quote_name(PRODUCT_MODELS[product_type]._meta.db_table)
+
+
+@process_memo(TAG_PRODUCTS, TAG_STOCK)
+def stock_levels():
+    """{(product_type, id): stock_quantity} for every product, one query per type"""
+    levels = {}
+    for product_type, model in PRODUCT_MODELS.items():
+        for pk, stock in model.all_objects.values_list('id', 'stock_quantity'):
+            levels[(product_type, pk)] = stock
+    return levels
+
+
+def available_stock(product_type, pk):
+    return stock_levels().get((product_type, pk), 0)
+
+
+def _stock_changed(levels):
+    """After commit: refresh every process's stock map and push the new levels to open product pages"""
+    if levels:
+        invalidate_tags(TAG_STOCK)
+        for (product_type, pk), stock in levels.items():
+            publish_stock(product_type, pk, stock)
+
+
+def _take(cursor, product_type, pk, quantity):
+    """Take `quantity` off a product's stock if that much is left. Returns the new level, or None."""
+    cursor.execute(
+        f"UPDATE {_table(product_type)} SET stock_quantity = stock_quantity - %s "
+        f"WHERE id = %s AND stock_quantity >= %s RETURNING stock_quantity",
+        [quantity, pk, quantity],
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _adjust(cursor, product_type, deltas):
+    """Take {id: quantity} off one product table in a single UPDATE; negative quantities are given back.
+
+    A product is only updated if it has enough stock for its quantity, so
+    callers compare the returned {id: new level} against `deltas` to find
+    what was short.
+    """
+    cases = ' '.join('WHEN %s THEN %s' for _ in deltas)
+    case_params = [value for pk, quantity in sorted(deltas.items()) for value in (pk, quantity)]
+    ids = sorted(deltas)
+    cursor.execute(
+        f"UPDATE {_table(product_type)} SET stock_quantity = stock_quantity - CASE id {cases} END "
+        f"WHERE id IN ({', '.join(['%s'] * len(ids))}) AND stock_quantity >= CASE id {cases} END "
+        f"RETURNING id, stock_quantity",
+        case_params + ids + case_params,
+    )
+    return dict(cursor.fetchall())
+
+
+def _give_back(cursor, claimed, types):
+    """Return claimed (content_type_id, object_id, quantity) rows to stock, one UPDATE per product"""
+    totals = defaultdict(int)
+    for ct_id, object_id, quantity in claimed:
+        if ct_id in types:
+            totals[(types[ct_id], object_id)] += quantity
+    levels = {}
+    for (product_type, pk), quantity in sorted(totals.items()):
+        cursor.execute(
+            f"UPDATE {_table(product_type)} SET stock_quantity = stock_quantity + %s "
+            f"WHERE id = %s RETURNING stock_quantity",
+            [quantity, pk],
+        )
+        row = cursor.fetchone()
+        if row:
+            levels[(product_type, pk)] = row[0]
+    return levels
+
+
+def _claim(cursor, where, params):
+    """Delete the holds matching `where`, returning their (content_type_id, object_id, quantity)"""
+    table = connection.ops.quote_name(StockReservation._meta.db_table)
+    cursor.execute(
+        f"DELETE FROM {table} WHERE {where} RETURNING content_type_id, object_id, quantity", params
+    )
+    return cursor.fetchall()
+
+
+def reserve_cart(user):
+    """Hold the stock for everything in the user's cart, replacing any holds they already have.
+
+    Either every line is held or none is: raises InsufficientStock, leaving
+    stock and the user's previous holds as they were. Returns
+    (reservations, expires_at).
+    """
+    types = _product_types_by_content_type()
+    lines = sorted(
+        (types[ct_id], object_id, quantity)
+        for ct_id, object_id, quantity in
+        Cart.objects.filter(user=user).values_list('content_type_id', 'object_id', 'quantity')
+        if ct_id in types
+    )
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=hold_seconds())
+    content_type_ids = {product_type: ct_id for ct_id, product_type in types.items()}
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            levels = _give_back(cursor, _claim(cursor, 'user_id = %s', [user.pk]), types)
+            shortages = []
+            # Lines are sorted so concurrent checkouts lock products in the same order
+            for product_type, pk, quantity in lines:
+                level = _take(cursor, product_type, pk, quantity)
+                if level is None:
+                    available = PRODUCT_MODELS[product_type].all_objects.filter(pk=pk).values_list(
+                        'stock_quantity', flat=True
+                    ).first()
+                    shortages.append((product_type, pk, quantity, available or 0))
+                else:
+                    levels[(product_type, pk)] = level
+            if shortages:
+                raise InsufficientStock(shortages)
+        reservations = StockReservation.objects.bulk_create([
+            StockReservation(
+                user=user, content_type_id=content_type_ids[product_type], object_id=pk,
+                quantity=quantity, created_at=now, expires_at=expires_at,
+            )
+            for product_type, pk, quantity in lines
+        ])
+        _stock_changed(levels)
+    return reservations, expires_at
+
+
+def release_holds(user):
+    """Give back all of a user's holds. Returns the number of products whose stock was returned."""
+    types = _product_types_by_content_type()
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            levels = _give_back(cursor, _claim(cursor, 'user_id = %s', [user.pk]), types)
+        _stock_changed(levels)
+    return len(levels)
+
+
+def consume_holds(user):
+    """Turn a user's holds into sold stock, e.g. when their order is placed.
+
+    Returns {(product_type, id): quantity} for the holds consumed. Holds the
+    sweeper already released are missing from the result, and their stock
+    has to be taken again.
+    """
+    types = _product_types_by_content_type()
+    with connection.cursor() as cursor:
+        claimed = _claim(cursor, 'user_id = %s', [user.pk])
+    consumed = defaultdict(int)
+    for ct_id, object_id, quantity in claimed:
+        if ct_id in types:
+            consumed[(types[ct_id], object_id)] += quantity
+    return dict(consumed)
+
+
+def sell(user, quantities):
+    """Take sold stock for an order, counting the user's holds towards it. Must run inside the order's transaction.
+
+    `quantities` is {(product_type, id): quantity}. The user's holds are
+    consumed; whatever they don't cover is taken now and whatever they
+    over-cover is given back, with one UPDATE per product type whatever the
+    number of lines. Raises InsufficientStock if any product is short, so
+    the caller's transaction rolls back with the holds still in place.
+    """
+    deltas = defaultdict(dict)
+    held = consume_holds(user)
+    for key in set(quantities) | set(held):
+        delta = quantities.get(key, 0) - held.get(key, 0)
+        if delta:
+            product_type, pk = key
+            deltas[product_type][pk] = delta
+    levels = {}
+    shortages = []
+    with connection.cursor() as cursor:
+        for product_type, type_deltas in sorted(deltas.items()):
+            updated = _adjust(cursor, product_type, type_deltas)
+            levels.update(((product_type, pk), stock) for pk, stock in updated.items())
+            short = sorted(set(type_deltas) - set(updated))
+            if short:
+                available = dict(
+                    PRODUCT_MODELS[product_type].all_objects.filter(pk__in=short).values_list('id', 'stock_quantity')
+                )
+                shortages.extend(
+                    (product_type, pk, quantities.get((product_type, pk), 0), held.get((product_type, pk), 0) + available.get(pk, 0))
+                    for pk in short
+                )
+    if shortages:
+        raise InsufficientStock(shortages)
+    _stock_changed(levels)
+    return levels
+
+
+def release_expired(batch_size=SWEEP_BATCH_SIZE, now=None):
+    """Give back every hold past its expiry, `batch_size` holds per transaction. Returns the number released."""
+    types = _product_types_by_content_type()
+    table = connection.ops.quote_name(StockReservation._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(now or timezone.now())
+    released = 0
+    while True:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                claimed = _claim(
+                    cursor,
+                    f"id IN (SELECT id FROM {table} WHERE expires_at <= %s ORDER BY expires_at LIMIT %s)",
+                    [now, batch_size],
+                )
+                levels = _give_back(cursor, claimed, types)
+            _stock_changed(levels)
+        released += len(claimed)
+        if len(claimed) < batch_size:
+            break
+    if released:
+        logger.info(f"Released {released} expired stock holds")
+    return released
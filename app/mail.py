@@ -0,0 +1,177 @@
+"""
+Outbound email, queued in the database and sent by a background worker.
+
+Request handlers never talk to SMTP. queue() and queue_many() insert
+OutboundEmail rows in the caller's transaction, so an email exists exactly
+when the OTP, order or price change that caused it was committed, and the
+request doesn't wait on (or fail with) the mail server.
+
+`manage.py send_queued_email` calls send_due(), which leases due rows a batch
+at a time with one
+
+    UPDATE ... SET next_attempt_at = <lease end>, attempts = attempts + 1 ... RETURNING
+
+so two workers never send the same email, then sends the whole batch over a
+single SMTP connection. A failed send is retried with exponential backoff
+(RETRY_BASE_SECONDS doubling up to RETRY_MAX_SECONDS) and marked Failed after
+MAX_ATTEMPTS. A worker that dies mid-batch leaves its rows to come back when
+their lease ends.
+
+Messages are rendered from app/templates/app/emails/<kind>_subject.txt and
+<kind>.txt.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import OutboundEmail, Wishlist
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 6
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 60 * 60
+# How long a worker owns the rows it leased before another worker may take them
+LEASE_SECONDS = 5 * 60
+
+
+def render(kind, context):
+    """(subject, body) for an email of `kind`"""
+    subject = render_to_string(f'app/emails/{kind}_subject.txt', context)
+    body = render_to_string(f'app/emails/{kind}.txt', context)
+    return ' '.join(subject.split()), body
+
+
+def _message(kind, to_email, context):
+    subject, body = render(kind, context)
+    return OutboundEmail(kind=kind, to_email=to_email, subject=subject, body=body)
+
+
+def queue(kind, to_email, context):
+    """Queue one email for the worker; it's sent once the current transaction commits"""
+    message = _message(kind, to_email, context)
+    message.save()
+    return message
+
+
+def queue_many(kind, recipients):
+    """Queue one email per (to_email, context) with a single INSERT"""
+    return OutboundEmail.objects.bulk_create([_message(kind, to_email, context) for to_email, context in recipients])
+
+
+def site_url(path):
+    return getattr(settings, 'SITE_URL', '').rstrip('/') + path
+
+
+def queue_price_alerts(product_type, product, old_price):
+    """Tell everyone with `product` in their wishlist that its price dropped from `old_price`"""
+    if not product.is_active or not old_price or product.selling_price >= old_price:
+        return 0
+    # Percentages, not amounts: each customer sees prices in their own country's multiplier
+    percent_off = int((old_price - product.selling_price) * 100 / old_price)
+    if percent_off < 1:
+        return 0
+    recipients = Wishlist.objects.filter(
+        content_type=ContentType.objects.get_for_model(product), object_id=product.pk,
+    ).values_list('user__email', 'user__first_name')
+    context = {
+        'product_name': product.name,
+        'percent_off': percent_off,
+        'product_url': site_url(reverse(f'app:product_detail_{product_type}', args=[product.pk])),
+    }
+    queued = queue_many('price_alert', [
+        (email, {**context, 'first_name': first_name}) for email, first_name in recipients if email
+    ])
+    if queued:
+        logger.info(f"Queued {len(queued)} price alerts for {product_type} {product.pk} ({percent_off}% off)")
+    return len(queued)
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+
+
+def _lease(batch_size, now):
+    """Take up to `batch_size` due emails for this worker: [(id, to_email, subject, body, attempts), ...]"""
+    table = connection.ops.quote_name(OutboundEmail._meta.db_table)
+    due = connection.ops.adapt_datetimefield_value(now)
+    lease_end = connection.ops.adapt_datetimefield_value(now + timedelta(seconds=LEASE_SECONDS))
+    with connection.cursor() as cursor:
+        # The outer conditions are checked again after a concurrent worker's lease commits
+        cursor.execute(
+            f"UPDATE {table} SET next_attempt_at = %s, attempts = attempts + 1 "
+            f"WHERE status = 'Pending' AND next_attempt_at <= %s AND id IN ("
+            f"SELECT id FROM {table} WHERE status = 'Pending' AND next_attempt_at <= %s "
+            f"ORDER BY next_attempt_at LIMIT %s) "
+            f"RETURNING id, to_email, subject, body, attempts",
+            [lease_end, due, due, batch_size],
+        )
+        return cursor.fetchall()
+
+
+def _record_failure(email_id, attempts, error, now):
+    if attempts >= MAX_ATTEMPTS:
+        OutboundEmail.objects.filter(pk=email_id).update(status='Failed', last_error=error)
+        logger.error(f"Giving up on email {email_id} after {attempts} attempts: {error}")
+    else:
+        OutboundEmail.objects.filter(pk=email_id).update(
+            next_attempt_at=now + timedelta(seconds=retry_delay(attempts)), last_error=error,
+        )
+
+
+def _send_batch(rows, now):
+    """Send leased rows over one SMTP connection. Returns the number sent."""
+    sent_ids = []
+    smtp = get_connection()
+    try:
+        smtp.open()
+    except Exception as e:
+        # The server is down: every row waits for its backoff, and the worker stops this run
+        for email_id, _, _, _, attempts in rows:
+            _record_failure(email_id, attempts, f'connect: {e}', now)
+        raise
+    try:
+        for email_id, to_email, subject, body, attempts in rows:
+            message = EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [to_email], connection=smtp)
+            try:
+                message.send()
+                sent_ids.append(email_id)
+            except Exception as e:
+                _record_failure(email_id, attempts, str(e), now)
+                # The connection may be unusable after an error; start the rest of the batch on a new one
+                smtp.close()
+                smtp.open()
+    finally:
+        smtp.close()
+        if sent_ids:
+            OutboundEmail.objects.filter(pk__in=sent_ids).update(status='Sent', sent_at=timezone.now(), last_error='')
+    return len(sent_ids)
+
+
+def send_due(batch_size=BATCH_SIZE, now=None):
+    """Send every email that is due, `batch_size` per SMTP connection. Returns (sent, attempted)."""
+    now = now or timezone.now()
+    sent = attempted = 0
+    while True:
+        rows = _lease(batch_size, now)
+        if not rows:
+            break
+        attempted += len(rows)
+        try:
+            sent += _send_batch(rows, now)
+        except Exception as e:
+            logger.warning(f"Mail server unavailable, will retry: {e}")
+            break
+        if len(rows) < batch_size:
+            break
+    if attempted:
+        logger.info(f"Sent {sent} of {attempted} queued emails")
+    return sent, attempted
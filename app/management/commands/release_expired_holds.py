@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand
+from app.inventory import SWEEP_BATCH_SIZE, release_expired
+
+class Command(BaseCommand):
+    help = 'Give expired checkout stock holds back to stock; run from cron, or with --loop as a sweeper process'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=SWEEP_BATCH_SIZE,
+            help='Holds released per transaction'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep sweeping until interrupted'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=30.0,
+            help='Seconds between sweeps with --loop'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired(batch_size=options['batch_size'])
+            if released or not options['loop']:
+                self.stdout.write(f'Released {released} expired holds')
+            if not options['loop']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
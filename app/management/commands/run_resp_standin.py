@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from app.resp import StandInServer
+
+class Command(BaseCommand):
+    help = 'Run the in-memory Redis-protocol stand-in server (development and tests only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to bind')
+        parser.add_argument('--port', type=int, default=6379, help='Port to listen on')
+
+    def handle(self, *args, **options):
+        server = StandInServer(options['host'], options['port'])
+        self.stdout.write(self.style.SUCCESS(f'RESP stand-in listening on {server.url}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,54 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from app.tasks import run_worker, summarize
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (app/tasks.py) on a thread or process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Tasks run at the same time'
+        )
+        parser.add_argument(
+            '--pool',
+            choices=['thread', 'process'],
+            default='thread',
+            help='Run tasks on threads, or on processes for CPU-bound work'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Seconds between checks for due tasks when idle'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run what is due, then exit (for cron)'
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Print per-task counts and timings for the last 24 hours, then exit'
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for row in summarize(timezone.now() - timedelta(hours=24)):
+                self.stdout.write(
+                    f"{row['name']}: {row['runs']} runs, {row['failed']} failed, "
+                    f"avg wait {row['avg_wait_ms'] or 0:.0f}ms, avg {row['avg_ms'] or 0:.0f}ms, max {row['max_ms'] or 0:.0f}ms"
+                )
+            return
+        stats = run_worker(
+            concurrency=options['concurrency'],
+            pool=options['pool'],
+            poll_interval=options['interval'],
+            once=options['once'],
+        )
+        for name, s in sorted(stats.snapshot().items()):
+            self.stdout.write(f"{name}: {s['runs']} runs, {s['failures']} failed, avg {s['total_ms'] / s['runs']:.0f}ms")
@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand
+from app.mail import BATCH_SIZE, send_due
+
+class Command(BaseCommand):
+    help = 'Send queued outbound email over pooled SMTP connections; run from cron, or with --loop as a worker process'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Emails sent per SMTP connection'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep sending until interrupted'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds between checks for due email with --loop'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            sent, attempted = send_due(batch_size=options['batch_size'])
+            if attempted or not options['loop']:
+                self.stdout.write(f'Sent {sent} of {attempted} emails')
+            if not options['loop']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
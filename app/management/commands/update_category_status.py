@@ -5,6 +5,7 @@ from app.models import (
     GoldSubCategory, SilverSubCategory, ImitationSubCategory,
     GoldProduct, SilverProduct, ImitationProduct
 )
+from app.cache import invalidate_tags, TAG_CATEGORIES, TAG_PRODUCTS
 
 class Command(BaseCommand):
     help = 'Update category and subcategory active status and show impact on products'
@@ -174,6 +175,8 @@ class Command(BaseCommand):
         
         if not dry_run:
             categories.update(is_active=status)
+            # queryset.update() bypasses post_save, so invalidate explicitly
+            invalidate_tags(TAG_CATEGORIES, TAG_PRODUCTS)
             self.stdout.write(
                 self.style.SUCCESS(f'Updated all {category_type} categories')
             )
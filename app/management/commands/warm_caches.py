@@ -0,0 +1,56 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from app.warmup import WARMERS, DEFAULT_DETAIL_LIMIT, warm_caches
+
+class Command(BaseCommand):
+    help = 'Prime the shared caches (nav tree, home rails, price bounds, product payloads) and report timings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            nargs='+',
+            choices=sorted(WARMERS),
+            help='Warm only these steps'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of steps to run in parallel'
+        )
+        parser.add_argument(
+            '--detail-limit',
+            type=int,
+            default=DEFAULT_DETAIL_LIMIT,
+            help='Most recently updated products per type to warm detail payloads for (0 for all)'
+        )
+        parser.add_argument(
+            '--write-snapshot',
+            action='store_true',
+            help='Also write the cache snapshot file that workers load at boot'
+        )
+
+    def handle(self, *args, **options):
+        report = warm_caches(
+            names=options['only'],
+            workers=options['workers'],
+            detail_limit=options['detail_limit'] or None,
+        )
+
+        failed = []
+        for name, step in report.items():
+            if step['error']:
+                failed.append(name)
+                self.stdout.write(self.style.ERROR(f'  • {name}: failed after {step["seconds"]:.3f}s ({step["error"]})'))
+            else:
+                self.stdout.write(f'  • {name}: {step["seconds"]:.3f}s')
+
+        if options['write_snapshot']:
+            from app.snapshot import snapshot_path, write_snapshot
+            started = time.perf_counter()
+            write_snapshot()
+            self.stdout.write(f'  • snapshot: {time.perf_counter() - started:.3f}s ({snapshot_path()})')
+
+        if failed:
+            raise CommandError(f'Warm-up failed for: {", ".join(failed)}')
+        self.stdout.write(self.style.SUCCESS('Caches warmed'))
@@ -1,16 +1,105 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.shortcuts import redirect
 from django.urls import resolve
+from . import idempotency
+from .invalidation import poll_bus, poll_bus_due
 from .models import GoldProduct, SilverProduct, ImitationProduct
 
+
+class InvalidationBusMiddleware:
+    """
+    Apply cache invalidations published by other workers before handling a request
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        poll_bus()
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if poll_bus_due():
+            await sync_to_async(poll_bus)()
+        return await self.get_response(request)
+
+
+class IdempotencyKeyMiddleware:
+    """
+    Replay the stored response for a retried POST with the same Idempotency-Key (app/idempotency.py)
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.view_names = frozenset(idempotency.config()['VIEWS'])
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        claim = getattr(request, '_idempotency_claim', None)
+        if claim:
+            idempotency.finish(*claim, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        claim = getattr(request, '_idempotency_claim', None)
+        if claim:
+            await sync_to_async(idempotency.finish)(*claim, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method != 'POST' or idempotency.HEADER not in request.headers:
+            return None
+        if request.resolver_match.view_name not in self.view_names:
+            return None
+        claim, response = idempotency.begin(request)
+        if claim:
+            request._idempotency_claim = claim
+        return response
+
+
 class CategoryActiveMiddleware:
     """
     Middleware to automatically redirect users from inactive category product pages
     """
-    
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        product = self._product_detail_target(request)
+        if product and self._is_unavailable(*product):
+            return redirect('app:home')
+        response = self.get_response(request)
+        return response
+
+    async def __acall__(self, request):
+        product = self._product_detail_target(request)
+        if product and await sync_to_async(self._is_unavailable)(*product):
+            return redirect('app:home')
+        return await self.get_response(request)
+
+    @staticmethod
+    def _product_detail_target(request):
+        """Return (model, pk) if this is a product detail page, without touching the database"""
         # Check if this is a product detail page
         try:
             resolved = resolve(request.path)
@@ -27,14 +116,17 @@ class CategoryActiveMiddleware:
                     
                     model = model_map.get(product_type.lower())
                     if model:
-                        try:
-                            product = model.all_objects.select_related('category', 'subcategory').get(pk=pk)
-                            if not product.is_available():
-                                return redirect('app:home')
-                        except model.DoesNotExist:
-                            pass  # Let the view handle 404
+                        return model, pk
         except Exception:
             pass  # Continue with normal processing
-        
-        response = self.get_response(request)
-        return response
+        return None
+
+    @staticmethod
+    def _is_unavailable(model, pk):
+        try:
+            product = model.all_objects.select_related('category', 'subcategory').get(pk=pk)
+            return not product.is_available()
+        except model.DoesNotExist:
+            return False  # Let the view handle 404
+        except Exception:
+            return False
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:12
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_rows(apps, schema_editor):
+    """Fold duplicate (user, product) cart rows into the oldest one, summing quantities"""
+    Cart = apps.get_model('app', 'Cart')
+    duplicates = (
+        Cart.objects.values('user_id', 'content_type_id', 'object_id')
+        .annotate(rows=Count('id'), first_id=Min('id'), total=Sum('quantity'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates:
+        rows = Cart.objects.filter(
+            user_id=group['user_id'],
+            content_type_id=group['content_type_id'],
+            object_id=group['object_id'],
+        )
+        rows.filter(id=group['first_id']).update(quantity=group['total'])
+        rows.exclude(id=group['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_user_resource_versions'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'content_type', 'object_id'), name='unique_cart_item'),
+        ),
+    ]
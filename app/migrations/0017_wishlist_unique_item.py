@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:03
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def drop_duplicate_wishlist_rows(apps, schema_editor):
+    """Keep only the oldest wishlist row per (user, product)"""
+    Wishlist = apps.get_model('app', 'Wishlist')
+    duplicates = (
+        Wishlist.objects.values('user_id', 'content_type_id', 'object_id')
+        .annotate(rows=Count('id'), first_id=Min('id'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates:
+        Wishlist.objects.filter(
+            user_id=group['user_id'],
+            content_type_id=group['content_type_id'],
+            object_id=group['object_id'],
+        ).exclude(id=group['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_cart_unique_item'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_wishlist_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='wishlist',
+            constraint=models.UniqueConstraint(fields=('user', 'content_type', 'object_id'), name='unique_wishlist_item'),
+        ),
+    ]
@@ -276,6 +276,10 @@ class User(models.Model):
     gender_choices = [('Male', 'Male'), ('Female', 'Female'), ('Other', 'Other')]
     gender = models.CharField(max_length=10, choices=gender_choices, blank=True, null=True, default='Male')
     created_at = models.DateTimeField(default=timezone.now)
+    # Bumped on every mutation; used as ETags by the cart/wishlist/profile APIs
+    cart_version = models.PositiveIntegerField(default=0)
+    wishlist_version = models.PositiveIntegerField(default=0)
+    profile_version = models.PositiveIntegerField(default=0)
     class Meta:
         verbose_name = "User"
         verbose_name_plural = "User"
@@ -322,6 +326,9 @@ class Wishlist(models.Model):
     class Meta:
         verbose_name = "Wishlist"
         verbose_name_plural = "Wishlist"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'content_type', 'object_id'], name='unique_wishlist_item'),
+        ]
     def __str__(self):
         return f"{self.user} - {self.product}"
 
@@ -335,15 +342,25 @@ class Cart(models.Model):
     class Meta:
         verbose_name = "Cart"
         verbose_name_plural = "Cart"
+        constraints = [
+            # One row per product per user; CartService.add_to_cart upserts into it
+            models.UniqueConstraint(fields=['user', 'content_type', 'object_id'], name='unique_cart_item'),
+        ]
     def __str__(self):
         return f"{self.user} - {self.product} ({self.quantity})"
 
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders', default=1)
+    # Single-product orders from before OrderLine; orders placed at checkout leave these empty
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True)
     object_id = models.PositiveIntegerField(null=True, blank=True)
     product = GenericForeignKey('content_type', 'object_id')
     quantity = models.PositiveIntegerField(default=1)
+    # Totals are computed once from the line snapshots when the order is placed
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    discount_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     ordered_at = models.DateTimeField(default=timezone.now)
     status_choices = [('Pending', 'Pending'), ('Completed', 'Completed'), ('Cancelled', 'Cancelled')]
     status = models.CharField(max_length=20, choices=status_choices, default='Pending')
@@ -351,7 +368,40 @@ class Order(models.Model):
         verbose_name = "Order"
         verbose_name_plural = "Order"
     def __str__(self):
-        return f"{self.user} - {self.product} ({self.status})"
+        if self.product:
+            return f"{self.user} - {self.product} ({self.status})"
+        return f"{self.user} - Order #{self.pk} ({self.status})"
+
+class OrderLine(models.Model):
+    """One product in an order, with its name and price as they were when the order was placed."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines')
+    content_type = models.ForeignKey(ContentType, on_delete=models.PROTECT)
+    object_id = models.PositiveIntegerField()
+    product = GenericForeignKey('content_type', 'object_id')
+    product_name = models.CharField(max_length=200)
+    unit_price = models.DecimalField(max_digits=12, decimal_places=2)
+    quantity = models.PositiveIntegerField()
+    line_total = models.DecimalField(max_digits=12, decimal_places=2)
+    class Meta:
+        verbose_name = "Order Line"
+        verbose_name_plural = "Order Lines"
+    def __str__(self):
+        return f"{self.product_name} x {self.quantity}"
+
+class StockReservation(models.Model):
+    """A checkout's hold on stock. The quantity is already off the product's stock_quantity (app/inventory.py)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_reservations')
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    product = GenericForeignKey('content_type', 'object_id')
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+    class Meta:
+        verbose_name = "Stock Reservation"
+        verbose_name_plural = "Stock Reservations"
+    def __str__(self):
+        return f"{self.user} - {self.product} ({self.quantity})"
 
 class Payment(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='payments', default=1)
@@ -429,3 +479,72 @@ class PasswordResetOTP(models.Model):
     
     def __str__(self):
         return f"OTP for {self.email} - {self.otp}"
+
+class OutboundEmail(models.Model):
+    """An email waiting to be sent, or already sent, by `manage.py send_queued_email` (app/mail.py)."""
+    KIND_CHOICES = [
+        ('otp', 'Password Reset OTP'),
+        ('order_confirmation', 'Order Confirmation'),
+        ('price_alert', 'Price Alert'),
+    ]
+    STATUS_CHOICES = [('Pending', 'Pending'), ('Sent', 'Sent'), ('Failed', 'Failed')]
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
+    attempts = models.PositiveIntegerField(default=0)
+    # When the worker may (re)try: the retry backoff, or the lease of the worker currently sending it
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Outbound Email"
+        verbose_name_plural = "Outbound Emails"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} to {self.to_email} ({self.status})"
+
+class Task(models.Model):
+    """A unit of deferred work for `manage.py run_worker` (app/tasks.py)."""
+    STATUS_CHOICES = [('Pending', 'Pending'), ('Running', 'Running'), ('Done', 'Done'), ('Failed', 'Failed')]
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # At most one pending task per key: repeated enqueues before it runs collapse into one
+    unique_key = models.CharField(max_length=200, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    # While Running: when the worker's claim lapses and another worker may take the task
+    locked_until = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    wait_ms = models.FloatField(null=True, blank=True)
+    duration_ms = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Task"
+        verbose_name_plural = "Tasks"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='task_due'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['unique_key'], condition=models.Q(status='Pending'), name='unique_pending_task',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
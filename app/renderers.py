@@ -0,0 +1,165 @@
+"""
+Response serialization for the JSON APIs, with MessagePack negotiation.
+
+Each endpoint declares a Schema: the fields it sends, where each value comes
+from (an attribute name or a callable) and an optional converter. Rows are
+encoded straight from the source objects (cards, cart tuples, the user
+profile) using pre-encoded keys, so no per-row dict is built just to be
+serialized.
+
+JSON goes through orjson when it is installed. Clients sending
+`Accept: application/msgpack` get MessagePack when msgpack is installed and
+JSON otherwise. Money is always sent as a string with two decimal places.
+"""
+import datetime
+import json
+from decimal import Decimal
+from operator import attrgetter
+
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional speed-up
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack is optional
+    msgpack = None
+
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+MSGPACK_ACCEPT = (MSGPACK_CONTENT_TYPE, 'application/x-msgpack')
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not serializable')
+
+
+if orjson is not None:
+    def dumps(value):
+        return orjson.dumps(value, default=_default)
+else:
+    _encoder = json.JSONEncoder(separators=(',', ':'), default=_default)
+
+    def dumps(value):
+        return _encoder.encode(value).encode('utf-8')
+
+
+def money(value):
+    """Canonical money representation: '1234.50'"""
+    return f'{Decimal(value or 0):.2f}'
+
+
+def wants_msgpack(request):
+    if msgpack is None:
+        return False
+    accept = request.headers.get('Accept', '')
+    return any(media_type in accept for media_type in MSGPACK_ACCEPT)
+
+
+class Field:
+    __slots__ = ('name', 'get', 'convert')
+
+    def __init__(self, name, source=None, convert=None):
+        """`source` is an attribute name (default: `name`) or a callable taking the object"""
+        self.name = name
+        source = source or name
+        self.get = source if callable(source) else attrgetter(source)
+        self.convert = convert
+
+
+class Schema:
+    """Ordered fields of one object shape; a field's converter may be another Schema"""
+
+    def __init__(self, *fields):
+        self.fields = fields
+        self._json_keys = [
+            (b'{' if i == 0 else b',') + dumps(field.name) + b':' for i, field in enumerate(fields)
+        ]
+        self._msgpack_keys = [msgpack.packb(field.name) for field in fields] if msgpack else None
+
+    def _values(self, obj):
+        for field in self.fields:
+            value = field.get(obj)
+            if isinstance(field.convert, Schema):
+                yield Bound(field.convert, value)
+            elif field.convert is not None:
+                yield field.convert(value)
+            else:
+                yield value
+
+    def json_row(self, obj):
+        parts = []
+        for key, value in zip(self._json_keys, self._values(obj)):
+            parts.append(key)
+            parts.append(encode_json(value))
+        parts.append(b'}' if parts else b'{}')
+        return b''.join(parts)
+
+    def msgpack_row(self, obj, packer):
+        parts = [packer.pack_map_header(len(self.fields))]
+        for key, value in zip(self._msgpack_keys, self._values(obj)):
+            parts.append(key)
+            parts.append(encode_msgpack(value, packer))
+        return b''.join(parts)
+
+    def one(self, obj):
+        return Bound(self, obj)
+
+    def many(self, objects):
+        return Bound(self, objects, many=True)
+
+
+class Bound:
+    """A schema applied to one object or an iterable of objects, placed inside a response envelope"""
+    __slots__ = ('schema', 'value', 'many')
+
+    def __init__(self, schema, value, many=False):
+        self.schema = schema
+        self.value = value
+        self.many = many
+
+
+def encode_json(value):
+    if isinstance(value, Bound):
+        if value.many:
+            return b'[' + b','.join(value.schema.json_row(obj) for obj in value.value) + b']'
+        return b'null' if value.value is None else value.schema.json_row(value.value)
+    if isinstance(value, dict) and any(isinstance(v, Bound) for v in value.values()):
+        return b'{' + b','.join(dumps(str(k)) + b':' + encode_json(v) for k, v in value.items()) + b'}'
+    return dumps(value)
+
+
+def encode_msgpack(value, packer):
+    if isinstance(value, Bound):
+        if value.many:
+            rows = [value.schema.msgpack_row(obj, packer) for obj in value.value]
+            return packer.pack_array_header(len(rows)) + b''.join(rows)
+        return packer.pack(None) if value.value is None else value.schema.msgpack_row(value.value, packer)
+    if isinstance(value, dict):
+        parts = [packer.pack_map_header(len(value))]
+        for k, v in value.items():
+            parts.append(packer.pack(str(k)))
+            parts.append(encode_msgpack(v, packer))
+        return b''.join(parts)
+    if isinstance(value, (list, tuple)):
+        return packer.pack_array_header(len(value)) + b''.join(encode_msgpack(v, packer) for v in value)
+    return packer.pack(value)
+
+
+def api_response(request, data, status=200):
+    """Serialize `data` (a dict whose values may be Schema.one()/many()) as MessagePack or JSON"""
+    if wants_msgpack(request):
+        packer = msgpack.Packer(default=_default)
+        response = HttpResponse(encode_msgpack(data, packer), content_type=MSGPACK_CONTENT_TYPE, status=status)
+    else:
+        response = HttpResponse(encode_json(data), content_type=JSON_CONTENT_TYPE, status=status)
+    patch_vary_headers(response, ('Accept',))
+    return response
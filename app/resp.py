@@ -0,0 +1,372 @@
+"""
+Minimal Redis-protocol (RESP2) client and a local stand-in server.
+
+The client covers the handful of commands the cache and invalidation layers
+need, without requiring redis-py. The stand-in server keeps everything in
+memory and is meant for development and tests (`manage.py run_resp_standin`).
+"""
+import fnmatch
+import logging
+import socket
+import socketserver
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RespError(Exception):
+    """Error reply from the server or a protocol violation"""
+
+
+def encode_command(*args):
+    parts = [f'*{len(args)}\r\n'.encode()]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        else:
+            data = str(arg).encode('utf-8')
+        parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+    return b''.join(parts)
+
+
+def read_reply(stream):
+    """Read one RESP reply from a buffered binary stream"""
+    line = stream.readline()
+    if not line:
+        raise ConnectionError('Connection closed by server')
+    prefix, body = line[:1], line[1:-2]
+    if prefix == b'+':
+        return body.decode('utf-8')
+    if prefix == b'-':
+        raise RespError(body.decode('utf-8'))
+    if prefix == b':':
+        return int(body)
+    if prefix == b'$':
+        length = int(body)
+        if length == -1:
+            return None
+        data = stream.read(length + 2)
+        return data[:-2]
+    if prefix == b'*':
+        count = int(body)
+        if count == -1:
+            return None
+        return [read_reply(stream) for _ in range(count)]
+    raise RespError(f'Unexpected reply prefix: {prefix!r}')
+
+
+# Commands that can be sent again when the reply is lost: nothing happens twice
+RESENDABLE_COMMANDS = frozenset({'GET', 'MGET', 'HGETALL', 'PING'})
+
+
+def _resendable(commands):
+    return all(str(command[0]).upper() in RESENDABLE_COMMANDS for command in commands)
+
+
+class _Connection:
+    __slots__ = ('sock', 'stream')
+
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.stream = self.sock.makefile('rb')
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.sock.close()
+
+
+class RespClient:
+    """Blocking RESP client with a small pool of connections, reconnecting on failure.
+
+    Each call checks a connection out for its round trip, so threads don't
+    queue behind each other's cache calls; at most `max_idle` connections
+    are kept open between calls.
+    """
+
+    def __init__(self, host='127.0.0.1', port=6379, timeout=1.0, max_idle=8):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = []
+        self._subscriber = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url, timeout=1.0):
+        # redis://host:port[/db] - the db index is ignored by the stand-in
+        address = url.split('://', 1)[-1].split('/', 1)[0]
+        host, _, port = address.partition(':')
+        return cls(host or '127.0.0.1', int(port or 6379), timeout)
+
+    def _connect(self):
+        return _Connection(self.host, self.port, self.timeout)
+
+    def _checkout(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def _checkin(self, conn):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            conns, self._idle = self._idle, []
+            if self._subscriber is not None:
+                conns.append(self._subscriber)
+                self._subscriber = None
+        for conn in conns:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def subscribe(self, *channels):
+        """SUBSCRIBE and yield (channel, message) until the connection drops.
+
+        The connection stays in subscriber mode until close().
+        """
+        conn = self._connect()
+        with self._lock:
+            self._subscriber = conn
+        conn.sock.sendall(encode_command('SUBSCRIBE', *channels))
+        for _ in channels:
+            read_reply(conn.stream)
+        while True:
+            reply = read_reply(conn.stream)
+            if reply[0] == b'message':
+                yield reply[1], reply[2]
+
+    def execute(self, *args):
+        return self.pipeline([args])[0]
+
+    def pipeline(self, commands):
+        """Send several commands in one round trip and return their replies.
+
+        A connection the server closed while idle usually fails on the read,
+        so read-only pipelines are sent once more on a fresh connection.
+        Others are not: the server may have applied them, and resending could
+        run INCR/HINCRBY twice.
+        """
+        payload = b''.join(encode_command(*cmd) for cmd in commands)
+        resendable = _resendable(commands)
+        for attempt in (1, 2):
+            conn = self._checkout() if attempt == 1 else self._connect()
+            try:
+                conn.sock.sendall(payload)
+            except OSError:
+                # Nothing was delivered (or the connection was stale): safe to send again
+                conn.close()
+                if attempt == 2:
+                    raise
+                continue
+            try:
+                replies = self._read_replies(conn, len(commands))
+            except OSError:
+                conn.close()
+                if attempt == 2 or not resendable:
+                    raise
+                continue
+            self._checkin(conn)
+            return replies
+
+    @staticmethod
+    def _read_replies(conn, count):
+        replies = []
+        for _ in range(count):
+            try:
+                replies.append(read_reply(conn.stream))
+            except RespError as e:
+                replies.append(e)
+        return replies
+
+
+class _Store:
+    """Shared in-memory keyspace for the stand-in server"""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+        self.subscribers = {}
+
+    def _alive(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+
+class _StandInHandler(socketserver.StreamRequestHandler):
+    # Pipelined replies are written one by one; don't let Nagle hold them for the client's ACK
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            try:
+                command = read_reply(self.rfile)
+            except (ConnectionError, OSError, ValueError):
+                return
+            if not isinstance(command, list) or not command:
+                return
+            name = command[0].decode().upper()
+            args = command[1:]
+            if name == 'SUBSCRIBE':
+                self._subscribe(store, args)
+                return
+            try:
+                with store.lock:
+                    reply = self.dispatch(store, name, args)
+            except RespError as e:
+                reply = e
+            except (ValueError, IndexError):
+                reply = RespError('ERR wrong number or type of arguments')
+            try:
+                self.wfile.write(encode_reply(reply))
+            except OSError:
+                return
+
+    def _subscribe(self, store, channels):
+        """Enter subscriber mode: this connection only receives published messages"""
+        with store.lock:
+            for channel in channels:
+                store.subscribers.setdefault(channel, []).append(self.wfile)
+        for i, channel in enumerate(channels, 1):
+            self.wfile.write(encode_reply([b'subscribe', channel, i]))
+        try:
+            # Block until the client disconnects
+            while self.rfile.read(1):
+                pass
+        finally:
+            with store.lock:
+                for channel in channels:
+                    listeners = store.subscribers.get(channel, [])
+                    if self.wfile in listeners:
+                        listeners.remove(self.wfile)
+
+    def dispatch(self, store, name, args):
+        data = store.data
+        if name == 'PING':
+            return 'PONG'
+        if name == 'GET':
+            return data.get(args[0]) if store._alive(args[0]) else None
+        if name == 'MGET':
+            return [data.get(k) if store._alive(k) else None for k in args]
+        if name == 'SET':
+            key, value, options = args[0], args[1], [a.decode().upper() for a in args[2:]]
+            if 'NX' in options and store._alive(key):
+                return None
+            data[key] = value
+            store.expires.pop(key, None)
+            for unit, scale in (('EX', 1), ('PX', 0.001)):
+                if unit in options:
+                    store.expires[key] = time.time() + int(options[options.index(unit) + 1]) * scale
+            return 'OK'
+        if name == 'DEL':
+            removed = 0
+            for key in args:
+                if store._alive(key):
+                    removed += 1
+                data.pop(key, None)
+                store.expires.pop(key, None)
+            return removed
+        if name in ('INCR', 'INCRBY'):
+            key = args[0]
+            amount = int(args[1]) if name == 'INCRBY' else 1
+            value = int(data[key]) if store._alive(key) else 0
+            value += amount
+            data[key] = str(value).encode()
+            return value
+        if name == 'HINCRBY':
+            key, field, amount = args[0], args[1], int(args[2])
+            table = data.setdefault(key, {})
+            table[field] = int(table.get(field, 0)) + amount
+            return table[field]
+        if name == 'HGETALL':
+            table = data.get(args[0]) if store._alive(args[0]) else None
+            reply = []
+            for field, value in (table or {}).items():
+                reply += [field, str(value).encode()]
+            return reply
+        if name == 'EXPIRE':
+            if not store._alive(args[0]):
+                return 0
+            store.expires[args[0]] = time.time() + int(args[1])
+            return 1
+        if name == 'PEXPIRE':
+            if not store._alive(args[0]):
+                return 0
+            store.expires[args[0]] = time.time() + int(args[1]) / 1000
+            return 1
+        if name == 'PERSIST':
+            return 1 if store._alive(args[0]) and store.expires.pop(args[0], None) is not None else 0
+        if name == 'KEYS':
+            pattern = args[0].decode()
+            return [k for k in list(data) if store._alive(k) and fnmatch.fnmatchcase(k.decode(), pattern)]
+        if name == 'FLUSHALL':
+            data.clear()
+            store.expires.clear()
+            return 'OK'
+        if name == 'PUBLISH':
+            channel, message = args[0], args[1]
+            delivered = 0
+            for wfile in list(store.subscribers.get(channel, [])):
+                try:
+                    wfile.write(encode_reply([b'message', channel, message]))
+                    delivered += 1
+                except OSError:
+                    store.subscribers[channel].remove(wfile)
+            return delivered
+        raise RespError(f'ERR unknown command {name}')
+
+
+def encode_reply(reply):
+    if isinstance(reply, RespError):
+        return b'-%s\r\n' % str(reply).encode()
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, bool):
+        return b':%d\r\n' % int(reply)
+    if isinstance(reply, int):
+        return b':%d\r\n' % reply
+    if isinstance(reply, str):
+        return b'+%s\r\n' % reply.encode()
+    if isinstance(reply, bytes):
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+    if isinstance(reply, list):
+        return b'*%d\r\n' % len(reply) + b''.join(encode_reply(item) for item in reply)
+    raise TypeError(f'Cannot encode {type(reply).__name__}')
+
+
+class StandInServer(socketserver.ThreadingTCPServer):
+    """In-memory Redis-protocol server for local development and tests"""
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), _StandInHandler)
+        self.store = _Store()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'redis://{host}:{port}'
+
+    def start(self):
+        """Serve from a daemon thread and return self"""
+        thread = threading.Thread(target=self.serve_forever, name='resp-standin', daemon=True)
+        thread.start()
+        return self
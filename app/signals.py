@@ -0,0 +1,132 @@
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import (
+    invalidate_tags, TAG_PRODUCTS, TAG_CATEGORIES, TAG_CAROUSEL, TAG_PRICING,
+)
+from .events import publish_stock, publish_user_counts
+from .tasks import schedule_catalog_rebuild, send_price_alerts
+from .models import (
+    Category, GoldCategory, SilverCategory, ImitationCategory,
+    GoldSubCategory, SilverSubCategory, ImitationSubCategory,
+    GoldProduct, SilverProduct, ImitationProduct,
+    CarouselSlider, CountryMultiplier, User, Cart, Wishlist,
+)
+
+PRODUCT_MODELS = (GoldProduct, SilverProduct, ImitationProduct)
+CATEGORY_MODELS = (
+    GoldCategory, SilverCategory, ImitationCategory,
+    GoldSubCategory, SilverSubCategory, ImitationSubCategory,
+)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_top_category(sender, **kwargs):
+    # Top-level toggles cascade to every category and product via queryset.update()
+    invalidate_tags(TAG_CATEGORIES, TAG_PRODUCTS)
+    schedule_catalog_rebuild()
+
+
+def invalidate_category(sender, **kwargs):
+    # Category visibility changes which products are listed
+    invalidate_tags(TAG_CATEGORIES, TAG_PRODUCTS)
+    schedule_catalog_rebuild()
+
+
+def invalidate_product(sender, **kwargs):
+    invalidate_tags(TAG_PRODUCTS)
+    schedule_catalog_rebuild()
+
+
+for _model in CATEGORY_MODELS:
+    post_save.connect(invalidate_category, sender=_model, dispatch_uid=f'invalidate_{_model.__name__}_save')
+    post_delete.connect(invalidate_category, sender=_model, dispatch_uid=f'invalidate_{_model.__name__}_delete')
+
+PRODUCT_TYPES = {GoldProduct: 'gold', SilverProduct: 'silver', ImitationProduct: 'imitation'}
+
+
+def remember_stock_and_price(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        before = sender.all_objects.filter(pk=instance.pk).values_list('stock_quantity', 'selling_price').first()
+        if before:
+            instance._stock_before, instance._price_before = before
+
+
+def publish_stock_change(sender, instance, created, raw=False, **kwargs):
+    # Only real changes: a save that leaves stock alone shouldn't touch open product pages
+    if not created and not raw and hasattr(instance, '_stock_before') and instance._stock_before != instance.stock_quantity:
+        publish_stock(PRODUCT_TYPES[sender], instance.pk, instance.stock_quantity)
+
+
+def queue_price_alerts(sender, instance, created, raw=False, **kwargs):
+    # The wishlist fan-out runs on the task worker, not in the admin save
+    if not created and not raw and hasattr(instance, '_price_before') and instance.selling_price < instance._price_before:
+        send_price_alerts.delay(PRODUCT_TYPES[sender], instance.pk, str(instance._price_before))
+
+
+for _model in PRODUCT_MODELS:
+    post_save.connect(invalidate_product, sender=_model, dispatch_uid=f'invalidate_{_model.__name__}_save')
+    post_delete.connect(invalidate_product, sender=_model, dispatch_uid=f'invalidate_{_model.__name__}_delete')
+    pre_save.connect(remember_stock_and_price, sender=_model, dispatch_uid=f'remember_stock_{_model.__name__}')
+    post_save.connect(publish_stock_change, sender=_model, dispatch_uid=f'publish_stock_{_model.__name__}')
+    post_save.connect(queue_price_alerts, sender=_model, dispatch_uid=f'price_alerts_{_model.__name__}')
+
+
+@receiver([post_save, post_delete], sender=CarouselSlider)
+def invalidate_carousel(sender, **kwargs):
+    invalidate_tags(TAG_CAROUSEL)
+
+
+@receiver([post_save, post_delete], sender=CountryMultiplier)
+def invalidate_pricing(sender, **kwargs):
+    invalidate_tags(TAG_PRICING)
+    # Multipliers are part of the cache snapshot
+    schedule_catalog_rebuild()
+
+
+USER_VERSION_FIELDS = ('cart_version', 'wishlist_version', 'profile_version')
+
+
+def bump_user_version(user_id, field):
+    """Increment one of the per-user resource versions without firing signals"""
+    if user_id:
+        User.objects.filter(pk=user_id).update(**{field: F(field) + 1})
+
+
+def cart_changed(user_id):
+    """Bookkeeping after any write to a user's cart; call directly for writes that bypass signals"""
+    bump_user_version(user_id, 'cart_version')
+    publish_user_counts(user_id)
+
+
+@receiver([post_save, post_delete], sender=Cart)
+def bump_cart_version(sender, instance, **kwargs):
+    cart_changed(instance.user_id)
+
+
+def wishlist_changed(user_id):
+    """Bookkeeping after any write to a user's wishlist; call directly for writes that bypass signals"""
+    bump_user_version(user_id, 'wishlist_version')
+    publish_user_counts(user_id)
+
+
+@receiver([post_save, post_delete], sender=Wishlist)
+def bump_wishlist_version(sender, instance, **kwargs):
+    wishlist_changed(instance.user_id)
+
+
+@receiver(pre_save, sender=User)
+def keep_user_versions(sender, instance, **kwargs):
+    # Versions are only changed by atomic F() updates; never write back stale copies
+    if instance.pk and not kwargs.get('raw'):
+        current = User.objects.filter(pk=instance.pk).values(*USER_VERSION_FIELDS).first()
+        if current:
+            for field, value in current.items():
+                setattr(instance, field, value)
+
+
+@receiver(post_save, sender=User)
+def bump_profile_version(sender, instance, created, **kwargs):
+    if not created:
+        bump_user_version(instance.pk, 'profile_version')
@@ -0,0 +1,192 @@
+"""
+Persisted snapshot of catalog-derived caches.
+
+One worker (whichever takes the lock first) builds the nav tree,
+availability sets, multipliers, price bounds and related-product index and
+writes them to settings.CACHE_SNAPSHOT_PATH. Other workers mmap the file
+and prime their caches from it instead of rebuilding from the database.
+
+File layout:
+
+    MAGIC (8 bytes) | header length (uint32, big-endian) | header JSON | sections
+
+The header holds the format version, the catalog fingerprint the snapshot
+was built against and the (offset, length) of each pickled section. A
+snapshot whose format or fingerprint doesn't match is ignored.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .cache import TAG_CATEGORIES, TAG_PRODUCTS, swr_prime
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'JYSNAP\x00\x01'
+FORMAT_VERSION = 1
+_HEADER_LENGTH = struct.Struct('>I')
+
+
+def snapshot_path():
+    return str(getattr(settings, 'CACHE_SNAPSHOT_PATH', settings.BASE_DIR / 'cache_snapshot.bin'))
+
+
+def catalog_fingerprint():
+    """Cheap digest of everything the snapshot is derived from"""
+    from .models import Category, CountryMultiplier
+    from .signals import CATEGORY_MODELS, PRODUCT_MODELS
+
+    parts = []
+    for model in PRODUCT_MODELS:
+        # all_objects: availability is covered by the category rows below
+        stats = model.all_objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+        parts.append([model.__name__, stats['count'], stats['updated'].isoformat() if stats['updated'] else None])
+    for model in (Category,) + CATEGORY_MODELS:
+        parts.append([model.__name__, list(model.objects.order_by('id').values_list('id', 'is_active', 'name'))])
+    parts.append(['CountryMultiplier', [
+        [name, str(value)] for name, value in CountryMultiplier.objects.order_by('id').values_list('country_name', 'multiplier')
+    ]])
+    return hashlib.sha1(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+
+
+def _sections():
+    """Name -> (build, prime) for every section in the snapshot"""
+    from .context_processors import NAV_TREE_TTL, _compute_header_categories, _compute_nav_tree
+    from .views import (
+        PRICE_BOUNDS_TTL, ProductService, _active_top_types, get_multiplier_table, get_related_index,
+    )
+
+    def prime_related(index):
+        for product_type, value in index.items():
+            get_related_index.prime(value, product_type)
+
+    return {
+        'nav_tree': (
+            _compute_nav_tree,
+            lambda v: swr_prime('nav_tree', v, NAV_TREE_TTL, tags=(TAG_CATEGORIES,)),
+        ),
+        'header_categories': (
+            _compute_header_categories,
+            lambda v: swr_prime('header_categories', v, NAV_TREE_TTL, tags=(TAG_CATEGORIES,)),
+        ),
+        'active_types': (_active_top_types, _active_top_types.prime),
+        'multipliers': (get_multiplier_table, get_multiplier_table.prime),
+        'price_bounds': (
+            ProductService.compute_price_bounds,
+            lambda v: swr_prime('price_bounds', v, PRICE_BOUNDS_TTL, tags=(TAG_PRODUCTS, TAG_CATEGORIES)),
+        ),
+        'related_index': (
+            lambda: {t: get_related_index(t) for t in ProductService.PRODUCT_TYPE_MAP},
+            prime_related,
+        ),
+    }
+
+
+def write_snapshot(path=None):
+    """Build every section, prime this process with it and atomically replace the snapshot file"""
+    path = path or snapshot_path()
+    fingerprint = catalog_fingerprint()
+    blobs = {}
+    for name, (build, prime) in _sections().items():
+        value = build()
+        prime(value)
+        blobs[name] = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    offset = 0
+    layout = {}
+    for name, blob in blobs.items():
+        layout[name] = [offset, len(blob)]
+        offset += len(blob)
+    header = json.dumps({
+        'format': FORMAT_VERSION,
+        'fingerprint': fingerprint,
+        'created_at': time.time(),
+        'sections': layout,
+    }).encode('utf-8')
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        for blob in blobs.values():
+            f.write(blob)
+    os.replace(tmp_path, path)
+    logger.info(f"Cache snapshot written to {path} ({offset} bytes of sections)")
+    return fingerprint
+
+
+def load_snapshot(path=None, fingerprint=None):
+    """Prime caches from the snapshot file. Returns False if it is missing or outdated."""
+    path = path or snapshot_path()
+    try:
+        return _load(path, fingerprint)
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable cache snapshot {path}: {e}")
+        return False
+
+
+def _load(path, fingerprint):
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            if bytes(view[:len(MAGIC)]) != MAGIC:
+                logger.warning(f"Ignoring cache snapshot {path}: bad magic")
+                return False
+            start = len(MAGIC) + _HEADER_LENGTH.size
+            (header_length,) = _HEADER_LENGTH.unpack(view[len(MAGIC):start])
+            header = json.loads(bytes(view[start:start + header_length]))
+            if header.get('format') != FORMAT_VERSION:
+                return False
+            if header['fingerprint'] != (fingerprint or catalog_fingerprint()):
+                logger.info(f"Ignoring cache snapshot {path}: catalog changed since it was built")
+                return False
+            base = start + header_length
+            sections = _sections()
+            for name, (offset, length) in header['sections'].items():
+                if name in sections:
+                    sections[name][1](pickle.loads(view[base + offset:base + offset + length]))
+        finally:
+            view.release()
+    logger.info(f"Caches primed from snapshot {path}")
+    return True
+
+
+def load_or_build(path=None, wait=10.0):
+    """Load a current snapshot, or build it if this worker wins the lock.
+
+    Workers that lose the lock wait up to `wait` seconds for the winner's
+    file instead of all rebuilding from the database at once.
+    """
+    path = path or snapshot_path()
+    fingerprint = catalog_fingerprint()
+    if load_snapshot(path, fingerprint):
+        return 'loaded'
+    with open(f'{path}.lock', 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            deadline = time.monotonic() + wait
+            while time.monotonic() < deadline:
+                time.sleep(0.2)
+                if load_snapshot(path, fingerprint):
+                    return 'loaded'
+            return 'missing'
+        try:
+            # Another worker may have finished between our check and the lock
+            if load_snapshot(path, fingerprint):
+                return 'loaded'
+            write_snapshot(path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return 'built'
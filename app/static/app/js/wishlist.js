@@ -124,6 +124,8 @@ function handleWishlistClick(e) {
     const isWishlisted = wishlistState.has(productId);
     const addUrl = this.getAttribute('data-add-url');
     const removeUrl = this.getAttribute('data-remove-url');
+    // Idempotent endpoint taking the desired state; add/remove URLs are the fallback
+    const setUrl = this.getAttribute('data-set-url');
     
     console.log('Wishlist click:', {
         productId,
@@ -139,7 +141,7 @@ function handleWishlistClick(e) {
         return;
     }
     
-    if (!addUrl || !removeUrl) {
+    if (!setUrl && (!addUrl || !removeUrl)) {
         console.error('Missing wishlist URLs:', {
             productId,
             addUrl,
@@ -151,7 +153,7 @@ function handleWishlistClick(e) {
     }
     
     // Validate URLs
-    if (!addUrl.includes('/wishlist/add/') || !removeUrl.includes('/wishlist/remove/')) {
+    if (!setUrl && (!addUrl.includes('/wishlist/add/') || !removeUrl.includes('/wishlist/remove/'))) {
         console.error('Invalid wishlist URLs:', {
             addUrl,
             removeUrl
@@ -160,7 +162,7 @@ function handleWishlistClick(e) {
         return;
     }
     
-    const url = isWishlisted ? removeUrl : addUrl;
+    const url = setUrl || (isWishlisted ? removeUrl : addUrl);
     console.log('Using URL:', url);
     
     // Get JWT token
@@ -189,7 +191,8 @@ function handleWishlistClick(e) {
             'Authorization': 'Bearer ' + token,
             'X-CSRFToken': getCSRFToken(),
             'X-Requested-With': 'XMLHttpRequest'
-        }
+        },
+        body: setUrl ? JSON.stringify({ in_wishlist: !isWishlisted }) : undefined
     })
     .then(response => {
         console.log('Response status:', response.status);
@@ -210,7 +213,7 @@ function handleWishlistClick(e) {
         
         if (data.success) {
             // Update global state
-            if (data.action === 'add') {
+            if (data.in_wishlist) {
                 wishlistState.add(productId);
                 showNotification('Added to wishlist!', 'success');
             } else {
@@ -219,7 +222,7 @@ function handleWishlistClick(e) {
             }
             
             // Broadcast change to all instances of this product on the page
-            broadcastWishlistChange(productId, data.action === 'add');
+            broadcastWishlistChange(productId, data.in_wishlist);
             
             // Update wishlist count in header if it exists
             updateWishlistCount();
@@ -0,0 +1,78 @@
+"""
+Streaming JSON / NDJSON responses for large listings.
+
+The envelope fields are written first and the items are encoded as they
+are pulled from the iterator, flushing every `chunk_size` items. Peak
+memory then depends on the chunk size, not on the number of results.
+Given a renderers.Schema, items are encoded through it instead of being
+passed in as dicts.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+DEFAULT_CHUNK_SIZE = 100
+
+_encoder = DjangoJSONEncoder(separators=(',', ':'))
+
+
+def _item_encoder(schema):
+    if schema is not None:
+        return schema.json_row
+    return lambda item: _encoder.encode(item).encode('utf-8')
+
+
+def wants_ndjson(request):
+    return (
+        request.GET.get('format') == 'ndjson'
+        or NDJSON_CONTENT_TYPE in request.headers.get('Accept', '')
+    )
+
+
+def iter_json_object(head, items_key, items, chunk_size=DEFAULT_CHUNK_SIZE, schema=None):
+    """Yield one JSON object: the `head` fields, then `items_key` holding the items"""
+    encode = _item_encoder(schema)
+    prefix = _encoder.encode(head)[:-1]
+    yield (prefix + (',' if head else '') + json.dumps(items_key) + ':[').encode('utf-8')
+    buffer = []
+    first = True
+    for item in items:
+        buffer.append(encode(item) if first else b',' + encode(item))
+        first = False
+        if len(buffer) >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+    buffer.append(b']}')
+    yield b''.join(buffer)
+
+
+def iter_ndjson(head, items, chunk_size=DEFAULT_CHUNK_SIZE, schema=None):
+    """Yield newline-delimited JSON: the `head` object on the first line, then one item per line"""
+    encode = _item_encoder(schema)
+    buffer = [(_encoder.encode(head) + '\n').encode('utf-8')]
+    for item in items:
+        buffer.append(encode(item) + b'\n')
+        if len(buffer) >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+    if buffer:
+        yield b''.join(buffer)
+
+
+def stream_items(request, head, items_key, items, chunk_size=DEFAULT_CHUNK_SIZE, schema=None):
+    """StreamingHttpResponse with `items` as a JSON array, or NDJSON if the client asked for it"""
+    if wants_ndjson(request):
+        response = StreamingHttpResponse(
+            iter_ndjson(head, items, chunk_size, schema), content_type=NDJSON_CONTENT_TYPE
+        )
+    else:
+        response = StreamingHttpResponse(
+            iter_json_object(head, items_key, items, chunk_size, schema), content_type='application/json'
+        )
+    # Tell nginx not to buffer, so the first chunk reaches the client right away
+    response['X-Accel-Buffering'] = 'no'
+    patch_vary_headers(response, ('Accept',))
+    return response
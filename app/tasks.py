@@ -0,0 +1,336 @@
+"""
+Background tasks stored in the project database.
+
+Work that shouldn't run inside a request is registered with @task and
+queued as a Task row:
+
+    @task(max_attempts=5, retry_delay=60)
+    def send_price_alerts(product_type, product_id, old_price):
+        ...
+
+    send_price_alerts.delay('gold', 49, '2999.00')        # as soon as a worker is free
+    enqueue('send_price_alerts', args=[...], delay=300)    # in five minutes
+
+Rows are inserted in the caller's transaction, so a task only exists once
+the change that queued it has committed. Passing `unique_key` collapses
+repeated enqueues into one pending task, e.g. one catalog rebuild for a burst
+of product edits.
+
+`manage.py run_worker` claims due tasks with a single
+
+    UPDATE ... SET status = 'Running' ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED) RETURNING ...
+
+(SKIP LOCKED where the database supports it, e.g. PostgreSQL; SQLite
+serializes writers, so the plain UPDATE is already exclusive) and runs them
+on a thread or process pool. A claim is a lease: a task whose worker died is
+picked up again once LEASE_SECONDS pass, so tasks must be safe to re-run.
+Failures are retried with exponential backoff up to the task's max_attempts.
+Each run records how long the task waited past its run_at and how long it
+took (wait_ms, duration_ms); summarize() aggregates them per task name.
+
+Tasks registered with `every=<seconds>` are queued by the workers
+themselves, which replaces running the sweeper and mail commands in loops.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta, timezone as dt_timezone
+
+import django
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection
+from django.db.models import Avg, Count, Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # How long a worker owns a claimed task before another worker may retry it
+    'LEASE_SECONDS': 10 * 60,
+    'RETRY_MAX_SECONDS': 60 * 60,
+    'KEEP_FINISHED_DAYS': 7,
+}
+
+_registry = {}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'TASK_QUEUE', {})}
+
+
+class RegisteredTask:
+    __slots__ = ('name', 'func', 'max_attempts', 'retry_delay', 'every')
+
+    def __init__(self, name, func, max_attempts, retry_delay, every):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.every = every
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        """Queue this task with these arguments (JSON-serializable) to run as soon as possible"""
+        return enqueue(self.name, args=args, kwargs=kwargs)
+
+
+def task(name=None, max_attempts=3, retry_delay=30, every=None):
+    """Register a function as a task. `every` (seconds) makes the workers queue it periodically."""
+    def decorator(func):
+        registered = RegisteredTask(name or func.__name__, func, max_attempts, retry_delay, every)
+        _registry[registered.name] = registered
+        return registered
+    return decorator
+
+
+def enqueue(name, args=(), kwargs=None, run_at=None, delay=None, unique_key=None):
+    """Queue task `name`. Returns the Task, or None with `unique_key`, where it may merge into a pending one."""
+    registered = _registry[name]
+    if run_at is None:
+        run_at = timezone.now() + timedelta(seconds=delay or 0)
+    row = Task(
+        name=name, args=list(args), kwargs=kwargs or {}, unique_key=unique_key,
+        max_attempts=registered.max_attempts, run_at=run_at,
+    )
+    if unique_key is None:
+        row.save()
+        return row
+    # ON CONFLICT DO NOTHING against the pending-unique_key constraint
+    Task.objects.bulk_create([row], ignore_conflicts=True)
+    return None
+
+
+def _as_datetime(value):
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if value is not None and timezone.is_naive(value):
+        value = value.replace(tzinfo=dt_timezone.utc)
+    return value
+
+
+def _as_json(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def claim(limit, worker, now=None):
+    """Mark up to `limit` due tasks Running for `worker`: [(id, name, args, kwargs, attempts, max_attempts, wait_ms)]"""
+    now = now or timezone.now()
+    table = connection.ops.quote_name(Task._meta.db_table)
+    skip_locked = ' FOR UPDATE SKIP LOCKED' if connection.features.has_select_for_update_skip_locked else ''
+    now_value = connection.ops.adapt_datetimefield_value(now)
+    lease_end = connection.ops.adapt_datetimefield_value(now + timedelta(seconds=config()['LEASE_SECONDS']))
+    due = "((status = 'Pending' AND run_at <= %s) OR (status = 'Running' AND locked_until <= %s))"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET status = 'Running', attempts = attempts + 1, locked_until = %s, "
+            f"worker = %s, started_at = %s "
+            f"WHERE {due} AND id IN (SELECT id FROM {table} WHERE {due} ORDER BY run_at LIMIT %s{skip_locked}) "
+            f"RETURNING id, name, args, kwargs, attempts, max_attempts, run_at",
+            [lease_end, worker, now_value, now_value, now_value, now_value, now_value, limit],
+        )
+        rows = cursor.fetchall()
+    return [
+        (pk, name, _as_json(args), _as_json(kwargs), attempts, max_attempts,
+         max((now - _as_datetime(run_at)).total_seconds() * 1000, 0))
+        for pk, name, args, kwargs, attempts, max_attempts, run_at in rows
+    ]
+
+
+def _finish(pk, duration_ms, wait_ms, **fields):
+    Task.objects.filter(pk=pk).update(
+        finished_at=timezone.now(), duration_ms=duration_ms, wait_ms=wait_ms, locked_until=None, **fields
+    )
+
+
+def execute(claimed):
+    """Run one claimed task and record the outcome. Returns (name, succeeded, duration_ms)."""
+    from .invalidation import poll_bus
+
+    pk, name, args, kwargs, attempts, max_attempts, wait_ms = claimed
+    close_old_connections()
+    registered = _registry.get(name)
+    started = time.perf_counter()
+    try:
+        if registered is None:
+            raise LookupError(f'No task registered as {name!r}')
+        if attempts > max_attempts:
+            raise RuntimeError(f'Lease expired on the last of {max_attempts} attempts')
+        # Like a request: apply other workers' cache invalidations first
+        poll_bus()
+        registered.func(*args, **kwargs)
+    except Exception as e:
+        duration_ms = (time.perf_counter() - started) * 1000
+        error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+        if registered is None or attempts >= max_attempts:
+            logger.error(f"Task {name}#{pk} failed after {attempts} attempts: {error}")
+            _finish(pk, duration_ms, wait_ms, status='Failed', last_error=traceback.format_exc())
+        else:
+            delay = min(registered.retry_delay * 2 ** (attempts - 1), config()['RETRY_MAX_SECONDS'])
+            logger.warning(f"Task {name}#{pk} failed (attempt {attempts}), retrying in {delay}s: {error}")
+            try:
+                Task.objects.filter(pk=pk).update(
+                    status='Pending', run_at=timezone.now() + timedelta(seconds=delay),
+                    locked_until=None, last_error=traceback.format_exc(), duration_ms=duration_ms,
+                )
+            except IntegrityError:
+                # A newer pending task with the same unique_key will do the work
+                _finish(pk, duration_ms, wait_ms, status='Failed', last_error=f'{error} (superseded)')
+        return name, False, duration_ms
+    else:
+        duration_ms = (time.perf_counter() - started) * 1000
+        _finish(pk, duration_ms, wait_ms, status='Done', last_error='')
+        logger.info(f"Task {name}#{pk} done in {duration_ms:.0f}ms (waited {wait_ms:.0f}ms)")
+        return name, True, duration_ms
+    finally:
+        close_old_connections()
+
+
+class WorkerStats:
+    """Per-task-name run counts and timings for this worker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, succeeded, duration_ms):
+        with self._lock:
+            stats = self._stats.setdefault(name, {'runs': 0, 'failures': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stats['runs'] += 1
+            stats['failures'] += 0 if succeeded else 1
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+def _queue_periodic(next_due, now):
+    for name, registered in _registry.items():
+        if registered.every and next_due.get(name, now) <= now:
+            enqueue(name, unique_key=f'periodic:{name}')
+            next_due[name] = now + timedelta(seconds=registered.every)
+
+
+def run_worker(concurrency=4, pool='thread', poll_interval=1.0, once=False, stats_interval=60.0, stats=None):
+    """Claim and run tasks until interrupted (or, with once=True, until nothing is due)"""
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    stats = stats or WorkerStats()
+    if pool == 'process':
+        # Spawned, not forked, so children open their own database connections. The
+        # initializer must not import this module: its models need the app registry set up.
+        executor = ProcessPoolExecutor(
+            concurrency, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+        )
+    else:
+        executor = ThreadPoolExecutor(concurrency, thread_name_prefix='task-worker')
+    logger.info(f"Task worker {worker} started: {concurrency} {pool}s")
+    running = set()
+    next_due = {}
+    next_stats = time.monotonic() + stats_interval
+    try:
+        while True:
+            _queue_periodic(next_due, timezone.now())
+            claimed = claim(concurrency - len(running), worker) if len(running) < concurrency else []
+            running.update(executor.submit(execute, row) for row in claimed)
+            if once and not running:
+                break
+            if running:
+                done, running = wait(running, timeout=0 if claimed else poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stats.record(*future.result())
+            else:
+                time.sleep(poll_interval)
+            if time.monotonic() >= next_stats:
+                next_stats = time.monotonic() + stats_interval
+                for name, s in sorted(stats.snapshot().items()):
+                    logger.info(
+                        f"Task {name}: {s['runs']} runs, {s['failures']} failed, "
+                        f"avg {s['total_ms'] / s['runs']:.0f}ms, max {s['max_ms']:.0f}ms"
+                    )
+    except KeyboardInterrupt:
+        logger.info(f"Task worker {worker} stopping after {len(running)} running task(s)")
+    finally:
+        executor.shutdown(wait=True)
+        for future in running:
+            if future.done() and not future.exception():
+                stats.record(*future.result())
+    return stats
+
+
+def summarize(since=None):
+    """Per task name: counts by outcome and wait/duration timings of runs finished since `since`"""
+    since = since or timezone.now() - timedelta(hours=24)
+    return list(
+        Task.objects.filter(finished_at__gte=since).values('name').annotate(
+            runs=Count('id'),
+            failed=Count('id', filter=Q(status='Failed')),
+            avg_wait_ms=Avg('wait_ms'),
+            avg_ms=Avg('duration_ms'),
+            max_ms=Max('duration_ms'),
+        ).order_by('name')
+    )
+
+
+# ---------------------------------------------------------------------------
+# The app's tasks
+# ---------------------------------------------------------------------------
+
+CATALOG_REBUILD_DELAY = 5
+
+
+@task(every=30)
+def release_expired_holds():
+    from .inventory import release_expired
+    release_expired()
+
+
+@task(every=5)
+def send_queued_email():
+    from .mail import send_due
+    send_due()
+
+
+@task(every=24 * 60 * 60)
+def prune_tasks():
+    """Delete finished tasks older than KEEP_FINISHED_DAYS"""
+    cutoff = timezone.now() - timedelta(days=config()['KEEP_FINISHED_DAYS'])
+    Task.objects.filter(status__in=['Done', 'Failed'], finished_at__lt=cutoff).delete()
+
+
+@task(max_attempts=5)
+def send_price_alerts(product_type, product_id, old_price):
+    from decimal import Decimal
+
+    from .cards import PRODUCT_MODELS
+    from .mail import queue_price_alerts
+
+    product = PRODUCT_MODELS[product_type].all_objects.filter(pk=product_id).first()
+    if product:
+        queue_price_alerts(product_type, product, Decimal(old_price))
+
+
+@task()
+def rebuild_catalog_indexes():
+    """Rebuild the columnar catalog and the cache snapshot so requests after a catalog edit find them ready"""
+    from .columnar import get_catalog_columns
+    from .snapshot import write_snapshot
+
+    get_catalog_columns()
+    write_snapshot()
+
+
+def schedule_catalog_rebuild():
+    """Queue one rebuild a few seconds out; further edits before it runs don't add more"""
+    enqueue('rebuild_catalog_indexes', delay=CATALOG_REBUILD_DELAY, unique_key='rebuild_catalog_indexes')
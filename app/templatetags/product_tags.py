@@ -1,8 +1,20 @@
 from django import template
+from django.core.cache import cache
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from app.cache import CARD_CACHE_TIMEOUT, TAG_PRICING, card_cache_key, get_tag_versions
 
 register = template.Library()
 
+CARD_TEMPLATES = {
+    'grid': 'app/partials/product_card.html',
+    'shop': 'app/partials/product_card_shop.html',
+    'arrival': 'app/partials/product_card_arrival.html',
+}
+
 @register.simple_tag
 def product_detail_url(product_type, product_id):
     """Generate the correct product detail URL based on product type."""
@@ -34,3 +46,43 @@ def add_to_cart_url(product_type, product_id):
     else:
         # Fallback to old URL pattern
         return reverse('app:add_to_cart', kwargs={'product_id': product_id})
+
+@register.simple_tag(takes_context=True)
+def product_cards(context, products, variant, wishlisted=None):
+    """Render a grid of product cards through the shared fragment cache.
+
+    All card keys are fetched with one get_many, only the misses are rendered,
+    and those are written back with one set_many. wishlisted holds product ids
+    or (content_type_id, object_id) keys, matching what the page used before.
+    """
+    template_name = CARD_TEMPLATES[variant]
+    wishlisted = wishlisted or set()
+    price_tier = context.get('price_tier', 'india')
+    pricing_version = get_tag_versions([TAG_PRICING])[TAG_PRICING]
+    today = timezone.now().date()
+
+    entries = []
+    for product in products:
+        created_at = getattr(product, 'created_at', None)
+        card_context = {
+            'product': product,
+            'in_wishlist': (getattr(product, 'wishlist_key', None) or product.id) in wishlisted,
+            'is_new': bool(created_at and created_at.date() == today),
+        }
+        key = card_cache_key(
+            variant, product, price_tier, pricing_version,
+            int(card_context['in_wishlist']), int(card_context['is_new']),
+        )
+        entries.append((key, card_context))
+
+    cached = cache.get_many([key for key, _ in entries])
+    rendered = []
+    misses = {}
+    for key, card_context in entries:
+        html = cached.get(key)
+        if html is None:
+            html = misses[key] = render_to_string(template_name, card_context)
+        rendered.append(html)
+    if misses:
+        cache.set_many(misses, CARD_CACHE_TIMEOUT)
+    return mark_safe(''.join(rendered))
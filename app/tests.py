@@ -1,3 +1,1221 @@
-from django.test import TestCase
+import asyncio
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from types import ModuleType
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core import mail as outbox
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import DatabaseError, IntegrityError, transaction
+from django.http import Http404, HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import include, path
+from django.utils import timezone
+
+from . import async_views, cache as app_cache, columnar, events, guest_cart, inventory, mail, renderers, snapshot, tasks
+from .cache import (
+    TAG_CAROUSEL, TAG_CATEGORIES, TAG_PRICING, TAG_PRODUCTS, TAG_STOCK, get_tag_versions, invalidate_tags, swr_get,
+    swr_prime,
+)
+from .cache_backends import TwoTierCache
+from .decorators import cache_storefront_page
+from .events import EventBroker, stock_key, user_key
+from .invalidation import InvalidationBus, SQLiteTransport
+from .models import (
+    Cart, Category, CountryMultiplier, GoldCategory, GoldProduct, GoldSubCategory, ImitationCategory,
+    ImitationProduct, ImitationSubCategory, Order, OutboundEmail, SilverCategory, SilverProduct, SilverSubCategory,
+    StockReservation, Task, User, Wishlist,
+)
+from .renderers import Field, Schema, api_response, money, wants_msgpack
+from .resp import RespClient, StandInServer, _StandInHandler, read_reply
+from .streaming import NDJSON_CONTENT_TYPE, stream_items
+from .views import (
+    CART_BATCH_MAX_OPERATIONS, CartService, OrderService, ProductService, WishlistService, get_multiplier_table,
+    jwt_encode,
+)
+
+
+def make_user(email, **fields):
+    return User.objects.create(email=email, password='x', confirm_password='x', **fields)
+
+
+def make_gold_product(name='Ring', price='100.00', stock=10):
+    category, _ = GoldCategory.objects.get_or_create(name='Rings')
+    subcategory, _ = GoldSubCategory.objects.get_or_create(gold_category=category, name='Bands')
+    return GoldProduct.objects.create(
+        name=name, category=category, subcategory=subcategory,
+        original_price=Decimal(price), selling_price=Decimal(price), stock_quantity=stock,
+    )
+
+
+def cookie_client(user):
+    """A browser-style client signed in with the jwt_token cookie"""
+    client = Client()
+    client.cookies['jwt_token'] = jwt_encode({'user_id': user.id, 'email': user.email})
+    return client
+
+
+AJAX = {'X-Requested-With': 'XMLHttpRequest'}
+
+
+def clear_caches():
+    """Empty the cache and the process memos, which would otherwise outlive a test's rolled-back rows"""
+    cache.clear()
+    app_cache.clear_local_memos((TAG_PRODUCTS, TAG_CATEGORIES, TAG_CAROUSEL, TAG_PRICING, TAG_STOCK))
+
+
+class IdempotencyKeyTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+        self.product = make_gold_product()
+        self.url = f'/cart/add/gold/g{self.product.pk}/'
+
+    def post(self, client, key):
+        return client.post(self.url, headers={**AJAX, 'Idempotency-Key': key})
+
+    def test_retry_replays_the_first_response(self):
+        client = cookie_client(make_user('a@example.com'))
+        first = self.post(client, 'k1')
+        retry = self.post(client, 'k1')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Cart.objects.get().quantity, 1)
+
+    def test_same_key_from_different_users_is_not_shared(self):
+        alice, bob = make_user('a@example.com'), make_user('b@example.com')
+        self.post(cookie_client(alice), 'k1')
+        response = self.post(cookie_client(bob), 'k1')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Cart.objects.filter(user=bob).count(), 1)
+        self.assertEqual(Cart.objects.filter(user=alice).count(), 1)
+
+    def test_key_reused_for_another_request_is_rejected(self):
+        client = cookie_client(make_user('a@example.com'))
+        self.post(client, 'k1')
+        other = make_gold_product(name='Chain')
+        response = client.post(f'/cart/add/gold/g{other.pk}/', headers={**AJAX, 'Idempotency-Key': 'k1'})
+        self.assertEqual(response.status_code, 422)
+
+    def test_anonymous_responses_that_set_cookies_are_not_replayed(self):
+        first = self.post(Client(), 'k1')
+        self.assertIn('guest_cart', first.cookies)
+        retry = self.post(Client(), 'k1')
+        self.assertFalse(retry.has_header('Idempotent-Replayed'))
+
+
+class CartUpsertTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user('a@example.com')
+        self.product = make_gold_product()
+        self.ct_id = ContentType.objects.get_for_model(GoldProduct).id
+
+    def test_repeated_adds_sum_into_one_row(self):
+        item, created = CartService.upsert_item(self.user, self.ct_id, self.product.pk, 2)
+        self.assertTrue(created)
+        again, created = CartService.upsert_item(self.user, self.ct_id, self.product.pk, 3)
+        self.assertFalse(created)
+        self.assertEqual(again.pk, item.pk)
+        self.assertEqual(Cart.objects.get().quantity, 5)
+
+    def test_unique_constraint_rejects_duplicate_rows(self):
+        CartService.upsert_item(self.user, self.ct_id, self.product.pk, 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cart.objects.create(user=self.user, content_type_id=self.ct_id, object_id=self.product.pk)
+
+    def test_upsert_bumps_cart_version(self):
+        CartService.upsert_item(self.user, self.ct_id, self.product.pk, 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.cart_version, 1)
+
+    def test_add_to_cart_rejects_quantities_below_one(self):
+        client = cookie_client(self.user)
+        for quantity in (0, -1):
+            response = client.post(
+                f'/cart/add/gold/g{self.product.pk}/', {'quantity': quantity}, content_type='application/json',
+                headers=AJAX,
+            )
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Cart.objects.exists())
+
+
+class WishlistStateTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user('a@example.com')
+        self.product = make_gold_product()
+
+    def test_setting_the_same_state_twice_is_a_no_op(self):
+        self.assertEqual(WishlistService.set_state(self.user, 'gold', self.product.pk, True), (True, 1))
+        self.assertEqual(WishlistService.set_state(self.user, 'gold', self.product.pk, True), (False, 1))
+        self.assertEqual(WishlistService.set_state(self.user, 'gold', self.product.pk, False), (True, 0))
+        self.assertEqual(WishlistService.set_state(self.user, 'gold', self.product.pk, False), (False, 0))
+
+    def test_version_only_bumps_when_something_changed(self):
+        WishlistService.set_state(self.user, 'gold', self.product.pk, True)
+        WishlistService.set_state(self.user, 'gold', self.product.pk, True)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.wishlist_version, 1)
+
+    def test_adding_a_missing_product_is_404(self):
+        with self.assertRaises(Http404):
+            WishlistService.set_state(self.user, 'gold', self.product.pk + 1, True)
+        self.assertFalse(Wishlist.objects.exists())
+
+    def test_endpoint_requires_a_boolean_state(self):
+        client = cookie_client(self.user)
+        url = f'/api/wishlist/gold/{self.product.pk}/'
+        response = client.put(url, '{"in_wishlist": "yes"}', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = client.put(url, '{"in_wishlist": true}', content_type='application/json')
+        self.assertEqual(response.json()['wishlist_count'], 1)
+
+
+def stock_of(product):
+    return GoldProduct.all_objects.get(pk=product.pk).stock_quantity
+
+
+class StockHoldTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user('a@example.com')
+        self.product = make_gold_product(stock=3)
+        self.ct_id = ContentType.objects.get_for_model(GoldProduct).id
+
+    def add(self, user, quantity, product=None):
+        CartService.upsert_item(user, self.ct_id, (product or self.product).pk, quantity)
+
+    def test_hold_takes_stock_and_release_gives_it_back(self):
+        self.add(self.user, 2)
+        reservations, _ = inventory.reserve_cart(self.user)
+        self.assertEqual([r.quantity for r in reservations], [2])
+        self.assertEqual(stock_of(self.product), 1)
+        self.assertEqual(inventory.release_holds(self.user), 1)
+        self.assertEqual(stock_of(self.product), 3)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_holding_again_replaces_previous_holds(self):
+        self.add(self.user, 2)
+        inventory.reserve_cart(self.user)
+        inventory.reserve_cart(self.user)
+        self.assertEqual(stock_of(self.product), 1)
+        self.assertEqual(StockReservation.objects.get().quantity, 2)
+
+    def test_the_last_units_cannot_be_held_twice(self):
+        other = make_user('b@example.com')
+        self.add(self.user, 2)
+        self.add(other, 2)
+        inventory.reserve_cart(self.user)
+        with self.assertRaises(inventory.InsufficientStock) as raised:
+            inventory.reserve_cart(other)
+        self.assertEqual(raised.exception.shortages, [('gold', self.product.pk, 2, 1)])
+        self.assertEqual(stock_of(self.product), 1)
+
+    def test_a_short_line_holds_nothing_and_keeps_previous_holds(self):
+        scarce = make_gold_product(name='Chain', stock=1)
+        self.add(self.user, 1)
+        inventory.reserve_cart(self.user)
+        self.add(self.user, 2, scarce)
+        with self.assertRaises(inventory.InsufficientStock):
+            inventory.reserve_cart(self.user)
+        self.assertEqual(stock_of(self.product), 2)
+        self.assertEqual(stock_of(scarce), 1)
+        self.assertEqual(StockReservation.objects.get().object_id, self.product.pk)
+
+    def test_sweeper_releases_only_expired_holds(self):
+        other = make_user('b@example.com')
+        self.add(self.user, 1)
+        self.add(other, 1)
+        inventory.reserve_cart(self.user)
+        inventory.reserve_cart(other)
+        StockReservation.objects.filter(user=self.user).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(inventory.release_expired(), 1)
+        self.assertEqual(stock_of(self.product), 2)
+        self.assertEqual(StockReservation.objects.get().user, other)
+
+
+class PlaceOrderTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+        self.user = make_user('a@example.com')
+        self.ring = make_gold_product(name='Ring', price='100.00', stock=5)
+        self.chain = make_gold_product(name='Chain', price='250.50', stock=5)
+        self.ct_id = ContentType.objects.get_for_model(GoldProduct).id
+
+    def add(self, product, quantity):
+        CartService.upsert_item(self.user, self.ct_id, product.pk, quantity)
+
+    def test_order_snapshots_lines_and_sells_held_stock(self):
+        self.add(self.ring, 2)
+        self.add(self.chain, 1)
+        inventory.reserve_cart(self.user)
+        order, lines = OrderService.place_order(self.user)
+        self.assertEqual(order.item_count, 3)
+        self.assertEqual(order.total_amount, Decimal('450.50'))
+        self.assertEqual(
+            sorted((line.product_name, line.quantity, line.line_total) for line in order.lines.all()),
+            [('Chain', 1, Decimal('250.50')), ('Ring', 2, Decimal('200.00'))],
+        )
+        self.assertEqual((stock_of(self.ring), stock_of(self.chain)), (3, 4))
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(OutboundEmail.objects.get().kind, 'order_confirmation')
+
+    def test_unheld_stock_is_taken_when_the_order_is_placed(self):
+        self.add(self.ring, 2)
+        OrderService.place_order(self.user)
+        self.assertEqual(stock_of(self.ring), 3)
+
+    def test_a_short_line_rolls_the_whole_order_back(self):
+        self.add(self.ring, 1)
+        self.add(self.chain, 6)
+        with self.assertRaises(inventory.InsufficientStock):
+            OrderService.place_order(self.user)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Cart.objects.count(), 2)
+        self.assertEqual((stock_of(self.ring), stock_of(self.chain)), (5, 5))
+
+    def test_nothing_to_order_releases_holds(self):
+        self.add(self.ring, 2)
+        inventory.reserve_cart(self.user)
+        self.ring.delete()
+        self.assertIsNone(OrderService.place_order(self.user))
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertFalse(Cart.objects.exists())
+
+    def test_a_second_submit_finds_the_cart_empty(self):
+        self.add(self.ring, 1)
+        client = cookie_client(self.user)
+        self.assertEqual(client.post('/api/checkout/place/').status_code, 201)
+        self.assertEqual(client.post('/api/checkout/place/').status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class DownEmailBackend(EmailBackend):
+    """An SMTP server that refuses connections"""
+
+    def open(self):
+        raise ConnectionRefusedError('connection refused')
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class MailOutboxTests(TestCase):
+
+    def queue(self, count=1):
+        for i in range(count):
+            mail.queue('otp', f'user{i}@example.com', {'first_name': 'A', 'otp': '123456'})
+
+    def test_due_emails_are_sent_once(self):
+        self.queue(3)
+        self.assertEqual(mail.send_due(), (3, 3))
+        self.assertEqual(mail.send_due(), (0, 0))
+        self.assertEqual(len(outbox.outbox), 3)
+        self.assertEqual(OutboundEmail.objects.filter(status='Sent').count(), 3)
+
+    def test_leased_emails_are_not_leased_again(self):
+        self.queue(2)
+        now = timezone.now()
+        self.assertEqual(len(mail._lease(10, now)), 2)
+        self.assertEqual(mail._lease(10, now), [])
+        # Until the lease runs out
+        self.assertEqual(len(mail._lease(10, now + timedelta(seconds=mail.LEASE_SECONDS + 1))), 2)
+
+    @override_settings(EMAIL_BACKEND='app.tests.DownEmailBackend')
+    def test_failures_back_off_and_give_up_after_max_attempts(self):
+        self.queue()
+        now = timezone.now()
+        self.assertEqual(mail.send_due(now=now), (0, 1))
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('Pending', 1))
+        self.assertEqual(email.next_attempt_at, now + timedelta(seconds=mail.retry_delay(1)))
+        self.assertEqual(mail.send_due(now=now), (0, 0))
+        for _ in range(mail.MAX_ATTEMPTS - 1):
+            now += timedelta(seconds=mail.RETRY_MAX_SECONDS)
+            mail.send_due(now=now)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('Failed', mail.MAX_ATTEMPTS))
+
+    def test_price_alerts_go_to_wishlisters_only_on_a_drop(self):
+        product = make_gold_product(price='200.00')
+        user = make_user('a@example.com', first_name='Asha')
+        WishlistService.set_state(user, 'gold', product.pk, True)
+        self.assertEqual(mail.queue_price_alerts('gold', product, Decimal('150.00')), 0)
+        self.assertEqual(mail.queue_price_alerts('gold', product, Decimal('250.00')), 1)
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.kind, email.to_email), ('price_alert', 'a@example.com'))
+        self.assertIn('20%', email.body)
+
+
+flaky_runs = []
+
+
+@tasks.task(name='test_flaky', max_attempts=3)
+def flaky():
+    flaky_runs.append(1)
+    if len(flaky_runs) < 2:
+        raise RuntimeError('try again')
+
+
+@tasks.task(name='test_broken', max_attempts=2)
+def broken():
+    raise RuntimeError('nope')
+
+
+class TaskQueueTests(TransactionTestCase):
+    # execute() closes old connections the way a worker does, which needs real commits
+
+    def setUp(self):
+        flaky_runs.clear()
+
+    def run_due(self, now=None):
+        return [tasks.execute(claimed) for claimed in tasks.claim(10, 'test', now=now)]
+
+    def test_claimed_tasks_are_not_claimed_again_until_their_lease_ends(self):
+        tasks.enqueue('test_flaky')
+        now = timezone.now()
+        self.assertEqual(len(tasks.claim(10, 'a', now=now)), 1)
+        self.assertEqual(tasks.claim(10, 'b', now=now), [])
+        later = now + timedelta(seconds=tasks.config()['LEASE_SECONDS'] + 1)
+        self.assertEqual(len(tasks.claim(10, 'b', now=later)), 1)
+        self.assertEqual(Task.objects.get().attempts, 2)
+
+    def test_failed_task_is_retried_with_backoff(self):
+        tasks.enqueue('test_flaky')
+        self.assertEqual([succeeded for _, succeeded, _ in self.run_due()], [False])
+        task = Task.objects.get()
+        self.assertEqual(task.status, 'Pending')
+        self.assertGreater(task.run_at, timezone.now())
+        self.assertEqual(self.run_due(), [])
+        self.assertEqual([succeeded for _, succeeded, _ in self.run_due(task.run_at)], [True])
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ('Done', 2))
+        self.assertIsNotNone(task.duration_ms)
+
+    def test_task_fails_for_good_after_max_attempts(self):
+        tasks.enqueue('test_broken')
+        self.run_due()
+        self.run_due(timezone.now() + timedelta(hours=1))
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), ('Failed', 2))
+        self.assertIn('nope', task.last_error)
+
+    def test_catalog_rebuilds_are_deduplicated(self):
+        for _ in range(3):
+            tasks.schedule_catalog_rebuild()
+        self.assertEqual(Task.objects.filter(name='rebuild_catalog_indexes', status='Pending').count(), 1)
+
+    def test_price_drop_queues_an_alert_task(self):
+        product = make_gold_product(price='200.00')
+        product.selling_price = Decimal('250.00')
+        product.save()
+        self.assertFalse(Task.objects.filter(name='send_price_alerts').exists())
+        product.selling_price = Decimal('150.00')
+        product.save()
+        self.assertEqual(Task.objects.get(name='send_price_alerts').args, ['gold', product.pk, '250.00'])
+
+
+def start_standin(test, handler=None):
+    server = StandInServer()
+    if handler:
+        server.RequestHandlerClass = handler
+    server.start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return server
+
+
+class _DropFirstReply(_StandInHandler):
+    """Applies the first connection's command, then hangs up without replying, like an idle timeout"""
+
+    def handle(self):
+        if getattr(self.server, 'dropped', False):
+            return super().handle()
+        self.server.dropped = True
+        command = read_reply(self.rfile)
+        with self.server.store.lock:
+            self.dispatch(self.server.store, command[0].decode().upper(), command[1:])
+
+
+class RespClientTests(SimpleTestCase):
+
+    def test_reads_are_resent_when_the_reply_is_lost(self):
+        server = start_standin(self, _DropFirstReply)
+        server.store.data[b'k'] = b'v'
+        self.assertEqual(RespClient.from_url(server.url).execute('GET', 'k'), b'v')
+
+    def test_writes_are_not_resent_when_the_reply_is_lost(self):
+        server = start_standin(self, _DropFirstReply)
+        client = RespClient.from_url(server.url)
+        with self.assertRaises(ConnectionError):
+            client.execute('INCR', 'n')
+        self.assertEqual(client.execute('GET', 'n'), b'1')
+
+    def test_calls_do_not_wait_for_a_connection_in_use(self):
+        server = start_standin(self)
+        client = RespClient.from_url(server.url)
+        client.execute('SET', 'k', 'v')
+        busy = client._checkout()
+        self.addCleanup(busy.close)
+        self.assertEqual(client.execute('GET', 'k'), b'v')
+        client._checkin(busy)
+        client.execute('GET', 'k')
+        self.assertEqual(len(client._idle), 2)
+
+
+class TwoTierCacheTests(TestCase):
+
+    def make_cache(self, location):
+        return TwoTierCache(location, {'KEY_PREFIX': self.id(), 'OPTIONS': {'L1_TIMEOUT': 0.05, 'RETRY_INTERVAL': 60}})
+
+    def test_values_are_shared_through_l2(self):
+        server = start_standin(self)
+        self.make_cache([server.url]).set('k', 'v', None)
+        time.sleep(0.1)
+        self.assertEqual(self.make_cache([server.url]).get('k'), 'v')
+
+    def test_writes_while_a_node_is_down_only_live_for_l1_timeout(self):
+        down = self.make_cache(['redis://127.0.0.1:1'])
+        with self.assertLogs('app.cache_backends', 'WARNING'):
+            down.set('k', 'v', None)
+        self.assertEqual(down.get('k'), 'v')
+        time.sleep(0.1)
+        self.assertIsNone(down.get('k'))
+
+
+class InvalidationBusTests(TestCase):
+
+    def setUp(self):
+        server = start_standin(self)
+        settings_override = override_settings(CACHES={'default': {
+            'BACKEND': 'app.cache_backends.TwoTierCache', 'LOCATION': [server.url], 'KEY_PREFIX': self.id(),
+        }})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        path = os.path.join(tempfile.mkdtemp(), 'bus.sqlite3')
+        # Two workers sharing one L2 and one bus
+        self.buses = [InvalidationBus(SQLiteTransport(path), poll_interval=0) for _ in range(2)]
+        for bus in self.buses:
+            bus.poll(force=True)
+
+    def test_remote_invalidation_on_a_shared_cache_bumps_the_version_once(self):
+        before = get_tag_versions([TAG_PRODUCTS])[TAG_PRODUCTS]
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_tags(TAG_PRODUCTS, publish=False)
+        self.buses[0].publish([TAG_PRODUCTS])
+        bumped = cache.get(f'tagver:{TAG_PRODUCTS}')
+        self.assertGreater(bumped, before)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.buses[1].poll(force=True), [TAG_PRODUCTS])
+        self.assertEqual(get_tag_versions([TAG_PRODUCTS])[TAG_PRODUCTS], bumped)
+        self.assertEqual(self.buses[0].poll(force=True), [])
+
+
+class StorefrontPageCacheTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+        self.calls = 0
+
+        @cache_storefront_page(TAG_PRODUCTS)
+        def view(request):
+            self.calls += 1
+            response = HttpResponse(f'page {self.calls}', content_type='text/html; charset=utf-8')
+            response['Content-Language'] = 'en'
+            response['Cache-Control'] = 'max-age=60'
+            response['Vary'] = 'Accept-Language'
+            if request.GET.get('cookie'):
+                response.set_cookie('seen', '1')
+            return response
+        self.view = view
+        self.factory = RequestFactory()
+
+    def get(self, path='/page/', **kwargs):
+        return self.view(self.factory.get(path, **kwargs))
+
+    def test_miss_then_hit_with_the_views_headers(self):
+        first = self.get()
+        self.assertEqual(first['X-Page-Cache'], 'MISS')
+        hit = self.get()
+        self.assertEqual(hit['X-Page-Cache'], 'HIT')
+        self.assertEqual(hit.content, b'page 1')
+        for header in ('Content-Type', 'Content-Language', 'Cache-Control', 'Vary'):
+            self.assertEqual(hit[header], first[header])
+        self.assertEqual(self.calls, 1)
+
+    def test_tracking_parameters_share_an_entry(self):
+        self.get('/page/?utm_source=x')
+        self.assertEqual(self.get('/page/?gclid=y')['X-Page-Cache'], 'HIT')
+
+    def test_credentialed_and_unsafe_requests_bypass_the_cache(self):
+        self.get()
+        token = jwt_encode({'user_id': 1})
+        self.assertFalse(self.get(headers={'Authorization': f'Bearer {token}'}).has_header('X-Page-Cache'))
+        request = self.factory.get('/page/')
+        request.COOKIES['jwt_token'] = token
+        self.assertFalse(self.view(request).has_header('X-Page-Cache'))
+        self.assertFalse(self.view(self.factory.post('/page/')).has_header('X-Page-Cache'))
+        self.assertEqual(self.calls, 4)
+
+    def test_responses_that_set_cookies_are_not_stored(self):
+        self.get('/page/?cookie=1')
+        self.get('/page/?cookie=1')
+        self.assertEqual(self.calls, 2)
+
+    def test_product_save_invalidates_the_page(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_gold_product()
+        self.assertEqual(self.get()['X-Page-Cache'], 'MISS')
+
+
+class StorefrontConditionalTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+        Category.objects.create(name='Gold')
+        self.product = make_gold_product()
+        self.url = f'/product/gold/g{self.product.pk}/'
+
+    def etag(self, url=None):
+        response = self.client.get(url or self.url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_matching_validators_get_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': response['ETag']}).status_code, 304)
+        self.assertEqual(
+            self.client.get(self.url, headers={'If-Modified-Since': response['Last-Modified']}).status_code, 304,
+        )
+
+    def test_product_save_changes_the_etag(self):
+        before = self.etag()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.selling_price = Decimal('90.00')
+            self.product.save()
+        self.assertNotEqual(self.etag(), before)
+
+    def test_category_save_changes_the_etag(self):
+        url = f'/category/gold/{self.product.category_id}/'
+        before = self.etag(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.category.name = 'Bangles'
+            self.product.category.save()
+        self.assertNotEqual(self.etag(url), before)
+
+    def test_multiplier_save_changes_the_etag(self):
+        before = self.etag()
+        with self.captureOnCommitCallbacks(execute=True):
+            CountryMultiplier.objects.create(country_name='India', multiplier=Decimal('1.10'))
+        self.assertNotEqual(self.etag(), before)
+
+
+class UserConditionalTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+        self.user = make_user('etag@example.com')
+        self.product = make_gold_product()
+        self.client = cookie_client(self.user)
+        WishlistService.set_state(self.user, 'gold', self.product.pk, True)
+        CartService.add_to_cart(self.user, self.product.pk, 1, 'gold')
+
+    def test_matching_etag_gets_304_from_the_user_row_alone(self):
+        for url in ('/api/wishlist/', '/api/cart/'):
+            with self.subTest(url=url):
+                etag = self.client.get(url, headers=AJAX)['ETag']
+                # Only the JWT user lookup: no cart, wishlist or product queries
+                with self.assertNumQueries(1):
+                    response = self.client.get(url, headers={'If-None-Match': etag, **AJAX})
+                self.assertEqual(response.status_code, 304)
+
+    def test_a_wishlist_change_changes_the_etag(self):
+        etag = self.client.get('/api/wishlist/', headers=AJAX)['ETag']
+        WishlistService.set_state(self.user, 'gold', self.product.pk, False)
+        response = self.client.get('/api/wishlist/', headers={'If-None-Match': etag, **AJAX})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['items'], [])
+
+
+class StaleWhileRevalidateTests(SimpleTestCase):
+
+    def setUp(self):
+        clear_caches()
+        self.calls = 0
+        self.release = threading.Event()
+
+    def compute(self):
+        self.calls += 1
+        self.release.wait(5)
+        return 'new'
+
+    def test_stale_value_is_served_while_one_refresh_runs(self):
+        swr_prime('swr-stale', 'old', ttl=-1)
+        for _ in range(5):
+            self.assertEqual(swr_get('swr-stale', self.compute, ttl=60), 'old')
+        self.release.set()
+        deadline = time.time() + 5
+        while swr_get('swr-stale', self.compute, ttl=60) != 'new' and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(swr_get('swr-stale', self.compute, ttl=60), 'new')
+        self.assertEqual(self.calls, 1)
+
+    def test_concurrent_misses_compute_once(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(swr_get('swr-miss', self.compute, ttl=60)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, ['new'] * 5)
+        self.assertEqual(self.calls, 1)
+
+    def test_refresh_lock_expires_if_the_refresher_dies(self):
+        swr_prime('swr-lock', 'old', ttl=-1)
+        # A refresher that never runs leaves its lock behind until the timeout
+        with mock.patch.object(app_cache, 'SWR_LOCK_TIMEOUT', 1), \
+                mock.patch.object(app_cache._swr_executor, 'submit') as submit:
+            swr_get('swr-lock', self.compute, ttl=60)
+            swr_get('swr-lock', self.compute, ttl=60)
+            self.assertEqual(submit.call_count, 1)
+            time.sleep(1.1)
+            swr_get('swr-lock', self.compute, ttl=60)
+            self.assertEqual(submit.call_count, 2)
+
+
+class CatalogSnapshotTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+        Category.objects.create(name='Gold')
+        CountryMultiplier.objects.create(country_name='India', multiplier=Decimal('1.20'))
+        make_gold_product()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'snapshot.bin')
+
+    def test_round_trip_primes_caches_without_queries(self):
+        self.assertEqual(snapshot.load_or_build(self.path), 'built')
+        clear_caches()
+        self.assertTrue(snapshot.load_snapshot(self.path))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_multiplier_table(), {'India': Decimal('1.20')})
+        self.assertEqual(snapshot.load_or_build(self.path), 'loaded')
+
+    def test_snapshot_of_an_older_catalog_is_ignored(self):
+        fingerprint = snapshot.write_snapshot(self.path)
+        self.assertTrue(snapshot.load_snapshot(self.path, fingerprint))
+        CountryMultiplier.objects.create(country_name='Others', multiplier=Decimal('2.00'))
+        self.assertNotEqual(snapshot.catalog_fingerprint(), fingerprint)
+        self.assertFalse(snapshot.load_snapshot(self.path))
+
+
+@skipIf(columnar.np is None, 'NumPy is not installed')
+class CatalogColumnsTests(TestCase):
+
+    def setUp(self):
+        clear_caches()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(CATALOG_COLUMNS_PATH=os.path.join(directory.name, 'columns'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        models = {
+            'gold': (GoldCategory, GoldSubCategory, 'gold_category', GoldProduct),
+            'silver': (SilverCategory, SilverSubCategory, 'silver_category', SilverProduct),
+            'imitation': (ImitationCategory, ImitationSubCategory, 'imitation_category', ImitationProduct),
+        }
+        now = timezone.now()
+        prices = iter(['120.50', '80.00', '300.00', '45.25', '99.99', '150.00', '210.10', '60.00', '75.75'])
+        names = iter(['delta', 'Alpha', 'echo', 'Charlie', 'bravo', 'golf', 'Foxtrot', 'india', 'hotel'])
+        for n, (product_type, (category_model, subcategory_model, parent, product_model)) in enumerate(models.items()):
+            Category.objects.create(name=product_type.title())
+            category = category_model.objects.create(name=f'{product_type} rings')
+            subcategory = subcategory_model.objects.create(**{parent: category}, name='Bands')
+            for i in range(3):
+                price = next(prices)
+                product_model.objects.create(
+                    name=next(names), category=category, subcategory=subcategory,
+                    original_price=Decimal(price), selling_price=Decimal(price),
+                    created_at=now - timedelta(hours=(i * 3 + n) * 7 % 9),
+                )
+
+    def test_query_matches_the_orm_listing(self):
+        columns = columnar.get_catalog_columns()
+        self.assertIsNotNone(columns)
+        filter_sets = [{}, {'min_price': '75.75'}, {'max_price': '150'}, {'min_price': '60', 'max_price': '210.10'}]
+        for filters in filter_sets:
+            for sort_by in columnar.SORTS:
+                with self.subTest(filters=filters, sort_by=sort_by):
+                    expected = [
+                        (p.product_type, p.id) for p in ProductService.get_all_products(filters, sort_by=sort_by)
+                    ]
+                    total, keys = columns.query(
+                        types=ProductService.get_active_top_types(),
+                        min_price=columnar.parse_price(filters.get('min_price')),
+                        max_price=columnar.parse_price(filters.get('max_price')),
+                        sort_by=sort_by,
+                    )
+                    self.assertEqual(keys, expected)
+                    self.assertEqual(total, len(expected))
+
+
+def streamed(response):
+    return b''.join(response.streaming_content)
+
+
+class StreamingResponseTests(TestCase):
+    schema = Schema(Field('id'), Field('name'), Field('price', 'selling_price', money))
+
+    def setUp(self):
+        clear_caches()
+        Category.objects.create(name='Gold')
+        self.products = [make_gold_product(f'Ring {i}', price=f'{100 + i}.50') for i in range(5)]
+
+    def test_json_and_ndjson_carry_the_buffered_payload(self):
+        head = {'total': 5, 'filters': {'q': ''}}
+        factory = RequestFactory()
+        buffered = api_response(factory.get('/'), {**head, 'items': self.schema.many(self.products)})
+        expected = json.loads(buffered.content)
+
+        response = stream_items(factory.get('/'), head, 'items', iter(self.products), chunk_size=2, schema=self.schema)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(streamed(response)), expected)
+
+        response = stream_items(
+            factory.get('/?format=ndjson'), head, 'items', iter(self.products), chunk_size=2, schema=self.schema,
+        )
+        self.assertEqual(response['Content-Type'], NDJSON_CONTENT_TYPE)
+        first, *rows = [json.loads(line) for line in streamed(response).splitlines()]
+        self.assertEqual(first, head)
+        self.assertEqual(rows, expected['items'])
+
+    def test_empty_listing_is_valid_json(self):
+        response = stream_items(RequestFactory().get('/'), {}, 'items', iter(()))
+        self.assertEqual(json.loads(streamed(response)), {'items': []})
+
+    def test_shop_all_streams_the_same_products_as_ndjson(self):
+        body = json.loads(streamed(self.client.get('/shop-all/?sort=price_low', headers=AJAX)))
+        lines = streamed(self.client.get('/shop-all/?sort=price_low&format=ndjson')).splitlines()
+        head, *rows = [json.loads(line) for line in lines]
+        self.assertEqual(rows, body.pop('products'))
+        self.assertEqual(head, body)
+        self.assertEqual([row['id'] for row in rows], [p.id for p in self.products])
+
+
+@skipIf(renderers.msgpack is None, 'msgpack is not installed')
+class MessagePackNegotiationTests(TestCase):
+    MSGPACK = {'Accept': 'application/msgpack', **AJAX}
+
+    def test_accept_header_selects_msgpack(self):
+        factory = RequestFactory()
+        for accept, expected in [
+            ('application/msgpack', True),
+            ('application/x-msgpack, application/json;q=0.5', True),
+            ('application/json', False),
+            ('', False),
+        ]:
+            with self.subTest(accept=accept):
+                self.assertEqual(wants_msgpack(factory.get('/', headers={'Accept': accept})), expected)
+        with mock.patch.object(renderers, 'msgpack', None):
+            self.assertFalse(wants_msgpack(factory.get('/', headers={'Accept': 'application/msgpack'})))
+
+    def test_money_has_two_decimal_places(self):
+        self.assertEqual(money(Decimal('1234.5')), '1234.50')
+        self.assertEqual(money(Decimal('0.125')), '0.12')
+        self.assertEqual(money(7), '7.00')
+        self.assertEqual(money(None), '0.00')
+
+    def test_msgpack_and_json_bodies_decode_to_the_same_data(self):
+        schema = Schema(Field('name'), Field('price', 'selling_price', money))
+        data = {'success': True, 'raw': Decimal('9.90'), 'items': schema.many([make_gold_product(price='19.5')])}
+        factory = RequestFactory()
+        as_json = api_response(factory.get('/'), data)
+        as_msgpack = api_response(factory.get('/', headers={'Accept': 'application/msgpack'}), data)
+        self.assertEqual(as_msgpack['Content-Type'], 'application/msgpack')
+        self.assertEqual(renderers.msgpack.unpackb(as_msgpack.content), json.loads(as_json.content))
+        self.assertEqual(json.loads(as_json.content)['items'], [{'name': 'Ring', 'price': '19.50'}])
+        self.assertEqual(json.loads(as_json.content)['raw'], '9.90')
+
+    def test_cart_api_formats_have_their_own_etags(self):
+        user = make_user('msgpack@example.com')
+        CartService.add_to_cart(user, make_gold_product().pk, 2, 'gold')
+        client = cookie_client(user)
+        as_json = client.get('/api/cart/', headers=AJAX)
+        as_msgpack = client.get('/api/cart/', headers=self.MSGPACK)
+        self.assertEqual(renderers.msgpack.unpackb(as_msgpack.content), as_json.json())
+        self.assertNotEqual(as_msgpack['ETag'], as_json['ETag'])
+        self.assertIn('Accept', as_msgpack['Vary'])
+        retry = client.get('/api/cart/', headers={'If-None-Match': as_json['ETag'], **self.MSGPACK})
+        self.assertEqual(retry.status_code, 200)
+
+
+def async_urlconf():
+    """app.urls as imported with ASYNC_API_VIEWS on, mounted like the project urlconf"""
+    spec = importlib.util.find_spec('app.urls')
+    module = importlib.util.module_from_spec(spec)
+    with override_settings(ASYNC_API_VIEWS=True):
+        spec.loader.exec_module(module)
+    urlconf = ModuleType('async_urls')
+    urlconf.urlpatterns = [path('', include(module))]
+    return urlconf
+
+
+class AsyncViewParityTests(TestCase):
+    """The async API views must answer exactly like their sync counterparts"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.async_urls = async_urlconf()
+
+    def setUp(self):
+        clear_caches()
+        self.user = make_user('async@example.com', first_name='Asha', country='India')
+        self.ring = make_gold_product()
+        self.chain = make_gold_product('Chain', price='250.00')
+        CartService.add_to_cart(self.user, self.ring.pk, 2, 'gold')
+        WishlistService.set_state(self.user, 'gold', self.chain.pk, True)
+        token = jwt_encode({'user_id': self.user.id, 'email': self.user.email})
+        self.client.cookies['jwt_token'] = token
+        self.async_client.cookies['jwt_token'] = token
+
+    def call_async(self, method, path, **kwargs):
+        with override_settings(ROOT_URLCONF=self.async_urls):
+            return async_to_sync(getattr(self.async_client, method))(path, **kwargs)
+
+    def both(self, method, path, **kwargs):
+        """(sync response, async response) for the same request against the same data"""
+        # Roll back the sync view's writes so the async view sees the same rows
+        with transaction.atomic():
+            expected = getattr(self.client, method)(path, **kwargs)
+            transaction.set_rollback(True)
+        return expected, self.call_async(method, path, **kwargs)
+
+    def assertSameJson(self, method, path, status=200, **kwargs):
+        expected, actual = self.both(method, path, headers=AJAX, **kwargs)
+        self.assertEqual(expected.status_code, status)
+        self.assertEqual(actual.status_code, status)
+        self.assertEqual(actual.json(), expected.json())
+        return actual
+
+    def test_read_apis_match(self):
+        for path in ('/api/cart/', '/api/wishlist/', '/api/profile/', '/api/storefront/state/'):
+            with self.subTest(path=path):
+                actual = self.assertSameJson('get', path)
+                self.assertTrue(actual.has_header('ETag'))
+
+    def test_wishlist_status_matches(self):
+        self.assertSameJson(
+            'post', '/api/wishlist/status/', content_type='application/json',
+            data={'product_ids': [self.ring.pk, self.chain.pk, 'x', 999]},
+        )
+
+    def test_cart_batch_matches(self):
+        item_id = Cart.objects.get().pk
+        self.assertSameJson('post', '/api/cart/batch/', content_type='application/json', data={'operations': [
+            {'op': 'set', 'item_id': item_id, 'quantity': 4},
+            {'op': 'move', 'product_type': 'gold', 'product_id': self.chain.pk},
+        ]})
+        self.assertSameJson('post', '/api/cart/batch/', status=404, content_type='application/json', data={
+            'operations': [{'op': 'add', 'product_type': 'gold', 'product_id': 999}],
+        })
+
+    def test_set_wishlist_state_matches(self):
+        for state in (True, False):
+            self.assertSameJson(
+                'post', f'/api/wishlist/gold/{self.ring.pk}/', content_type='application/json',
+                data={'in_wishlist': state},
+            )
+        self.assertSameJson(
+            'post', '/api/wishlist/gold/999/', status=404, content_type='application/json', data={'in_wishlist': True},
+        )
+
+    def test_anonymous_requests_get_401(self):
+        self.client.cookies.clear()
+        self.async_client.cookies.clear()
+        for path in ('/api/cart/', '/api/wishlist/', '/api/profile/', '/api/storefront/state/'):
+            with self.subTest(path=path):
+                self.assertSameJson('get', path, status=401)
+
+    def test_matching_etag_gets_304(self):
+        etag = self.call_async('get', '/api/wishlist/', headers=AJAX)['ETag']
+        response = self.call_async('get', '/api/wishlist/', headers={'If-None-Match': etag, **AJAX})
+        self.assertEqual(response.status_code, 304)
+
+    def test_guest_add_to_cart_matches(self):
+        self.client.cookies.clear()
+        self.async_client.cookies.clear()
+        expected, actual = self.both(
+            'post', f'/cart/add/gold/g{self.ring.pk}/', content_type='application/json', data={'quantity': 3},
+            headers=AJAX,
+        )
+        self.assertEqual(actual.json(), expected.json())
+        self.assertEqual(actual.json()['cart_count'], 3)
+        self.assertIn(guest_cart.COOKIE_NAME, actual.cookies)
+        self.assertEqual(Cart.objects.count(), 1)
+
+
+class EventBrokerTests(SimpleTestCase):
+
+    def test_events_reach_subscribers_of_their_key_until_they_unsubscribe(self):
+        broker = EventBroker()
+
+        async def run():
+            queue = broker.subscribe(['user:1', 'stock:gold:5'])
+            other = broker.subscribe(['user:2'])
+            # Writers dispatch from other threads
+            thread = threading.Thread(target=broker.dispatch, args=({'type': 'stock', 'key': 'stock:gold:5'},))
+            thread.start()
+            thread.join()
+            self.assertEqual(await asyncio.wait_for(queue.get(), 1), {'type': 'stock', 'key': 'stock:gold:5'})
+            self.assertTrue(other.empty())
+            broker.unsubscribe(queue)
+            broker.dispatch({'type': 'counts', 'key': 'user:1'})
+            await asyncio.sleep(0)
+            self.assertTrue(queue.empty())
+            broker.unsubscribe(other)
+            self.assertEqual(broker._subscribers, {})
+        async_to_sync(run)()
+
+
+def read_sse(chunk):
+    """(event name, data) of one Server-Sent Events frame"""
+    fields = dict(line.split(': ', 1) for line in chunk.decode('utf-8').strip().split('\n'))
+    return fields['event'], json.loads(fields['data'])
+
+
+@override_settings(EVENT_STREAM={'TRANSPORT': 'local'})
+class EventStreamTests(TestCase):
+
+    def setUp(self):
+        for name, value in (('_broker', EventBroker()), ('_publisher', None)):
+            patcher = mock.patch.object(events, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = make_user('sse@example.com')
+        self.product = make_gold_product()
+        CartService.add_to_cart(self.user, self.product.pk, 2, 'gold')
+
+    def publish_stock(self, stock_quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            events.publish_stock('gold', self.product.pk, stock_quantity)
+
+    def test_stream_starts_with_counts_then_sends_stock_changes(self):
+        request = RequestFactory().get(f'/api/events/?products=gold:{self.product.pk},bogus:1')
+        request.COOKIES['jwt_token'] = jwt_encode({'user_id': self.user.id})
+
+        async def run():
+            response = await async_views.events_stream(request)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            stream = aiter(response.streaming_content)
+            self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+            counts = read_sse(await anext(stream))
+            await sync_to_async(self.publish_stock)(3)
+            stock = read_sse(await asyncio.wait_for(anext(stream), 5))
+            await stream.aclose()
+            return counts, stock
+
+        counts, stock = async_to_sync(run)()
+        self.assertEqual(counts, ('counts', {
+            'type': 'counts', 'key': user_key(self.user.id), 'cart_count': 2, 'wishlist_count': 0,
+        }))
+        self.assertEqual(stock, ('stock', {
+            'type': 'stock', 'key': stock_key('gold', self.product.pk),
+            'product': f'gold:{self.product.pk}', 'stock_quantity': 3,
+        }))
+
+    def test_events_are_published_on_commit(self):
+        with mock.patch.object(events.get_broker(), 'dispatch') as dispatch:
+            with self.captureOnCommitCallbacks() as callbacks:
+                events.publish_user_counts(self.user.id)
+            dispatch.assert_not_called()
+            callbacks[0]()
+        dispatch.assert_called_once_with({
+            'type': 'counts', 'key': user_key(self.user.id), 'cart_count': 2, 'wishlist_count': 0,
+        })
+
+    def test_anonymous_stream_is_refused(self):
+        response = async_to_sync(async_views.events_stream)(RequestFactory().get('/api/events/'))
+        self.assertEqual(response.status_code, 401)
+
+
+class CartBatchTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user('batch@example.com')
+        self.ring = make_gold_product()
+        self.chain = make_gold_product('Chain', price='250.00')
+        self.item = CartService.add_to_cart(self.user, self.ring.pk, 1, 'gold')[0]
+        WishlistService.set_state(self.user, 'gold', self.chain.pk, True)
+        self.client = cookie_client(self.user)
+
+    def batch(self, operations):
+        return self.client.post(
+            '/api/cart/batch/', {'operations': operations}, content_type='application/json', headers=AJAX,
+        )
+
+    def versions(self):
+        self.user.refresh_from_db()
+        return self.user.cart_version, self.user.wishlist_version
+
+    def test_each_operation_reports_its_result(self):
+        response = self.batch([
+            {'op': 'add', 'product_type': 'gold', 'product_id': self.ring.pk, 'quantity': 2},
+            {'op': 'move', 'product_type': 'gold', 'product_id': self.chain.pk},
+            {'op': 'set', 'item_id': self.item.pk, 'quantity': 5},
+            {'op': 'remove', 'item_id': self.item.pk},
+            {'op': 'remove', 'item_id': self.item.pk},
+        ])
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        chain_item = Cart.objects.get(object_id=self.chain.pk)
+        self.assertEqual(body['results'], [
+            {'op': 'add', 'item_id': self.item.pk, 'quantity': 3, 'created': False},
+            {'op': 'move', 'item_id': chain_item.pk, 'quantity': 1, 'created': True, 'removed_from_wishlist': True},
+            {'op': 'set', 'item_id': self.item.pk, 'quantity': 5, 'removed': False},
+            {'op': 'remove', 'item_id': self.item.pk, 'removed': True},
+            {'op': 'remove', 'item_id': self.item.pk, 'removed': False},
+        ])
+        self.assertEqual([item['id'] for item in body['items']], [chain_item.pk])
+        self.assertEqual((body['cart_count'], body['wishlist_count']), (1, 0))
+        self.assertFalse(Wishlist.objects.exists())
+
+    def test_a_failing_operation_rolls_back_the_whole_batch(self):
+        before = self.versions()
+        response = self.batch([
+            {'op': 'add', 'product_type': 'gold', 'product_id': self.ring.pk, 'quantity': 2},
+            {'op': 'move', 'product_type': 'gold', 'product_id': self.chain.pk},
+            {'op': 'set', 'item_id': 999, 'quantity': 2},
+        ])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['index'], 2)
+        self.assertEqual(list(Cart.objects.values_list('object_id', 'quantity')), [(self.ring.pk, 1)])
+        self.assertTrue(Wishlist.objects.exists())
+        self.assertEqual(self.versions(), before)
+
+    def test_malformed_operations_are_rejected_by_index(self):
+        for operation in (
+            {'op': 'buy'},
+            {'op': 'add', 'product_type': 'bronze', 'product_id': self.ring.pk},
+            {'op': 'add', 'product_type': 'gold', 'product_id': self.ring.pk, 'quantity': 0},
+            {'op': 'set', 'item_id': 'x'},
+        ):
+            with self.subTest(operation=operation):
+                response = self.batch([{'op': 'remove', 'item_id': self.item.pk}, operation])
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['index'], 1)
+        self.assertTrue(Cart.objects.filter(pk=self.item.pk).exists())
+
+    def test_batch_size_is_limited(self):
+        add = {'op': 'add', 'product_type': 'gold', 'product_id': self.ring.pk}
+        response = self.batch([add] * (CART_BATCH_MAX_OPERATIONS + 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(response.json()['index'])
+        self.assertEqual(self.batch([]).status_code, 400)
+        self.assertEqual(self.batch([add] * CART_BATCH_MAX_OPERATIONS).status_code, 200)
+        self.assertEqual(Cart.objects.get().quantity, 1 + CART_BATCH_MAX_OPERATIONS)
+
+
+class GuestCartTests(TestCase):
+
+    def setUp(self):
+        self.ring = make_gold_product()
+        self.chain = make_gold_product('Chain', price='250.00')
+
+    def add(self, product, quantity):
+        return self.client.post(
+            f'/cart/add/gold/g{product.pk}/', {'quantity': quantity}, content_type='application/json', headers=AJAX,
+        )
+
+    def read(self):
+        request = RequestFactory().get('/')
+        request.COOKIES.update({name: morsel.value for name, morsel in self.client.cookies.items()})
+        return guest_cart.read(request)
+
+    def test_guest_adds_go_to_the_signed_cookie(self):
+        self.add(self.ring, 2)
+        response = self.add(self.chain, 1)
+        self.assertEqual(response.json()['cart_count'], 3)
+        self.assertTrue(response.json()['guest'])
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(self.read(), {('gold', self.ring.pk): 2, ('gold', self.chain.pk): 1})
+
+    def test_tampered_and_unsigned_cookies_are_ignored(self):
+        self.add(self.ring, 2)
+        signed = self.client.cookies[guest_cart.COOKIE_NAME].value
+        for value in (signed.replace(f'g{self.ring.pk}x2', f'g{self.ring.pk}x9'), f'g{self.ring.pk}x9'):
+            with self.subTest(value=value):
+                self.client.cookies[guest_cart.COOKIE_NAME] = value
+                self.assertEqual(self.read(), {})
+                self.assertEqual(self.add(self.chain, 1).json()['cart_count'], 1)
+
+    def test_items_and_quantities_are_clamped(self):
+        items = {}
+        self.assertTrue(guest_cart.add(items, 'gold', 1, 500))
+        self.assertEqual(items[('gold', 1)], guest_cart.MAX_QUANTITY)
+        for pk in range(2, guest_cart.MAX_ITEMS + 1):
+            self.assertTrue(guest_cart.add(items, 'silver', pk, 1))
+        self.assertFalse(guest_cart.add(items, 'imitation', 1, 1))
+        # Items already in a full cart can still change
+        self.assertTrue(guest_cart.add(items, 'silver', 2, 1))
+        self.assertEqual(guest_cart.unpack(guest_cart.pack(items)), items)
+        self.assertEqual(len(guest_cart.unpack(guest_cart.pack(items) + '.i1x1')), guest_cart.MAX_ITEMS)
+        self.assertEqual(guest_cart.unpack('g1x500.g2x0.q3x1.gax1.g4'), {('gold', 1): guest_cart.MAX_QUANTITY})
+
+    def test_login_merges_into_existing_rows_and_deletes_the_cookie(self):
+        user = User.objects.create(email='guest@example.com', password=make_password('secret'))
+        CartService.add_to_cart(user, self.ring.pk, 1, 'gold')
+        self.add(self.ring, 2)
+        self.add(self.chain, 1)
+        response = self.client.post(
+            '/login/', {'email': 'guest@example.com', 'password': 'secret'}, content_type='application/json',
+        )
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(response.cookies[guest_cart.COOKIE_NAME].value, '')
+        self.assertEqual(
+            dict(Cart.objects.filter(user=user).values_list('object_id', 'quantity')),
+            {self.ring.pk: 3, self.chain.pk: 1},
+        )
+
+    def test_signup_merges_the_guest_cart(self):
+        self.add(self.ring, 2)
+        response = self.client.post('/signup/', {
+            'email': 'new@example.com', 'password': 'secret', 'confirmPassword': 'secret',
+        }, content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(response.cookies[guest_cart.COOKIE_NAME].value, '')
+        user = User.objects.get(email='new@example.com')
+        self.assertEqual(list(Cart.objects.filter(user=user).values_list('object_id', 'quantity')), [(self.ring.pk, 2)])
+
+    def test_a_failed_merge_keeps_the_cookie(self):
+        User.objects.create(email='guest@example.com', password=make_password('secret'))
+        self.add(self.ring, 2)
+        with mock.patch.object(CartService, 'merge_guest_items', side_effect=DatabaseError('locked')):
+            response = self.client.post(
+                '/login/', {'email': 'guest@example.com', 'password': 'secret'}, content_type='application/json',
+            )
+        self.assertTrue(response.json()['success'])
+        self.assertNotIn(guest_cart.COOKIE_NAME, response.cookies)
+        self.assertEqual(self.read(), {('gold', self.ring.pk): 2})
@@ -1,6 +1,13 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Cart, wishlist, profile and state APIs: async views when served over ASGI
+if getattr(settings, 'ASYNC_API_VIEWS', False):
+    from . import async_views as api_views
+else:
+    api_views = views
+
 app_name = "app"
 
 urlpatterns = [
@@ -23,29 +30,40 @@ urlpatterns = [
     path("api/reset-password-otp/", views.reset_password_with_otp, name="reset_password_with_otp"),
     path("profile/", views.profile, name="profile"),
     path("profile/edit/", views.profile_edit, name="profile_edit"),
-    path("api/profile/", views.profile_api, name="profile_api"),
+    path("api/profile/", api_views.profile_api, name="profile_api"),
     path("api/profile/update/", views.update_profile, name="update_profile"),
     path("checkout/", views.checkout, name="checkout"),
     path("check-email/", views.check_email, name="check_email"),
     path("api/check-email/", views.check_email, name="check_email_api"),
     path("wishlist/", views.wishlist_view, name="wishlist"),
-    path("api/wishlist/", views.wishlist_api, name="wishlist_api"),
-    path("api/wishlist/status/", views.wishlist_status_api, name="wishlist_status_api"),
-    path("wishlist/add/<str:product_type>/<int:pk>/", views.add_to_wishlist, name="add_to_wishlist"),
-    path("wishlist/remove/<str:product_type>/<int:pk>/", views.remove_from_wishlist, name="remove_from_wishlist"),
+    path("api/wishlist/", api_views.wishlist_api, name="wishlist_api"),
+    path("api/wishlist/status/", api_views.wishlist_status_api, name="wishlist_status_api"),
+    path("api/wishlist/<str:product_type>/<int:pk>/", api_views.set_wishlist_state, name="set_wishlist_state"),
+    path("wishlist/add/<str:product_type>/<int:pk>/", api_views.add_to_wishlist, name="add_to_wishlist"),
+    path("wishlist/remove/<str:product_type>/<int:pk>/", api_views.remove_from_wishlist, name="remove_from_wishlist"),
     path("cart/", views.cart_view, name="cart"),
-    path("api/cart/", views.cart_api, name="cart_api"),
+    path("api/cart/", api_views.cart_api, name="cart_api"),
+    path("api/cart/batch/", api_views.cart_batch_api, name="cart_batch_api"),
+    path("api/checkout/hold/", views.checkout_hold, name="checkout_hold"),
+    path("api/checkout/place/", views.place_order, name="place_order"),
+    path("api/stock/", views.stock_api, name="stock_api"),
+    path("api/storefront/state/", api_views.storefront_state_api, name="storefront_state_api"),
     # Cart URLs with unique prefixes
-    path("cart/add/gold/g<int:product_id>/", views.add_to_cart, {'product_type': 'gold'}, name="add_to_cart_gold"),
-    path("cart/add/silver/s<int:product_id>/", views.add_to_cart, {'product_type': 'silver'}, name="add_to_cart_silver"),
-    path("cart/add/imitation/i<int:product_id>/", views.add_to_cart, {'product_type': 'imitation'}, name="add_to_cart_imitation"),
+    path("cart/add/gold/g<int:product_id>/", api_views.add_to_cart, {'product_type': 'gold'}, name="add_to_cart_gold"),
+    path("cart/add/silver/s<int:product_id>/", api_views.add_to_cart, {'product_type': 'silver'}, name="add_to_cart_silver"),
+    path("cart/add/imitation/i<int:product_id>/", api_views.add_to_cart, {'product_type': 'imitation'}, name="add_to_cart_imitation"),
     # Fallback for backward compatibility
-    path("cart/add/<int:product_id>/", views.add_to_cart, name="add_to_cart"),
-    path("cart/update/<int:item_id>/", views.update_cart, name="update_cart"),
-    path("cart/remove/<int:item_id>/", views.remove_from_cart, name="remove_from_cart"),
+    path("cart/add/<int:product_id>/", api_views.add_to_cart, name="add_to_cart"),
+    path("cart/update/<int:item_id>/", api_views.update_cart, name="update_cart"),
+    path("cart/remove/<int:item_id>/", api_views.remove_from_cart, name="remove_from_cart"),
     path("about/", views.about_us, name="about"),
     path("contact/", views.contact, name="contact"),
     path("faqs/", views.faqs, name="faqs"),
     path("privacy-policies/", views.privacy_policies, name="privacy_policies"),
     path("terms-and-conditions/", views.terms_and_conditions, name="terms_and_conditions"),
+    path("health/ready/", views.readiness, name="readiness"),
 ]
+
+if getattr(settings, 'ASYNC_API_VIEWS', False):
+    # Long-lived streams need the ASGI server
+    urlpatterns.append(path("api/events/", api_views.events_stream, name="events_stream"))
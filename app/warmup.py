@@ -0,0 +1,154 @@
+"""
+Cache warm-up.
+
+Primes the cold paths a fresh worker would otherwise pay for on its first
+requests. Shared entries (nav tree, home rails, price bounds, product
+detail payloads) land in the cache backend; per-process memos (country
+multipliers, active category types) only warm the process that runs them,
+which is why workers can also warm themselves at boot (WARM_CACHES_ON_BOOT).
+At boot a worker first primes itself from the persisted snapshot
+(app/snapshot.py) when CACHE_SNAPSHOT_PATH is set; with a current snapshot it
+only runs the warmers the snapshot doesn't cover and leaves product details
+to fill on demand, so workers don't all rebuild from the database at once.
+The full warm-up is the fallback when there is no usable snapshot.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DETAIL_LIMIT = 100
+
+_ready = threading.Event()
+_last_report = {}
+
+
+def _warm_nav_tree():
+    from .context_processors import active_categories, header_categories
+    header_categories(None)
+    active_categories(None)
+
+
+def _warm_multipliers():
+    from .views import get_multiplier_table
+    get_multiplier_table()
+
+
+def _warm_active_types():
+    from .views import ProductService
+    ProductService.get_active_top_types()
+
+
+def _warm_home_rails():
+    from .views import get_home_rails
+    get_home_rails()
+
+
+def _warm_price_bounds():
+    from .views import ProductService
+    ProductService.get_price_bounds()
+
+
+def _warm_product_details(limit=DEFAULT_DETAIL_LIMIT):
+    # Detail payloads carry each product's related ids
+    from .views import ProductService
+    for product_type, model in ProductService.PRODUCT_TYPE_MAP.items():
+        pks = model.objects.order_by('-updated_at').values_list('pk', flat=True)
+        if limit is not None:
+            pks = pks[:limit]
+        for pk in pks:
+            ProductService.get_detail_payload(product_type, pk)
+
+
+WARMERS = {
+    'nav_tree': _warm_nav_tree,
+    'multipliers': _warm_multipliers,
+    'active_types': _warm_active_types,
+    'home_rails': _warm_home_rails,
+    'price_bounds': _warm_price_bounds,
+    'product_details': _warm_product_details,
+}
+
+# Primed by app/snapshot.py, plus per-product work too heavy for every worker to repeat at boot
+SNAPSHOT_COVERS = ('nav_tree', 'multipliers', 'active_types', 'price_bounds', 'product_details')
+
+
+def _timed(name, func):
+    started = time.perf_counter()
+    try:
+        func()
+        return name, time.perf_counter() - started, None
+    except Exception as e:
+        logger.error(f"Cache warm-up step {name} failed: {e}")
+        return name, time.perf_counter() - started, str(e)
+    finally:
+        close_old_connections()
+
+
+def warm_caches(names=None, workers=4, detail_limit=DEFAULT_DETAIL_LIMIT):
+    """Run the selected warmers in parallel.
+
+    Returns {name: {'seconds': float, 'error': str or None}}.
+    """
+    names = list(names or WARMERS)
+    unknown = set(names) - set(WARMERS)
+    if unknown:
+        raise ValueError(f"Unknown warm-up steps: {', '.join(sorted(unknown))}")
+    steps = {name: WARMERS[name] for name in names}
+    if 'product_details' in steps:
+        steps['product_details'] = lambda: _warm_product_details(detail_limit)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='warmup') as pool:
+        results = list(pool.map(lambda item: _timed(*item), steps.items()))
+    report = {name: {'seconds': seconds, 'error': error} for name, seconds, error in results}
+    _last_report.clear()
+    _last_report.update(report)
+    return report
+
+
+def start_boot_warmup():
+    """Warm this worker in a background thread if WARM_CACHES_ON_BOOT is set"""
+    if not getattr(settings, 'WARM_CACHES_ON_BOOT', False):
+        return
+
+    def run():
+        started = time.perf_counter()
+        snapshot = None
+        try:
+            if getattr(settings, 'CACHE_SNAPSHOT_PATH', None):
+                from .snapshot import load_or_build
+                try:
+                    snapshot = load_or_build()
+                    logger.info(f"Cache snapshot: {snapshot}")
+                except Exception as e:
+                    logger.error(f"Cache snapshot failed: {e}")
+                finally:
+                    close_old_connections()
+            if snapshot in ('loaded', 'built'):
+                report = warm_caches([name for name in WARMERS if name not in SNAPSHOT_COVERS])
+            else:
+                report = warm_caches()
+            failed = [name for name, step in report.items() if step['error']]
+            logger.info(
+                f"Boot warm-up finished in {time.perf_counter() - started:.2f}s"
+                + (f" (failed: {', '.join(failed)})" if failed else "")
+            )
+        finally:
+            # A failed step only means that path stays cold; don't block readiness on it
+            _ready.set()
+
+    threading.Thread(target=run, name='boot-warmup', daemon=True).start()
+
+
+def is_ready():
+    """Without boot warm-up a worker is ready as soon as it serves requests"""
+    return _ready.is_set() or not getattr(settings, 'WARM_CACHES_ON_BOOT', False)
+
+
+def last_report():
+    return dict(_last_report)
@@ -6,3 +6,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jiyash.settings')
 
 application = get_asgi_application()
+
+# Prime this worker's caches in the background; readiness waits for it
+from app.warmup import start_boot_warmup  # noqa: E402
+start_boot_warmup()
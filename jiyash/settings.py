@@ -23,12 +23,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app.middleware.InvalidationBusMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'app.middleware.IdempotencyKeyMiddleware',
     'app.middleware.CategoryActiveMiddleware',
 ]
 
@@ -106,6 +108,90 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Two-tier cache: per-process LRU in front of shared Redis-protocol nodes
+# (see app/cache_backends.py). Set CACHE_URLS to a comma-separated list of
+# nodes, e.g. redis://10.0.0.1:6379,redis://10.0.0.2:6379; keys are spread over
+# them with consistent hashing. `manage.py run_resp_standin` serves a local
+# node for development. Without CACHE_URLS each process caches in memory.
+CACHE_URLS = [url.strip() for url in os.environ.get('CACHE_URLS', '').split(',') if url.strip()]
+if CACHE_URLS:
+    CACHES = {
+        'default': {
+            'BACKEND': 'app.cache_backends.TwoTierCache',
+            'LOCATION': CACHE_URLS,
+            'TIMEOUT': 300,
+            'OPTIONS': {
+                'L1_MAX_ENTRIES': 5000,
+                'L1_TIMEOUT': 5,
+                'NEGATIVE_TIMEOUT': 2,
+            },
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'TIMEOUT': 300,
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        },
+    }
+
+# Cross-worker cache invalidation (see app/invalidation.py). Use the redis
+# transport, e.g. {'TRANSPORT': 'redis', 'URL': 'redis://127.0.0.1:6379'},
+# when workers run on more than one host.
+INVALIDATION_BUS = {
+    'TRANSPORT': 'sqlite',
+    'PATH': BASE_DIR / 'cache_bus.sqlite3',
+    'POLL_INTERVAL': 1.0,
+}
+
+# Warm each worker's caches at boot (app/warmup.py); /health/ready/ returns
+# 503 until it finishes.
+WARM_CACHES_ON_BOOT = not DEBUG
+# Snapshot of catalog-derived caches shared by workers at boot (app/snapshot.py)
+CACHE_SNAPSHOT_PATH = BASE_DIR / 'cache_snapshot.bin'
+# Memory-mapped columnar catalog used by shop listings (app/columnar.py)
+CATALOG_COLUMNS_PATH = BASE_DIR / 'catalog_columns'
+# Live cart/wishlist counts and stock changes for /api/events/ (app/events.py).
+# Only the ASGI profile serves the stream, so it configures the transport;
+# here writes don't count or publish anything.
+EVENT_STREAM = None
+# How long checkout holds cart stock before `manage.py release_expired_holds`
+# gives it back (app/inventory.py)
+STOCK_HOLD_SECONDS = 10 * 60
+# Outbound email is queued in the database and sent by
+# `manage.py send_queued_email --loop` (app/mail.py). In development, point it at
+# a local SMTP sink such as `python -m aiosmtpd -n -l localhost:1025` or MailHog.
+EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 1025))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '') == '1'
+EMAIL_TIMEOUT = 10
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'JiyashCreation <no-reply@jiyashcreation.com>')
+# Used for links in emails
+SITE_URL = os.environ.get('SITE_URL', 'http://127.0.0.1:8000')
+# Deferred work (mail, hold sweeps, price alerts, catalog index rebuilds) is
+# queued in the database and run by `manage.py run_worker` (app/tasks.py)
+TASK_QUEUE = {
+    'LEASE_SECONDS': 10 * 60,
+    'KEEP_FINISHED_DAYS': 7,
+}
+# POSTs to these views that send an Idempotency-Key header are run once and
+# their response replayed to retries for TTL seconds (app/idempotency.py)
+IDEMPOTENCY = {
+    'TTL': 24 * 60 * 60,
+    'VIEWS': [
+        'app:add_to_cart', 'app:add_to_cart_gold', 'app:add_to_cart_silver', 'app:add_to_cart_imitation',
+        'app:update_cart', 'app:cart_batch_api', 'app:signup', 'app:forgot_password',
+        'app:checkout_hold', 'app:place_order',
+    ],
+}
+# Serve the cart/wishlist/profile/state APIs with app/async_views.py; turned
+# on by the ASGI profile (jiyash/settings_asgi.py), which also serves /api/events/
+ASYNC_API_VIEWS = False
+
 ADMIN_SITE_HEADER = "JiyashCreation"
 ADMIN_SITE_TITLE = "Jiyash Admin"
 ADMIN_INDEX_TITLE = "Admin Panel"
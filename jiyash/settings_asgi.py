@@ -0,0 +1,30 @@
+"""
+ASGI deployment profile: one process serving many concurrent small API calls.
+
+    DJANGO_SETTINGS_MODULE=jiyash.settings_asgi \
+        gunicorn jiyash.asgi:application -k uvicorn.workers.UvicornWorker -w 2
+
+The cart, wishlist, profile and state APIs are routed to the async views in
+app/async_views.py, and /api/events/ streams live counts and stock changes.
+"""
+from .settings import *  # noqa: F401,F403
+
+ASYNC_API_VIEWS = True
+
+# Concurrent requests share one SQLite file: wait for the write lock instead of
+# failing with "database is locked", take it at BEGIN so read-then-write
+# transactions can't deadlock, and let readers run alongside the writer (WAL).
+DATABASES['default']['OPTIONS'] = {  # noqa: F405
+    'timeout': 20,
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+}
+
+# Live events for /api/events/ (app/events.py). Set EVENT_STREAM_URL to a
+# Redis-protocol node (Redis or `manage.py run_resp_standin`) when more than one
+# process serves streams; otherwise events only reach this process's streams.
+EVENT_STREAM_URL = os.environ.get('EVENT_STREAM_URL', '')  # noqa: F405
+EVENT_STREAM = (
+    {'TRANSPORT': 'resp', 'URL': EVENT_STREAM_URL, 'CHANNEL': 'storefront:events'}
+    if EVENT_STREAM_URL else {'TRANSPORT': 'local'}
+)